@@ -1,39 +1,71 @@
 # SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
 
-import spacy
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
-import requests
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 import io
-from pydub import AudioSegment
+import re
 import warnings
-from nltk.corpus import wordnet as wn  # Import WordNet for synonyms
+from modelRegistry import get_spacy, get_wordnet, lazy_import, record_timing
+from instrumentation import NOOP, traced
+from spotifyCache import AudioFeatureCache
+from queryExecutor import QueryExecutor
+from musicBackend import InstrumentedBackend, SpotipyBackend
+from queryPlanner import ArtistQueryPlanner
 
 # Suppress specific warnings from Spotipy
 warnings.filterwarnings("ignore", category=UserWarning)
 
+# analyze_text needs POS tags, entities and noun chunks (parser), but never lemmas
+STORY_DISABLED_PIPES = ['lemmatizer']
+
 class ImmersiveStorytellingEngine:
-    def __init__(self, spotify_client_id, spotify_client_secret, chosen_artists):
-        self.nlp = spacy.load("en_core_web_sm")
-        client_credentials_manager = SpotifyClientCredentials(
-            client_id=spotify_client_id, 
-            client_secret=spotify_client_secret
-        )
-        self.sp = spotipy.Spotify(client_credentials_manager=client_credentials_manager)
+    def __init__(self, spotify_client_id, spotify_client_secret, chosen_artists, feature_cache=None, executor=None,
+                 artist_scoped=False, sp=None, instrumentation=None, search_cache=None):
+        self.executor = executor if executor is not None else QueryExecutor()
+        # Spans, counters and histograms; the default records nothing
+        self.instrumentation = instrumentation if instrumentation is not None else NOOP
+        # sp replaces the client built from the credentials (any MusicBackend, e.g. FakeMusicBackend)
+        backend = sp if sp is not None else SpotipyBackend.from_credentials(spotify_client_id, spotify_client_secret)
+        if self.instrumentation.enabled:
+            backend = InstrumentedBackend(backend, self.instrumentation)
+        # Every API call is throttled through the executor's shared rate limiter
+        self.sp = self.executor.wrap(backend)
         self.chosen_artists = chosen_artists  # List of chosen artists
+        self.feature_cache = feature_cache if feature_cache is not None else AudioFeatureCache()
+        # artist_scoped=True searches per chosen artist (artist:"..."). It is opt-in here: a story issues many
+        # queries without a call budget, and a miss costs up to max_fanout + 1 searches instead of one
+        self.artist_scoped = artist_scoped
+        # search_cache (a SearchCache) memoizes searches, e.g. one shared with other recommenders
+        self.query_planner = ArtistQueryPlanner(chosen_artists, search_cache=search_cache)
+        self.instrumentation.register_gauge("feature_cache", self.feature_cache.stats)
+        self.instrumentation.register_gauge("query_planner", self.query_planner.stats)
+
+    @property
+    def nlp(self):
+        """spaCy pipeline, loaded on first use and shared with the other recommenders."""
+        return get_spacy()
 
     def get_synonyms(self, word):
         """Retrieve synonyms for a given word using WordNet."""
         synonyms = set()
-        for syn in wn.synsets(word):
+        for syn in get_wordnet().synsets(word):
             for lemma in syn.lemmas():
                 synonyms.add(lemma.name())
         return synonyms
 
+    @traced("analyze_text")
     def analyze_text(self, text):
         """Analyze the provided text to extract mood, entities, and topics."""
-        doc = self.nlp(text)
-        
+        return self.analysis_from_doc(self.nlp(text, disable=STORY_DISABLED_PIPES))
+
+    def analyze_texts(self, texts, batch_size=32):
+        """Analyze many texts in batches with nlp.pipe, yielding analyses in input order."""
+        for doc in self.nlp.pipe(texts, batch_size=batch_size, disable=STORY_DISABLED_PIPES):
+            yield self.analysis_from_doc(doc)
+
+    def analysis_from_doc(self, doc):
+        """Extract mood words, entities and topics from a parsed doc."""
         mood_words = [token.text for token in doc if token.pos_ in ["ADJ", "NOUN"]]
         entities = [(ent.text, ent.label_) for ent in doc.ents]
         topics = list(set(chunk.text for chunk in doc.noun_chunks))
@@ -44,6 +76,7 @@ class ImmersiveStorytellingEngine:
             "topics": topics
         }
 
+    @traced("create_music_queries")
     def create_music_queries(self, analysis):
         """Create multiple music search queries based on topics and synonyms."""
         queries = []
@@ -75,26 +108,29 @@ class ImmersiveStorytellingEngine:
         
         return queries
 
+    def is_playable_chosen_track(self, track):
+        """Check that a track has a preview and is by one of the chosen artists."""
+        return (track['preview_url'] is not None and
+                any(artist['name'] in self.chosen_artists for artist in track['artists']))  # Check if the artist is in chosen artists
+
+    def find_track(self, query):
+        """Search for the first playable track by a chosen artist; returns the track dict or None."""
+        # Filter tracks based on the chosen artists; one match is enough, so scoped searches stop early
+        filtered_tracks = self.query_planner.find_tracks(
+            self.sp, query, needed=1, accept=self.is_playable_chosen_track, artist_scoped=self.artist_scoped
+        )
+        return filtered_tracks[0] if filtered_tracks else None
+
     def find_music(self, query):
         """Search for music tracks using the Spotify API."""
-        results = self.sp.search(q=query, type='track', limit=50)  # Limit set to 50
-
-        # Filter tracks based on the chosen artists
-        filtered_tracks = [
-            track for track in results['tracks']['items']
-            if track['preview_url'] is not None and 
-            any(artist['name'] in self.chosen_artists for artist in track['artists'])  # Check if the artist is in chosen artists
-        ]
-
-        # Return the preview URL of the first matching track, if any
-        if filtered_tracks:
-            return filtered_tracks[0]['id']  # Return the track ID for further analysis
-            
-        return None
+        track = self.find_track(query)
+        # Return the track ID for further analysis
+        return track['id'] if track else None
 
-    def analyze_song_mood(self, track_id):
-        """Get audio features for a song and analyze mood."""
-        features = self.sp.audio_features(track_id)[0]
+    def analyze_song_mood(self, track):
+        """Get audio features for a song (track dict or ID) and analyze mood."""
+        # A track dict lets a local feature source (e.g. PreviewFeatureCache) use its preview_url
+        features = self.feature_cache.get_feature(self.sp, track)
         
         # You can adjust these thresholds based on your mood criteria
         if features:
@@ -106,57 +142,110 @@ class ImmersiveStorytellingEngine:
     def get_music_from_url(self, music_url):
         """Fetch music from the provided URL and convert it to an AudioSegment."""
         if music_url:
-            response = requests.get(music_url)
+            # The pooled session reuses connections across calls; pydub is only imported here
+            previewFeatures = lazy_import("previewFeatures")
+            response = previewFeatures.preview_session().get(music_url, timeout=previewFeatures.DEFAULT_DOWNLOAD_TIMEOUT)
             if response.status_code == 200:
                 music_data = io.BytesIO(response.content)
-                music = AudioSegment.from_file(music_data, format="mp3")
+                music = lazy_import("pydub").AudioSegment.from_file(music_data, format="mp3")
                 return music
             else:
                 print(f"Error fetching music: {response.status_code}")
         return None
 
+    def evaluate_query(self, query):
+        """Search for a query and look up the mood of the first matching track; returns (track, valence, energy)."""
+        track = self.find_track(query)
+        if not track:
+            return None, None, None
+        valence, energy = self.analyze_song_mood(track)
+        return track, valence, energy
+
+    @traced("process_story")
     def process_story(self, text):
         """Process the provided story text to analyze it and find matching music."""
-        analysis = self.analyze_text(text)
+        return self.music_for_analysis(self.analyze_text(text))
+
+    def music_for_analysis(self, analysis):
+        """Try queries for an analysis until a suitable track is found.
+
+        Returns a dict with the query, track ID, title, artist, Spotify and preview URLs, valence and energy, or None.
+        """
         music_queries = self.create_music_queries(analysis)
+        self.instrumentation.observe("queries.per_story", len(music_queries))
 
         print(f"Searching for music...")  # Debugging output
 
-        for query in music_queries:
-            print(f"Trying query: {query}")
-            track_id = self.find_music(query)
+        # Queries run concurrently a few at a time; results are consumed in query order
+        results = self.executor.imap(self.evaluate_query, music_queries)
+        try:
+            for query, (track, valence, energy) in zip(music_queries, results):
+                print(f"Trying query: {query}")
 
-            if track_id:
-                valence, energy = self.analyze_song_mood(track_id)
+                if track:
+                    # Simple mood matching logic
+                    if valence is not None and valence < 0.5:  # Example threshold for sadness
+                        music_url = f"https://open.spotify.com/track/{track['id']}"
+                        print(f"Found suitable music: {music_url}")
+                        return {
+                            "query": query,
+                            "track_id": track['id'],
+                            "title": track['name'],
+                            "artist": track['artists'][0]['name'],
+                            "spotify_url": music_url,
+                            "preview_url": track['preview_url'],
+                            "valence": valence,
+                            "energy": energy
+                        }
+                else:
+                    print(f"No music found for query: {query}")
+        finally:
+            # Cancels queries that have not started yet instead of leaving them to GC
+            results.close()
 
-                # Simple mood matching logic
-                if valence < 0.5:  # Example threshold for sadness
-                    music_url = f"https://open.spotify.com/track/{track_id}"
-                    print(f"Found suitable music: {music_url}")
-                    break  # Exit the loop if we find a matching song
-            else:
-                print(f"No music found for query: {query}")
+        print("No suitable music found after all queries.")
+        return None
 
-        if not track_id:
-            print("No suitable music found after all queries.")
+    def soundtrack_cues(self, text):
+        """Pick music for each paragraph of a story and return it as SoundtrackCues.
 
+        Paragraphs are separated by blank lines; consecutive paragraphs that get the same track share a cue.
+        """
+        paragraphs = [paragraph.strip() for paragraph in re.split(r'\n\s*\n', text) if paragraph.strip()]
+        tracks = [self.music_for_analysis(analysis) for analysis in self.analyze_texts(paragraphs)]
+        return lazy_import("soundtrackPlanner").cues_from_plan(
+            range(1, len(paragraphs) + 1), [len(paragraph.split()) for paragraph in paragraphs], tracks
+        )
 
+    @traced("render_story")
+    def render_story(self, text, output_path, renderer=None):
+        """Write a crossfaded soundtrack for a story, timed by reading speed, to output_path.
+
+        renderer is a soundtrackRenderer.SoundtrackRenderer; the format follows output_path's
+        extension (.wav needs nothing else, other formats need ffmpeg). Returns a RenderResult.
+        """
+        renderer = renderer if renderer is not None else lazy_import("soundtrackRenderer").SoundtrackRenderer()
+        return renderer.render(self.soundtrack_cues(text), output_path)
+
+
+# Example story, also used by the benchmarks
+EXAMPLE_STORY = """
+In the year 2145, humanity had colonized Mars, but the discovery of an ancient alien artifact buried beneath the surface unleashed a torrent of chaos. As scientists scrambled to unlock its secrets, a brilliant yet reclusive engineer named Mira was drawn into a conspiracy that threatened not only the Martian colony but the very fabric of reality itself. The artifact pulsed with an otherworldly energy, distorting time and space, and whispering promises of untold power to those who dared to wield it. With her past haunting her and a mysterious figure pursuing her, Mira found herself racing against time to prevent the artifact from falling into the wrong hands. As she navigated treacherous alliances and moral dilemmas, she grappled with the question of what it truly meant to be human in a world where technology blurred the lines between creation and destruction.
+"""
+
+record_timing(f"import:{__name__}", time.perf_counter() - _IMPORT_STARTED)
 
 
 if __name__ == "__main__":
     # Replace these with your actual Spotify API credentials
-  spotify_client_id = ""
-  spotify_client_secret = ""
-    
-  chosen_artists = ["Drake", "The Weeknd","Adele", "Coldplay", "Hans Zimmer", "Nicholas Britell", "Gustavo Santaolalla"]  # Add your desired artist names here
+    spotify_client_id = ""
+    spotify_client_secret = ""
     
-  engine = ImmersiveStorytellingEngine(spotify_client_id, spotify_client_secret, chosen_artists)
+    chosen_artists = ["Drake", "The Weeknd","Adele", "Coldplay", "Hans Zimmer", "Nicholas Britell", "Gustavo Santaolalla"]  # Add your desired artist names here
     
-  story = """
-  In the year 2145, humanity had colonized Mars, but the discovery of an ancient alien artifact buried beneath the surface unleashed a torrent of chaos. As scientists scrambled to unlock its secrets, a brilliant yet reclusive engineer named Mira was drawn into a conspiracy that threatened not only the Martian colony but the very fabric of reality itself. The artifact pulsed with an otherworldly energy, distorting time and space, and whispering promises of untold power to those who dared to wield it. With her past haunting her and a mysterious figure pursuing her, Mira found herself racing against time to prevent the artifact from falling into the wrong hands. As she navigated treacherous alliances and moral dilemmas, she grappled with the question of what it truly meant to be human in a world where technology blurred the lines between creation and destruction.
-    """
+    engine = ImmersiveStorytellingEngine(spotify_client_id, spotify_client_secret, chosen_artists)
     
-  engine.process_story(story)
+    engine.process_story(EXAMPLE_STORY)
 
 # if __name__ == "__main__":
 #     # Replace these with your actual API credentials
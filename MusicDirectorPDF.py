@@ -1,69 +1,230 @@
 # SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
 
-import spacy
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 import warnings
-from nltk.corpus import wordnet as wn
-import PyPDF2
+import os
+import queue
 import re
+import sys
+import threading
 from collections import namedtuple
-import nltk
-nltk.download('wordnet')
+from itertools import islice
+from modelRegistry import get_spacy, get_wordnet, lazy_import, record_timing
+from instrumentation import NOOP, traced
+from spotifyCache import AudioFeatureCache, SearchCache
+from queryExecutor import QueryExecutor
+from musicBackend import InstrumentedBackend, SpotipyBackend
+from queryPlanner import ArtistQueryPlanner
+from bookCheckpoint import CheckpointJournal
+from bookOutput import open_writer, output_format, paragraph_record
+from paragraphStore import ParagraphStore, config_fingerprint
+from pdfExtraction import PdfTextExtractor
+from queryRanker import CandidateQuery, QueryRanker
 
 # Suppress specific warnings from Spotipy
 warnings.filterwarnings("ignore", category=UserWarning)
 
 # Create a named tuple for song recommendations
-SongRecommendation = namedtuple('SongRecommendation', ['title', 'artist', 'spotify_url', 'mood_score'])
+SongRecommendation = namedtuple('SongRecommendation', ['title', 'artist', 'spotify_url', 'mood_score', 'track_id'])
+# One analyzed paragraph: its position in the book, the queries that were run and what they found
+ParagraphResult = namedtuple('ParagraphResult', ['index', 'page', 'offset', 'text', 'queries', 'recommendations'])
+
+# analyze_text needs POS tags, entities and noun chunks (parser), but never lemmas
+BOOK_DISABLED_PIPES = ['lemmatizer']
+
+# Characters that end a paragraph; anything else at a page break means the text runs on
+PARAGRAPH_ENDINGS = ('.', '!', '?', ':', '"', "'", '\u201d', '\u2019', ')')
+
+# Shorter paragraphs (headings, captions, page furniture) are skipped
+MIN_PARAGRAPH_WORDS = 20
+
+# mood_score is the weighted sum of these audio features
+MOOD_SCORE_WEIGHTS = {'valence': 0.5, 'energy': 0.5}
+
+# Extra queries (and mood words) for paragraphs with a clearly positive or negative sentiment
+POSITIVE_QUERIES = ['uplifting', 'joyful', 'happy']
+NEGATIVE_QUERIES = ['melancholic', 'sad', 'dark']
+
+
+def continues_paragraph(previous, following):
+    """Guess whether a paragraph cut off by a page break continues on the next page."""
+    if previous.endswith('-'):
+        return True
+    return not previous.endswith(PARAGRAPH_ENDINGS) or following[:1].islower()
+
+
+def join_paragraph(previous, following):
+    """Join the two halves of a paragraph split by a page break."""
+    if previous.endswith('-') and following[:1].islower():
+        return previous[:-1] + following
+    return f"{previous} {following}"
+
+
+def iter_in_background(iterable, max_buffered=64):
+    """Run an iterator on a background thread, buffering at most max_buffered items ahead.
+
+    The iterator is closed on the producer thread when it is exhausted, fails or the consumer stops early.
+    """
+    buffer = queue.Queue(maxsize=max_buffered)
+    done = object()
+    stop = threading.Event()
+
+    def put(entry):
+        # Give up once the consumer has stopped, instead of blocking on a full buffer forever
+        while not stop.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except Exception as e:
+            put((done, e))
+        finally:
+            # Run the source generator's cleanup (e.g. cancelling in-flight extraction) now, not at GC
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
 
 class BookMusicRecommender:
-    def __init__(self, spotify_client_id, spotify_client_secret, chosen_artists):
-        """Initialize the recommender with Spotify credentials and NLP models."""
-        self.nlp = spacy.load("en_core_web_sm")
-        client_credentials_manager = SpotifyClientCredentials(
-            client_id=spotify_client_id, 
-            client_secret=spotify_client_secret
-        )
-        self.sp = spotipy.Spotify(client_credentials_manager=client_credentials_manager)
+    def __init__(self, spotify_client_id, spotify_client_secret, chosen_artists, feature_cache=None, search_cache=None, executor=None,
+                 batch_size=32, n_process=1, artist_scoped=False, sp=None, instrumentation=None, paragraph_store=None,
+                 pdf_extractor=None):
+        """Initialize the recommender with Spotify credentials and NLP models.
+
+        Pass sp (any MusicBackend, e.g. FakeMusicBackend) to use it instead of Spotify via the credentials.
+        paragraph_store keeps each paragraph's results so unchanged paragraphs of a revised book are reused.
+        pdf_extractor (a PdfTextExtractor) extracts pages in parallel and caches their text by content hash.
+        """
+        self.executor = executor if executor is not None else QueryExecutor()
+        # Spans, counters and histograms; the default records nothing
+        self.instrumentation = instrumentation if instrumentation is not None else NOOP
+        backend = sp if sp is not None else SpotipyBackend.from_credentials(spotify_client_id, spotify_client_secret)
+        if self.instrumentation.enabled:
+            backend = InstrumentedBackend(backend, self.instrumentation)
+        # Every API call is throttled through the executor's shared rate limiter
+        self.sp = self.executor.wrap(backend)
         self.chosen_artists = chosen_artists
+        self.feature_cache = feature_cache if feature_cache is not None else AudioFeatureCache()
+        self.search_cache = search_cache if search_cache is not None else SearchCache()
+        self.paragraph_store = paragraph_store if paragraph_store is not None else ParagraphStore()
+        self.pdf_extractor = pdf_extractor if pdf_extractor is not None else PdfTextExtractor()
+        # artist_scoped=True searches per chosen artist (artist:"..."). It is opt-in here: a book issues many
+        # queries without a call budget, and a miss costs up to max_fanout + 1 searches instead of one
+        self.artist_scoped = artist_scoped
+        self.query_planner = ArtistQueryPlanner(chosen_artists, search_cache=self.search_cache)
+        self.instrumentation.register_gauge("feature_cache", self.feature_cache.stats)
+        self.instrumentation.register_gauge("search_cache", self.search_cache.stats)
+        self.instrumentation.register_gauge("query_planner", self.query_planner.stats)
+        self.instrumentation.register_gauge("paragraph_store", self.paragraph_store.stats)
+        self.instrumentation.register_gauge("pdf_extraction", self.pdf_extractor.stats)
+        # Paragraphs are parsed in batches through nlp.pipe; n_process > 1 uses multiprocessing
+        self.batch_size = batch_size
+        self.n_process = n_process
+
+    @property
+    def nlp(self):
+        """spaCy pipeline, loaded on first use and shared with the other recommenders."""
+        return get_spacy()
         
     def extract_paragraphs_from_pdf(self, pdf_path):
         """Extract paragraphs from a PDF file."""
-        paragraphs = []
+        return [paragraph for _, paragraph in self.iter_paragraphs_from_pdf(pdf_path)]
+
+    def iter_paragraphs_from_pdf(self, pdf_path):
+        """Yield (page_number, paragraph) pairs one page at a time.
         
-        try:
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                
-                for page in pdf_reader.pages:
-                    text = page.extract_text()
-                    
-                    # Split text into paragraphs (adjust the regex pattern as needed)
-                    page_paragraphs = re.split(r'\n\s*\n', text)
-                    
-                    # Filter out empty paragraphs and clean up whitespace
-                    page_paragraphs = [p.strip() for p in page_paragraphs if p.strip()]
-                    paragraphs.extend(page_paragraphs)
-                    
-        except Exception as e:
-            print(f"Error reading PDF: {str(e)}")
-            return []
+        Pages come from the pdf_extractor in order. The last paragraph of a page is held back
+        until the next page shows whether it continues across the page break. A page that
+        cannot be extracted is reported and skipped; the rest of the book is still read. No
+        paragraph is joined across a failed or empty page. Errors that affect the whole book
+        (an unreadable file, a broken extraction pool) are raised.
+        """
+        carry = None
+        
+        for page_number, text, _ in self.pdf_extractor.iter_pages(pdf_path):
+            # Split text into paragraphs (adjust the regex pattern as needed)
+            page_paragraphs = re.split(r'\n\s*\n', text)
+            
+            # Filter out empty paragraphs and clean up whitespace
+            page_paragraphs = [(page_number, p.strip()) for p in page_paragraphs if p.strip()]
+            if not page_paragraphs:
+                if carry is not None:
+                    yield carry
+                    carry = None
+                continue
+            
+            if carry is not None:
+                if continues_paragraph(carry[1], page_paragraphs[0][1]):
+                    page_paragraphs[0] = (carry[0], join_paragraph(carry[1], page_paragraphs[0][1]))
+                else:
+                    yield carry
             
-        return paragraphs
+            yield from page_paragraphs[:-1]
+            carry = page_paragraphs[-1]
+        
+        if carry is not None:
+            yield carry
 
     def get_synonyms(self, word):
         """Get synonyms for a word using WordNet."""
         synonyms = set()
-        for syn in wn.synsets(word):
+        for syn in get_wordnet().synsets(word):
             for lemma in syn.lemmas():
                 synonyms.add(lemma.name())
         return synonyms
 
+    @traced("analyze_text")
     def analyze_text(self, text):
         """Analyze text to extract mood, entities, and topics."""
-        doc = self.nlp(text)
+        return self.analysis_from_doc(self.nlp(text, disable=BOOK_DISABLED_PIPES))
+
+    def analyze_texts(self, texts, as_tuples=False):
+        """Analyze many texts in batches with nlp.pipe, yielding analyses in input order.
         
+        With as_tuples=True, texts are (text, context) pairs and (analysis, context) pairs are yielded.
+        """
+        docs = self.nlp.pipe(
+            texts,
+            as_tuples=as_tuples,
+            batch_size=self.batch_size,
+            n_process=self.n_process,
+            disable=BOOK_DISABLED_PIPES
+        )
+        if as_tuples:
+            for doc, context in docs:
+                self.instrumentation.count("nlp.docs")
+                yield self.analysis_from_doc(doc), context
+        else:
+            for doc in docs:
+                self.instrumentation.count("nlp.docs")
+                yield self.analysis_from_doc(doc)
+
+    def analysis_from_doc(self, doc):
+        """Extract mood words, entities, topics and sentiment from a parsed doc."""
         # Extract relevant linguistic features
         mood_words = [token.text for token in doc if token.pos_ in ["ADJ", "VERB", "ADV"]]
         entities = [(ent.text, ent.label_) for ent in doc.ents]
@@ -73,12 +234,14 @@ class BookMusicRecommender:
         sentiment = sum(token.sentiment for token in doc if hasattr(token, 'sentiment') and token.sentiment != 0)
         
         return {
+            "text": doc.text,
             "mood_words": mood_words,
             "entities": entities,
             "topics": topics,
             "sentiment": sentiment
         }
 
+    @traced("create_music_queries")
     def create_music_queries(self, analysis):
         """Create search queries based on text analysis."""
         queries = []
@@ -100,34 +263,56 @@ class BookMusicRecommender:
                 queries.append(f"{entity}")
         
         # Add sentiment-based queries
-        sentiment = analysis['sentiment']
-        if sentiment > 0:
-            queries.extend(['uplifting', 'joyful', 'happy'])
-        elif sentiment < 0:
-            queries.extend(['melancholic', 'sad', 'dark'])
+        queries.extend(self.sentiment_queries(analysis))
         
         return list(set(queries))  # Remove duplicates
 
+    def sentiment_queries(self, analysis):
+        """POSITIVE_QUERIES or NEGATIVE_QUERIES for a clearly positive or negative analysis, else none."""
+        sentiment = analysis['sentiment']
+        if sentiment > 0:
+            return POSITIVE_QUERIES
+        if sentiment < 0:
+            return NEGATIVE_QUERIES
+        return []
+
+    def is_playable_chosen_track(self, track):
+        """Check that a track has a preview and is by one of the chosen artists."""
+        return track['preview_url'] and any(artist['name'] in self.chosen_artists for artist in track['artists'])
+
+    def find_candidates(self, query, limit=3):
+        """Search playable chosen-artist tracks for a query; returns (tracks, {track ID: audio features})."""
+        try:
+            # The same mood words recur across thousands of paragraphs, so the planner's searches
+            # go through the memoizing search cache
+            artist_tracks = self.query_planner.find_tracks(
+                self.sp, query, needed=limit, accept=self.is_playable_chosen_track, artist_scoped=self.artist_scoped
+            )
+            # Get audio features for mood analysis in one batched, cached lookup
+            return artist_tracks, self.feature_cache.get_features(self.sp, artist_tracks)
+        except Exception as e:
+            print(f"Error finding matching songs: {str(e)}")
+            return [], {}
+
     def find_matching_songs(self, query, limit=3):
         """Find matching songs for a query."""
         try:
-            results = self.sp.search(q=query, type='track', limit=50)
+            artist_tracks, all_features = self.find_candidates(query, limit)
             
             matching_tracks = []
-            for track in results['tracks']['items']:
-                if track['preview_url'] and any(artist['name'] in self.chosen_artists for artist in track['artists']):
-                    # Get audio features for mood analysis
-                    features = self.sp.audio_features(track['id'])[0]
-                    if features:
-                        mood_score = (features['valence'] + features['energy']) / 2
-                        
-                        recommendation = SongRecommendation(
-                            title=track['name'],
-                            artist=track['artists'][0]['name'],
-                            spotify_url=f"https://open.spotify.com/track/{track['id']}",
-                            mood_score=mood_score
-                        )
-                        matching_tracks.append(recommendation)
+            for track in artist_tracks:
+                features = all_features.get(track['id'])
+                if features:
+                    mood_score = sum(features[name] * weight for name, weight in MOOD_SCORE_WEIGHTS.items())
+                    
+                    recommendation = SongRecommendation(
+                        title=track['name'],
+                        artist=track['artists'][0]['name'],
+                        spotify_url=f"https://open.spotify.com/track/{track['id']}",
+                        mood_score=mood_score,
+                        track_id=track['id']
+                    )
+                    matching_tracks.append(recommendation)
             
             # Sort by mood score and return top matches
             matching_tracks.sort(key=lambda x: x.mood_score, reverse=True)
@@ -136,68 +321,308 @@ class BookMusicRecommender:
             print(f"Error finding matching songs: {str(e)}")
             return []
 
-    def process_book(self, pdf_path, output_file="recommendations.txt"):
-        """Process entire book and generate recommendations."""
-        paragraphs = self.extract_paragraphs_from_pdf(pdf_path)
+    def recommend_for_analysis(self, analysis, limit=3):
+        """Return up to limit unique songs for one paragraph's analysis."""
+        return self.recommend_with_queries(analysis, limit)[0]
+
+    def recommend_with_queries(self, analysis, limit=3):
+        """Return (recommendations, queries whose results were used) for one paragraph's analysis."""
+        queries = self.create_music_queries(analysis)
+        self.instrumentation.observe("queries.per_paragraph", len(queries))
+        
+        # Track unique songs to avoid duplicates
+        seen_songs = set()
+        recommendations = []
+        issued = []
+        
+        # Try different queries until we find enough unique songs; a few run ahead
+        # concurrently and the rest are cancelled once we break out
+        results = self.executor.imap(self.find_matching_songs, queries)
+        try:
+            for query, matches in zip(queries, results):
+                issued.append(query)
+                
+                for match in matches:
+                    if match.title not in seen_songs and len(recommendations) < limit:
+                        seen_songs.add(match.title)
+                        recommendations.append(match)
+                # Stop before pulling the next result, so no further query is waited on
+                if len(recommendations) >= limit:
+                    break
+        finally:
+            # Cancels queries that have not started yet instead of leaving them to GC
+            results.close()
+        self.instrumentation.observe("recommendations.per_paragraph", len(recommendations))
+        return recommendations, issued
+
+    @traced("process_book")
+    def process_book(self, pdf_path, output_file="recommendations.txt", resume=False,
+                     checkpoint_file=None, checkpoint_every=10, output_format=None, include_text=False):
+        """Process entire book and generate recommendations.
         
-        if not paragraphs:
+        The output format follows output_file's extension unless output_format is given: "text"
+        (the readable report, default), "jsonl" or "parquet" (one record per paragraph; see bookOutput).
+        Finished paragraphs are journaled to checkpoint_file (default: output_file + ".checkpoint").
+        With resume=True, paragraphs already in the journal are skipped and the output is appended to.
+        Returns the number of paragraphs read from the PDF.
+        """
+        search_stats_before = self.search_cache.stats()
+        store_stats_before = self.paragraph_store.stats()
+        paragraph_count = [0]
+        writer, journal, completed = self.open_report(output_file, resume, checkpoint_file, checkpoint_every,
+                                                      output_format, include_text)
+        book = os.path.basename(pdf_path)
+        try:
+            paragraphs = self.iter_book_paragraphs(pdf_path, completed, paragraph_count)
+            for result in self.recommend_paragraphs(paragraphs):
+                self.write_result(writer, journal, result, book)
+        finally:
+            journal.close(output_file=writer if writer.resumable else None)
+            writer.close()
+        
+        if not paragraph_count[0]:
             print("No paragraphs found in the PDF file.")
-            return
+            return 0
+        
+        reused = self.paragraph_store.stats()['hits'] - store_stats_before['hits']
+        if reused:
+            print(f"\nReused stored results for {reused} unchanged paragraphs")
+        self.report_search_cache(search_stats_before)
+        self.instrumentation.flush()
+        return paragraph_count[0]
+
+    def open_report(self, output_file, resume=False, checkpoint_file=None, checkpoint_every=10,
+                    format=None, include_text=False):
+        """Open a book's output writer and checkpoint journal; returns (writer, journal, completed entries)."""
+        if resume and output_format(output_file, format) == "parquet":
+            raise ValueError(f"Parquet output cannot be resumed: {output_file} (use JSON Lines for resumable runs)")
+        journal = CheckpointJournal(checkpoint_file or f"{output_file}.checkpoint", flush_every=checkpoint_every)
+        completed, output_offset = journal.load() if resume else ({}, 0)
+        if completed:
+            print(f"Resuming: {len(completed)} paragraphs already done")
+        
+        writer = open_writer(output_file, format, output_offset if resume else None, include_text)
+        journal.open(resume=resume)
+        return writer, journal, completed
+
+    def iter_book_paragraphs(self, pdf_path, completed=(), paragraph_count=None):
+        """Yield (paragraph, (index, page, offset)) for each paragraph worth analyzing that is not yet completed.
+
+        offset is the paragraph's position in all of the book's paragraphs joined by blank lines.
+        paragraph_count, a one-item list, is updated with the number of paragraphs read so far.
+        """
+        # Pages are read on a background thread while earlier paragraphs are analyzed;
+        # the bounded buffer keeps memory flat regardless of page count
+        paragraphs = iter_in_background(self.iter_paragraphs_from_pdf(pdf_path), max_buffered=64)
+        offset = 0
+        for i, (page_number, paragraph) in enumerate(paragraphs, 1):
+            if paragraph_count is not None:
+                paragraph_count[0] = i
+            paragraph_offset = offset
+            offset += len(paragraph) + 2
+            if i in completed:
+                continue
+            if len(paragraph.split()) >= MIN_PARAGRAPH_WORDS:
+                yield paragraph, (i, page_number, paragraph_offset)
+
+    def config_fingerprint(self, limit=3):
+        """Hash of the settings that decide a paragraph's results; stored results only match the same settings."""
+        return config_fingerprint({
+            'artists': sorted(self.chosen_artists),
+            'artist_scoped': self.artist_scoped,
+            'mood_score_weights': MOOD_SCORE_WEIGHTS,
+            'disabled_pipes': BOOK_DISABLED_PIPES,
+            'limit': limit,
+        })
+
+    def recommend_paragraphs(self, paragraphs, limit=3):
+        """Yield a ParagraphResult for each (paragraph, (index, page, offset)) pair.
+
+        Paragraphs whose normalized text was already processed with the same settings come from the
+        paragraph store; only new or edited ones are analyzed and searched.
+        """
+        fingerprint = self.config_fingerprint(limit)
+        paragraphs = iter(paragraphs)
+        while True:
+            block = list(islice(paragraphs, self.batch_size))
+            if not block:
+                return
+            keys = [ParagraphStore.make_key(paragraph, fingerprint) for paragraph, _ in block]
+            stored = self.paragraph_store.get_many(keys)
+            self.instrumentation.count("paragraphs.reused", sum(1 for key in keys if key in stored))
             
-        with open(output_file, 'w', encoding='utf-8') as f:
-            for i, paragraph in enumerate(paragraphs, 1):
-                if len(paragraph.split()) < 20:  # Skip very short paragraphs
-                    continue
-                    
-                print(f"\nProcessing paragraph {i} of {len(paragraphs)}...")
-                f.write(f"\n{'='*80}\nParagraph {i}:\n{'='*80}\n")
-                f.write(f"{paragraph}\n\nRecommended Songs:\n{'-'*50}\n")
-                
-                # Analyze paragraph
-                analysis = self.analyze_text(paragraph)
-                queries = self.create_music_queries(analysis)
-                
-                # Track unique songs to avoid duplicates
-                seen_songs = set()
-                recommendations = []
-                
-                # Try different queries until we find enough unique songs
-                for query in queries:
-                    if len(recommendations) >= 3:
-                        break
-                        
-                    matches = self.find_matching_songs(query)
-                    for match in matches:
-                        if match.title not in seen_songs and len(recommendations) < 3:
-                            seen_songs.add(match.title)
-                            recommendations.append(match)
-                
-                # Write recommendations
-                if recommendations:
-                    for j, rec in enumerate(recommendations, 1):
-                        f.write(f"{j}. \"{rec.title}\" by {rec.artist}\n")
-                        f.write(f"   Spotify URL: {rec.spotify_url}\n")
-                        f.write(f"   Mood Score: {rec.mood_score:.2f}\n\n")
-                else:
-                    f.write("No matching songs found for this paragraph.\n\n")
-                
-                f.flush()  # Ensure writing to file immediately
-# Spotify credentials - replace with your own
-spotify_client_id = ""
-spotify_client_secret = ""
-
-# List of artists to choose from
-chosen_artists = [
-    "Hans Zimmer", "Max Richter", "Ludovico Einaudi", 
-    "Johann Johannsson", "Ólafur Arnalds", "Nicholas Britell",
-    "Gustavo Santaolalla", "Philip Glass", "Thomas Newman",
-    "Nils Frahm", "Jon Hopkins", "Joep Beving"
-]
-
-# Initialize and run the recommender
-recommender = BookMusicRecommender(spotify_client_id, spotify_client_secret, chosen_artists)
-output_file = "book_recommendations.txt"
-recommender.process_book(filename, output_file)
-
-# Download the recommendations file
-files.download(output_file)
+            # Repeats of the same paragraph within a block are analyzed once
+            missing = {}
+            for (paragraph, location), key in zip(block, keys):
+                if key not in stored and key not in missing:
+                    missing[key] = (paragraph, (key, location))
+            fresh = {}
+            # Paragraphs are parsed in batches with nlp.pipe instead of one nlp() call each
+            for analysis, (key, (i, page_number, _)) in self.analyze_texts(missing.values(), as_tuples=True):
+                print(f"\nProcessing paragraph {i} (page {page_number})...")
+                recommendations, queries = self.recommend_with_queries(analysis, limit)
+                fresh[key] = {'queries': queries, 'recommendations': [rec._asdict() for rec in recommendations]}
+            self.paragraph_store.put_many(fresh.items())
+            
+            for (paragraph, (i, page_number, offset)), key in zip(block, keys):
+                entry = stored[key] if key in stored else fresh[key]
+                recommendations = [SongRecommendation(**rec) for rec in entry['recommendations']]
+                yield ParagraphResult(i, page_number, offset, paragraph, entry['queries'], recommendations)
+
+    @traced("output.write")
+    def write_result(self, writer, journal, result, book=None):
+        """Write one paragraph's record and journal it once the output is durable."""
+        writer.write(paragraph_record(result, book))
+        journal.record(result.index, result.recommendations, writer.tell(),
+                       output_file=writer if writer.resumable else None)
+
+    def chapter_queries(self, paragraph_queries, analyses, query_ranker):
+        """Rank the queries of a chapter's paragraphs; returns the selected query strings, best first.
+
+        A query found in many of the chapter's paragraphs (but few other chapters) ranks higher,
+        and sentiment queries rank above single words.
+        """
+        candidates = []
+        for queries, analysis in zip(paragraph_queries, analyses):
+            sentiment = set(self.sentiment_queries(analysis))
+            candidates.extend(CandidateQuery(query, query, 'sentiment' if query in sentiment else 'mood')
+                              for query in queries)
+        return [ranked.query for ranked in query_ranker.rank(candidates)]
+
+    def chapter_pool(self, queries, pool_size, preview_urls=None, query_ranker=None):
+        """Run a chapter's queries into one CandidatePool of at most pool_size tracks.
+
+        Queries run concurrently, in order, until the pool is full; preview_urls, when given, is
+        filled with each pooled track's preview URL, and query_ranker learns which queries found tracks.
+        """
+        pool = lazy_import("candidatePool").CandidatePool(MOOD_SCORE_WEIGHTS, capacity=pool_size)
+        results = self.executor.imap(self.find_candidates, queries)
+        try:
+            for query, (tracks, features) in zip(queries, results):
+                if query_ranker is not None:
+                    query_ranker.record(query, any(features.get(track['id']) for track in tracks))
+                tracks = [track for track in tracks if track['id'] not in pool and features.get(track['id'])]
+                tracks = tracks[:pool_size - len(pool)]
+                pool.add(tracks, features, reason=query)
+                if preview_urls is not None:
+                    preview_urls.update((track['id'], track['preview_url']) for track in tracks)
+                if len(pool) >= pool_size:
+                    break
+        finally:
+            # Cancels queries that have not started yet
+            results.close()
+            if query_ranker is not None:
+                query_ranker.flush()
+        return pool
+
+    @traced("plan_soundtrack")
+    def plan_soundtrack(self, pdf_path, output_file=None, planner=None, query_ranker=None, output_format=None,
+                        include_text=False):
+        """Plan one track per paragraph for a whole book and return the soundtrack as SoundtrackCues.
+
+        Unlike process_book, which searches for every paragraph on its own, each chapter's best queries
+        (ranked by query_ranker, default QueryRanker(max_queries=planner.chapter_queries)) are searched
+        once into a bounded candidate pool, and a SoundtrackPlanner picks every paragraph's track so that
+        moods fit, changes are smooth and tracks are not repeated (see soundtrackPlanner). With
+        output_file, each paragraph and its planned track are written as by process_book.
+        """
+        soundtrackPlanner = lazy_import("soundtrackPlanner")
+        target_for_words = lazy_import("trackCatalog").target_for_words
+        planner = planner if planner is not None else soundtrackPlanner.SoundtrackPlanner()
+        planner.reset()
+        query_ranker = query_ranker if query_ranker is not None else QueryRanker(max_queries=planner.chapter_queries)
+        search_stats_before = self.search_cache.stats()
+        writer = journal = None
+        if output_file is not None:
+            writer, journal, _ = self.open_report(output_file, format=output_format, include_text=include_text)
+        book = os.path.basename(pdf_path)
+        paragraphs = self.iter_book_paragraphs(pdf_path)
+        indices, word_counts, planned = [], [], []
+        try:
+            while True:
+                chapter = list(islice(paragraphs, planner.chapter_paragraphs))
+                if not chapter:
+                    break
+                analyses = list(self.analyze_texts(chapter, as_tuples=True))
+                paragraph_queries = [self.create_music_queries(analysis) for analysis, _ in analyses]
+                chosen = self.chapter_queries(paragraph_queries, [analysis for analysis, _ in analyses], query_ranker)
+                preview_urls = {}
+                pool = self.chapter_pool(chosen, planner.pool_size, preview_urls, query_ranker)
+                self.instrumentation.observe("candidates.per_chapter", len(pool))
+                first, last = analyses[0][1][0], analyses[-1][1][0]
+                print(f"\nPlanning paragraphs {first}-{last}: {len(chosen)} queries, {len(pool)} candidate tracks")
+
+                rows = [None] * len(analyses)
+                if len(pool):
+                    targets = [target_for_words(analysis['mood_words'] + self.sentiment_queries(analysis))
+                               for analysis, _ in analyses]
+                    unary = planner.unary_costs(targets, pool.features, paragraph_queries, pool.reasons)
+                    rows = planner.plan_chapter(unary, pool.features, pool.track_ids)
+                scores = pool.scores()
+                chosen = set(chosen)
+
+                for (analysis, (i, page_number, offset)), queries, row in zip(analyses, paragraph_queries, rows):
+                    indices.append(i)
+                    word_counts.append(len(analysis['text'].split()))
+                    recommendations = []
+                    if row is None:
+                        planned.append(None)
+                    else:
+                        recommendation = SongRecommendation(
+                            title=pool.titles[row],
+                            artist=pool.artists[row],
+                            spotify_url=f"https://open.spotify.com/track/{pool.track_ids[row]}",
+                            mood_score=float(scores[row]),
+                            track_id=pool.track_ids[row]
+                        )
+                        recommendations.append(recommendation)
+                        planned.append(dict(recommendation._asdict(), preview_url=preview_urls.get(pool.track_ids[row])))
+                    if writer is not None:
+                        used = [query for query in queries if query in chosen]
+                        self.write_result(writer, journal,
+                                          ParagraphResult(i, page_number, offset, analysis['text'], used, recommendations),
+                                          book)
+        finally:
+            if writer is not None:
+                journal.close(output_file=writer if writer.resumable else None)
+                writer.close()
+
+        cues = soundtrackPlanner.cues_from_plan(indices, word_counts, planned)
+        print(f"\nPlanned {len(cues)} cues with {len(planner.plays)} distinct tracks for {len(indices)} paragraphs")
+        self.report_search_cache(search_stats_before)
+        self.instrumentation.flush()
+        return cues
+
+    def report_search_cache(self, stats_before):
+        """Print the search-cache hit rate for the book just processed."""
+        stats_after = self.search_cache.stats()
+        hits = stats_after['hits'] - stats_before['hits']
+        misses = stats_after['misses'] - stats_before['misses']
+        lookups = hits + misses
+        hit_rate = hits / lookups if lookups else 0.0
+        print(f"\nSearch cache: {hits} hits, {misses} misses ({hit_rate:.1%} hit rate) over {lookups} queries")
+        return {"hits": hits, "misses": misses, "hit_rate": hit_rate}
+
+record_timing(f"import:{__name__}", time.perf_counter() - _IMPORT_STARTED)
+
+
+if __name__ == "__main__":
+    # Spotify credentials - replace with your own
+    spotify_client_id = ""
+    spotify_client_secret = ""
+
+    # List of artists to choose from
+    chosen_artists = [
+        "Hans Zimmer", "Max Richter", "Ludovico Einaudi", 
+        "Johann Johannsson", "Ólafur Arnalds", "Nicholas Britell",
+        "Gustavo Santaolalla", "Philip Glass", "Thomas Newman",
+        "Nils Frahm", "Jon Hopkins", "Joep Beving"
+    ]
+
+    # Usage: python MusicDirectorPDF.py path/to/book.pdf [output_file]
+    pdf_path = sys.argv[1] if len(sys.argv) > 1 else "book.pdf"
+    output_file = sys.argv[2] if len(sys.argv) > 2 else "book_recommendations.txt"
+
+    # Initialize and run the recommender
+    recommender = BookMusicRecommender(spotify_client_id, spotify_client_secret, chosen_artists)
+    recommender.process_book(pdf_path, output_file)
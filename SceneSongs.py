@@ -1,31 +1,63 @@
 # SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
 
 
-import spacy
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 import warnings
-from nltk.corpus import wordnet as wn
 from collections import namedtuple
-import nltk
-nltk.download('wordnet')
+from functools import lru_cache
+from itertools import takewhile
+from modelRegistry import get_spacy, get_wordnet, lazy_import, record_timing
+from instrumentation import NOOP, traced
+from spotifyCache import AudioFeatureCache
+from queryExecutor import QueryExecutor
+from musicBackend import InstrumentedBackend, SpotipyBackend
+from queryPlanner import ArtistQueryPlanner
+from queryRanker import BudgetedClient, BudgetExhausted, CandidateQuery, QueryRanker
 
 # Suppress specific warnings from Spotipy
 warnings.filterwarnings("ignore", category=UserWarning)
 
+# analyze_scene only reads token text and POS tags
+SCENE_DISABLED_PIPES = ['parser', 'ner', 'lemmatizer']
+
+# Distinct token texts whose mapping matches are memoized per recommender
+TOKEN_MATCH_CACHE_SIZE = 16384
+
 # Create a named tuple for song recommendations
-SongRecommendation = namedtuple('SongRecommendation', ['title', 'artist', 'spotify_url', 'mood_score', 'match_reason'])
+SongRecommendation = namedtuple('SongRecommendation', ['title', 'artist', 'spotify_url', 'mood_score', 'match_reason', 'track_id'])
 
 class SceneMusicRecommender:
-    def __init__(self, spotify_client_id, spotify_client_secret, chosen_artists):
-        """Initialize the recommender with Spotify credentials and NLP models."""
-        self.nlp = spacy.load("en_core_web_sm")
-        client_credentials_manager = SpotifyClientCredentials(
-            client_id=spotify_client_id, 
-            client_secret=spotify_client_secret
-        )
-        self.sp = spotipy.Spotify(client_credentials_manager=client_credentials_manager)
+    def __init__(self, spotify_client_id, spotify_client_secret, chosen_artists, feature_cache=None, executor=None,
+                 artist_scoped=True, sp=None, instrumentation=None, query_ranker=None, weight_profile='scene',
+                 search_cache=None):
+        """Initialize the recommender with Spotify credentials and NLP models.
+
+        Pass sp (any MusicBackend, e.g. FakeMusicBackend) to use it instead of Spotify via the credentials.
+        search_cache (a SearchCache) memoizes searches, e.g. one shared with other recommenders.
+        weight_profile names an entry of candidatePool.WEIGHT_PROFILES, or is a {feature: weight} dict.
+        """
+        self.executor = executor if executor is not None else QueryExecutor()
+        # Spans, counters and histograms; the default records nothing
+        self.instrumentation = instrumentation if instrumentation is not None else NOOP
+        backend = sp if sp is not None else SpotipyBackend.from_credentials(spotify_client_id, spotify_client_secret)
+        if self.instrumentation.enabled:
+            backend = InstrumentedBackend(backend, self.instrumentation)
+        # Every API call is throttled through the executor's shared rate limiter
+        self.sp = self.executor.wrap(backend)
         self.chosen_artists = chosen_artists
+        self.feature_cache = feature_cache if feature_cache is not None else AudioFeatureCache()
+        # Searches are scoped to chosen artists (artist:"...") unless artist_scoped=False
+        self.artist_scoped = artist_scoped
+        self.query_planner = ArtistQueryPlanner(chosen_artists, search_cache=search_cache)
+        # Ranks candidate queries and caps the API calls (and queries) each scene may spend
+        self.query_ranker = query_ranker if query_ranker is not None else QueryRanker()
+        # mood_score weights over the audio features
+        self.weight_profile = weight_profile
+        self.instrumentation.register_gauge("feature_cache", self.feature_cache.stats)
+        self.instrumentation.register_gauge("query_ranker", self.query_ranker.stats)
+        self.instrumentation.register_gauge("query_planner", self.query_planner.stats)
         
         # Define mood mappings for different scene elements
         self.mood_mappings = {
@@ -86,113 +118,246 @@ class SceneMusicRecommender:
                 'scifi': ['futuristic', 'electronic', 'otherworldly', 'cosmic']
             }
         }
+        
+        # The mapping vocabulary is compiled once, on first use, so analyze_scene never walks
+        # WordNet per token and constructing a recommender stays cheap
+        self._synonym_index = None
+        self._token_matches = None
+
+    @property
+    def nlp(self):
+        """spaCy pipeline, loaded on first use and shared with the other recommenders."""
+        return get_spacy()
 
     def get_synonyms(self, word):
         """Get synonyms for a word using WordNet."""
         synonyms = set()
-        for syn in wn.synsets(word):
+        for syn in get_wordnet().synsets(word):
             for lemma in syn.lemmas():
                 synonyms.add(lemma.name())
         return synonyms
 
+    def _build_synonym_index(self):
+        """Build a reverse index from each mapping key and its synonyms to (category, key)."""
+        synonym_index = {}
+        self._mapping_order = {}
+        for category, mappings in self.mood_mappings.items():
+            for key in mappings:
+                self._mapping_order[(category, key)] = len(self._mapping_order)
+                for form in {key} | self.get_synonyms(key):
+                    synonym_index.setdefault(form, []).append((category, key))
+        self._max_form_length = max(len(form) for form in synonym_index)
+        self._token_matches = lru_cache(maxsize=TOKEN_MATCH_CACHE_SIZE)(self._scan_token)
+        self._synonym_index = synonym_index
+
+    def _scan_token(self, text):
+        # Looking up every substring keeps the original `syn in token.text` semantics
+        found = set()
+        for start in range(len(text)):
+            for end in range(start + 1, min(len(text), start + self._max_form_length) + 1):
+                found.update(self._synonym_index.get(text[start:end], ()))
+        return tuple(sorted(found, key=self._mapping_order.__getitem__))
+
+    def match_mappings(self, text):
+        """Return the (category, key) pairs whose key or a synonym occurs in text, in mapping order."""
+        if self._synonym_index is None:
+            self._build_synonym_index()
+        return self._token_matches(text)
+
+    @traced("analyze_scene")
     def analyze_scene(self, scene_description):
         """Analyze scene description to extract mood, location, action, and atmosphere."""
-        doc = self.nlp(scene_description.lower())
-        
+        return self.analysis_from_doc(self.nlp(scene_description.lower(), disable=SCENE_DISABLED_PIPES))
+
+    def analyze_scenes(self, scene_descriptions, batch_size=32):
+        """Analyze many scene descriptions in batches with nlp.pipe, yielding analyses in input order."""
+        docs = self.nlp.pipe(
+            (scene_description.lower() for scene_description in scene_descriptions),
+            batch_size=batch_size,
+            disable=SCENE_DISABLED_PIPES
+        )
+        for doc in docs:
+            yield self.analysis_from_doc(doc)
+
+    def analysis_from_doc(self, doc):
+        """Extract mapped scene elements, mood words and sentiment from a parsed (lowercased) doc."""
         elements = {k: [] for k in self.mood_mappings.keys()}
         
         # Check each word against our mood mappings
         for token in doc:
-            for category, mappings in self.mood_mappings.items():
-                for key in mappings:
-                    if key in token.text or any(syn in token.text for syn in self.get_synonyms(key)):
-                        elements[category].append(key)
+            for category, key in self.match_mappings(token.text):
+                elements[category].append(key)
         
         mood_words = [token.text for token in doc if token.pos_ in ["ADJ", "VERB", "ADV"]]
         sentiment = sum(token.sentiment for token in doc if hasattr(token, 'sentiment'))
         
         return {"elements": elements, "mood_words": mood_words, "sentiment": sentiment}
 
-    def create_music_queries(self, analysis):
-        queries = []
-        match_reasons = []
+    def candidate_queries(self, analysis):
+        """List every candidate query with the reason it was generated and its source."""
+        candidates = []
         
         for category, items in analysis['elements'].items():
             for item in items:
                 if item in self.mood_mappings[category]:
-                    queries.extend(self.mood_mappings[category][item])
-                    match_reasons.append(f"Matches {category}: {item}")
+                    for query in self.mood_mappings[category][item]:
+                        candidates.append(CandidateQuery(query, f"Matches {category}: {item}", 'mapping'))
         
         for mood in analysis['mood_words']:
-            queries.append(mood)
-            match_reasons.append(f"Matches mood: {mood}")
+            candidates.append(CandidateQuery(mood, f"Matches mood: {mood}", 'mood'))
         
         sentiment = analysis['sentiment']
         if sentiment > 0:
-            queries.extend(['uplifting', 'positive', 'bright'])
-            match_reasons.append("Matches positive sentiment")
+            for query in ['uplifting', 'positive', 'bright']:
+                candidates.append(CandidateQuery(query, "Matches positive sentiment", 'sentiment'))
         elif sentiment < 0:
-            queries.extend(['dark', 'somber', 'intense'])
-            match_reasons.append("Matches negative sentiment")
+            for query in ['dark', 'somber', 'intense']:
+                candidates.append(CandidateQuery(query, "Matches negative sentiment", 'sentiment'))
         
-        return list(set(queries)), match_reasons
+        return candidates
+
+    @traced("create_music_queries")
+    def create_music_queries(self, analysis):
+        """Return the unique queries and, aligned with them, the reason each was first generated."""
+        match_reasons = {}
+        for candidate in self.candidate_queries(analysis):
+            match_reasons.setdefault(candidate.query, candidate.reason)
+        return list(match_reasons), list(match_reasons.values())
+
+    @traced("rank_queries")
+    def rank_queries(self, analysis):
+        """Return the scene's best queries, highest expected usefulness first."""
+        candidates = self.candidate_queries(analysis)
+        ranked = self.query_ranker.rank(candidates)
+        self.instrumentation.observe("queries.candidates_per_scene", len(candidates))
+        self.instrumentation.observe("queries.per_scene", len(ranked))
+        return ranked
+
+    def is_chosen_artist_track(self, track):
+        """Check that a track is by one of the chosen artists."""
+        return any(artist['name'] in self.chosen_artists for artist in track['artists'])
+
+    def new_candidate_pool(self):
+        """An empty CandidatePool scored with this recommender's weight profile."""
+        # numpy is only imported once a scene is actually scored
+        return lazy_import("candidatePool").CandidatePool(self.weight_profile)
+
+    def find_candidates(self, query, limit=3, budget=None):
+        """Search chosen-artist tracks for a query; returns (tracks, {track ID: audio features}).
 
-    def find_matching_songs(self, query, match_reason, limit=3):
-        """Find matching songs for a query."""
+        With a budget, searches and the audio-feature lookup are both charged to it.
+        """
+        artist_tracks = []
         try:
-            results = self.sp.search(q=query, type='track', limit=50)
-            
-            matching_tracks = []
-            for track in results['tracks']['items']:
-                if any(artist['name'] in self.chosen_artists for artist in track['artists']):
-                    features = self.sp.audio_features(track['id'])[0]
-                    if features:
-                        mood_score = (
-                            features['valence'] * 0.3 +
-                            features['energy'] * 0.3 +
-                            features['instrumentalness'] * 0.2 +
-                            features['acousticness'] * 0.2
-                        )
-                        
-                        recommendation = SongRecommendation(
-                            title=track['name'],
-                            artist=track['artists'][0]['name'],
-                            spotify_url=f"https://open.spotify.com/track/{track['id']}",
-                            mood_score=mood_score,
-                            match_reason=match_reason
-                        )
-                        matching_tracks.append(recommendation)
-            
-            matching_tracks.sort(key=lambda x: x.mood_score, reverse=True)
-            return matching_tracks[:limit]
+            artist_tracks = self.query_planner.find_tracks(
+                self.sp, query, needed=limit, accept=self.is_chosen_artist_track, artist_scoped=self.artist_scoped,
+                budget=budget
+            )
+            # One batched lookup for every candidate instead of a request per track
+            sp = BudgetedClient(self.sp, budget) if budget is not None else self.sp
+            return artist_tracks, self.feature_cache.get_features(sp, artist_tracks)
+        except BudgetExhausted:
+            # Tracks without features cannot be scored
+            return artist_tracks, {}
         except Exception as e:
             print(f"Error finding matching songs: {str(e)}")
-            return []
+            return [], {}
 
+    def pool_recommendations(self, pool, limit=None):
+        """The pool's best tracks (all of them when limit is None) as SongRecommendations, best first."""
+        return [
+            SongRecommendation(
+                title=entry.title,
+                artist=entry.artist,
+                spotify_url=entry.spotify_url,
+                mood_score=entry.score,
+                match_reason=entry.reason,
+                track_id=entry.track_id
+            )
+            for entry in pool.top(limit)
+        ]
+
+    def find_matching_songs(self, query, match_reason, limit=3, budget=None):
+        """Find matching songs for a query, spending searches from budget when one is given."""
+        pool = self.new_candidate_pool()
+        pool.add(*self.find_candidates(query, limit, budget), reason=match_reason)
+        return self.pool_recommendations(pool, limit)
+
+    @traced("recommend_for_scene")
     def recommend_for_scene(self, scene_description):
+        return self.recommend_for_analysis(self.analyze_scene(scene_description))
+
+    def recommend_for_analysis(self, analysis, limit=None, pool=None):
+        """Search for songs matching an analysis from analyze_scene or analyze_scenes.
+        
+        Queries run best-first within the ranker's per-scene API-call budget, and stop early once the
+        top recommendations have not changed for `patience` consecutive queries. Every track found goes
+        into one CandidatePool keyed by track ID; pass pool to accumulate candidates across scenes
+        (e.g. a chapter). Returns the best limit songs (all when None), best first.
+        """
+        ranked_queries = self.rank_queries(analysis)
+        budget = self.query_ranker.new_budget()
+        pool = pool if pool is not None else self.new_candidate_pool()
+        
+        def run_query(ranked):
+            # Calls are reserved when a query starts, so queries that start first (higher-ranked) get their share
+            query_budget = budget.reserve(self.query_ranker.max_calls_per_query)
+            try:
+                return self.find_candidates(ranked.query, budget=query_budget), query_budget
+            finally:
+                query_budget.release()
+        
+        top_ids = ()
+        stable_rounds = 0
+        
+        # Queries run concurrently; results come back in rank order. No more queries are handed out
+        # once the scene budget is spent or reserved, since they could not issue a single call
+        all_results = self.executor.imap(run_query, takewhile(lambda _: not budget.exhausted, ranked_queries))
+        try:
+            for ranked, ((tracks, features), query_budget) in zip(ranked_queries, all_results):
+                found = pool.add(tracks, features, reason=ranked.reason)
+                # A query cut short by the scene budget says nothing about its hit rate
+                if found or not query_budget.starved:
+                    self.query_ranker.record(ranked.query, bool(found))
+                
+                top_ids, stable_rounds = self.query_ranker.is_confident(
+                    pool.top_ids(self.query_ranker.top_n), top_ids, stable_rounds
+                )
+                # Queries already running finish on their reserved calls; their results are still used
+                if stable_rounds >= self.query_ranker.patience:
+                    break
+        finally:
+            # Cancels queries that have not started yet
+            all_results.close()
+            self.query_ranker.flush()
+        self.instrumentation.observe("api_calls.per_scene", budget.spent)
+        self.instrumentation.observe("candidates.per_scene", len(pool))
+        
+        return self.pool_recommendations(pool, limit)
+
+    def recommend_from_catalog(self, scene_description, catalog, limit=10):
+        """Recommend tracks from a local TrackCatalog by nearest-neighbor search, with no API calls."""
+        target_for_words = lazy_import("trackCatalog").target_for_words
+        weighted_score = lazy_import("candidatePool").weighted_score
         analysis = self.analyze_scene(scene_description)
         queries, match_reasons = self.create_music_queries(analysis)
         
-        seen_songs = set()
+        target = target_for_words(queries)
         recommendations = []
-        
-        for query, reason in zip(queries, match_reasons):
-            tracks = self.find_matching_songs(query, reason)
-            for track in tracks:
-                if track.title not in seen_songs:
-                    recommendations.append(track)
-                    seen_songs.add(track.title)
-        
-        recommendations.sort(key=lambda x: x.mood_score, reverse=True)
+        for match in catalog.nearest(target, tags=queries, k=limit):
+            recommendations.append(SongRecommendation(
+                title=match.title,
+                artist=match.artist,
+                spotify_url=match.spotify_url,
+                mood_score=weighted_score(match.features, self.weight_profile),
+                match_reason=f"Nearest catalog match (distance {match.distance:.3f})",
+                track_id=match.track_id
+            ))
         return recommendations
 
 
-# Example usage:
-spotify_client_id = ""
-spotify_client_secret = ""
-
-# List of film composers and ambient artists
-chosen_artists = [
+# Film composers and ambient artists; also the artist list for the offline track catalog
+FILM_COMPOSERS = [
     "Hans Zimmer",
     "John Williams",
     "Ennio Morricone",
@@ -233,15 +398,28 @@ chosen_artists = [
     "M83"
 ]
 
-# Initialize the recommender
-recommender = SceneMusicRecommender(spotify_client_id, spotify_client_secret, chosen_artists)
-
-# Example scene description
-scene_description = """
+# Example scene, also used by the benchmarks
+EXAMPLE_SCENE = """
 Ethan sat on the weathered park bench, watching as leaves danced in the crisp autumn breeze, their vibrant colors a stark contrast to the gray cloud hanging over his heart. He remembered the way Clara laughed, her eyes sparkling with a warmth that made the world around him seem brighter. They had shared fleeting moments—soft conversations that lingered in the air, the brush of hands during a casual joke, and the electric thrill of unspoken words. Yet, each time he hesitated, fearing the risk of vulnerability more than the ache of unfulfilled longing. 
 
 When she finally left for the city, chasing her dreams, he felt a hollow void where his courage should have been. Days turned into weeks, and those stolen moments replayed in his mind like a bittersweet melody, a constant reminder of the "what ifs" that haunted him. Friends told him to reach out, to let her know how he felt, but he remained silent, trapped in his own indecision. Now, as he watched couples stroll hand-in-hand, laughter ringing through the air, he realized that he had let the opportunity slip away, buried under the weight of his fears. The regret settled in like an unwelcome guest, and with it came the painful understanding that sometimes, the hardest battles are fought within ourselves."""
 
-# Get recommendations
-recommendations = recommender.recommend_for_scene(scene_description)
-print(recommendations)
+record_timing(f"import:{__name__}", time.perf_counter() - _IMPORT_STARTED)
+
+
+if __name__ == "__main__":
+    # Example usage:
+    spotify_client_id = ""
+    spotify_client_secret = ""
+
+    chosen_artists = FILM_COMPOSERS
+
+    # Initialize the recommender
+    recommender = SceneMusicRecommender(spotify_client_id, spotify_client_secret, chosen_artists)
+
+    # Example scene description
+    scene_description = EXAMPLE_SCENE
+
+    # Get recommendations
+    recommendations = recommender.recommend_for_scene(scene_description)
+    print(recommendations)
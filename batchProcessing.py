@@ -0,0 +1,306 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from bookOutput import output_format
+from MusicDirectorPDF import BookMusicRecommender
+from paragraphStore import ParagraphStore
+from pdfExtraction import ExtractionCache, PdfTextExtractor
+from queryExecutor import DEFAULT_REQUESTS_PER_SECOND, QueryExecutor, SharedTokenBucket
+from spotifyCache import DEFAULT_CACHE_PATH, AudioFeatureCache, SearchCache
+
+# One PDF and the report it is written to
+BookJob = namedtuple('BookJob', ['pdf_path', 'output_file'])
+BookResult = namedtuple('BookResult', ['pdf_path', 'output_file', 'paragraphs', 'seconds', 'error'])
+
+DEFAULT_CHUNK_SIZE = 64
+DEFAULT_THREADS_PER_WORKER = 4
+REPORT_SUFFIXES = {"text": ".recommendations.txt", "jsonl": ".recommendations.jsonl", "parquet": ".recommendations.parquet"}
+
+# The recommender of the current worker process, built once by _init_worker
+_recommender = None
+_include_text = False
+
+
+def find_books(source, output_dir=None, format="text"):
+    """Return BookJobs for a directory of PDFs (searched recursively) or a manifest file.
+
+    A manifest has one book per line: a PDF path, optionally followed by a tab and an output path,
+    or a JSON object {"pdf": ..., "output": ...}. Relative paths are resolved against the manifest's
+    directory. Books without an output path are written to output_dir (default: next to the PDF) in
+    the given format ("text", "jsonl" or "parquet").
+    """
+    entries = []
+    if os.path.isdir(source):
+        for directory, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.lower().endswith(".pdf"):
+                    pdf_path = os.path.join(directory, name)
+                    # Keep the subdirectory in the name so books with the same file name do not collide
+                    relative = os.path.relpath(pdf_path, source)
+                    entries.append((pdf_path, None, os.path.splitext(relative)[0].replace(os.sep, "__")))
+    else:
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if line.startswith("{"):
+                    entry = json.loads(line)
+                    pdf_path, output_file = entry['pdf'], entry.get('output')
+                else:
+                    pdf_path, _, output_file = line.partition("\t")
+                pdf_path = os.path.join(base, pdf_path)
+                output_file = os.path.join(base, output_file) if output_file else None
+                entries.append((pdf_path, output_file, os.path.splitext(os.path.basename(pdf_path))[0]))
+
+    jobs = []
+    for pdf_path, output_file, stem in sorted(entries):
+        if output_file is None:
+            directory = output_dir if output_dir is not None else os.path.dirname(pdf_path)
+            output_file = os.path.join(directory, stem + REPORT_SUFFIXES[format])
+        jobs.append(BookJob(pdf_path, output_file))
+    return jobs
+
+
+def build_recommender(options):
+    """Build a BookMusicRecommender whose caches and rate limit are shared through options['cache_path'].
+
+    Books are already spread over worker processes, so each one extracts its PDF's pages in-process
+    unless options['extraction_workers'] asks for more.
+    """
+    cache_path = options.get('cache_path', DEFAULT_CACHE_PATH)
+    rate_limiter = SharedTokenBucket(cache_path, options.get('requests_per_second', DEFAULT_REQUESTS_PER_SECOND),
+                                     options.get('burst'))
+    backend_factory = options.get('backend_factory')
+    return BookMusicRecommender(
+        options.get('spotify_client_id'), options.get('spotify_client_secret'), options['chosen_artists'],
+        feature_cache=AudioFeatureCache(path=cache_path),
+        search_cache=SearchCache(path=cache_path),
+        paragraph_store=ParagraphStore(path=cache_path),
+        pdf_extractor=PdfTextExtractor(workers=options.get('extraction_workers', 1),
+                                       cache=ExtractionCache(path=cache_path)),
+        executor=QueryExecutor(max_workers=options.get('threads_per_worker', DEFAULT_THREADS_PER_WORKER),
+                               rate_limiter=rate_limiter),
+        batch_size=options.get('batch_size', 32),
+        artist_scoped=options.get('artist_scoped', False),
+        sp=backend_factory() if backend_factory is not None else None,
+    )
+
+
+def _init_worker(options):
+    global _recommender, _include_text
+    if options.get('quiet', True):
+        # Per-paragraph progress from many processes at once is noise; the parent reports per book
+        sys.stdout = open(os.devnull, 'w')
+    _recommender = build_recommender(options)
+    _include_text = options.get('include_text', False)
+
+
+def _process_book_task(job, resume):
+    start = time.perf_counter()
+    try:
+        paragraphs = _recommender.process_book(job.pdf_path, job.output_file, resume=resume,
+                                               include_text=_include_text)
+        return BookResult(job.pdf_path, job.output_file, paragraphs, time.perf_counter() - start, None)
+    except Exception as e:
+        return BookResult(job.pdf_path, job.output_file, 0, time.perf_counter() - start, f"{type(e).__name__}: {e}")
+
+
+def _recommend_chunk_task(chunk):
+    return list(_recommender.recommend_paragraphs(chunk))
+
+
+class _OpenBook:
+    """A book whose paragraphs are being recommended in chunks by the workers and written by the parent."""
+
+    def __init__(self, job, writer, journal):
+        self.job = job
+        self.writer = writer
+        self.journal = journal
+        self.name = os.path.basename(job.pdf_path)
+        self.paragraph_count = [0]
+        self.started = time.perf_counter()
+        self.error = None
+
+
+class BatchProcessor:
+    """Recommend music for many books at once on a pool of worker processes.
+
+    Each worker loads its own spaCy pipeline, so NLP throughput scales with cores. Every worker opens
+    the same SQLite file (WAL mode) for its search and audio-feature caches and for a SharedTokenBucket,
+    so a query answered by one worker is a cache hit for the rest and the API rate limit holds across
+    the whole pool rather than per process.
+
+    With mode="books" each worker processes whole books (process_book, with its own output and
+    checkpoint). With mode="chunks" the parent reads the PDFs and fans chunks of chunk_size paragraphs
+    out to the workers, then writes each book's report in order; this keeps every core busy when there
+    are fewer books than workers. mode="auto" picks books when there are at least as many books as workers.
+    """
+
+    def __init__(self, spotify_client_id, spotify_client_secret, chosen_artists, workers=None, mode="auto",
+                 chunk_size=DEFAULT_CHUNK_SIZE, cache_path=DEFAULT_CACHE_PATH,
+                 requests_per_second=DEFAULT_REQUESTS_PER_SECOND, burst=None,
+                 threads_per_worker=DEFAULT_THREADS_PER_WORKER, batch_size=32, artist_scoped=False,
+                 backend_factory=None, quiet=True, include_text=False, extraction_workers=1):
+        """backend_factory, a picklable callable returning a MusicBackend, replaces Spotify in every worker.
+
+        extraction_workers is the number of processes each book's PDF pages are extracted with.
+        """
+        if mode not in ("auto", "books", "chunks"):
+            raise ValueError(f"Unknown mode: {mode}")
+        self.workers = workers or os.cpu_count() or 1
+        self.mode = mode
+        self.chunk_size = max(1, chunk_size)
+        self.options = {
+            'spotify_client_id': spotify_client_id,
+            'spotify_client_secret': spotify_client_secret,
+            'chosen_artists': chosen_artists,
+            'cache_path': cache_path,
+            'requests_per_second': requests_per_second,
+            'burst': burst,
+            'threads_per_worker': threads_per_worker,
+            'batch_size': batch_size,
+            'artist_scoped': artist_scoped,
+            'backend_factory': backend_factory,
+            'quiet': quiet,
+            'include_text': include_text,
+            'extraction_workers': extraction_workers,
+        }
+
+    def _pool(self):
+        # spawn, not fork: the parent may already hold threads, SQLite connections and a loaded model
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker, initargs=(self.options,))
+
+    def process_books(self, jobs, resume=False):
+        """Process every BookJob and return a BookResult for each, in job order.
+
+        A failing book is reported in its result and does not stop the others. resume=True with
+        Parquet outputs raises ValueError, since Parquet files cannot be resumed.
+        """
+        jobs = list(jobs)
+        if resume:
+            # Fail before any work starts rather than once per book
+            parquet = [job.output_file for job in jobs if output_format(job.output_file) == "parquet"]
+            if parquet:
+                raise ValueError(f"Parquet output cannot be resumed: {', '.join(parquet)} (use JSON Lines)")
+        for job in jobs:
+            directory = os.path.dirname(job.output_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        mode = self.mode
+        if mode == "auto":
+            mode = "books" if len(jobs) >= self.workers else "chunks"
+        print(f"Processing {len(jobs)} books on {self.workers} worker processes ({mode} mode)")
+
+        start = time.perf_counter()
+        with self._pool() as pool:
+            if mode == "books":
+                results = self._process_by_book(pool, jobs, resume)
+            else:
+                results = self._process_by_chunk(pool, jobs, resume)
+        elapsed = time.perf_counter() - start
+
+        paragraphs = sum(result.paragraphs for result in results)
+        failed = sum(1 for result in results if result.error)
+        print(f"\n{len(results) - failed}/{len(results)} books, {paragraphs} paragraphs in {elapsed:.1f}s "
+              f"({paragraphs / elapsed if elapsed else 0.0:.1f} paragraphs/s)")
+        return results
+
+    def _report(self, result):
+        status = f"failed: {result.error}" if result.error else f"{result.paragraphs} paragraphs"
+        print(f"{result.pdf_path} -> {result.output_file}: {status} ({result.seconds:.1f}s)")
+
+    def _process_by_book(self, pool, jobs, resume):
+        futures = [pool.submit(_process_book_task, job, resume) for job in jobs]
+        results = []
+        for future in futures:
+            result = future.result()
+            self._report(result)
+            results.append(result)
+        return results
+
+    def _chunk_tasks(self, recommender, jobs, resume):
+        """Yield ('chunk', book, paragraphs) for each chunk of each book, then ('end', book, None)."""
+        for job in jobs:
+            try:
+                writer, journal, completed = recommender.open_report(
+                    job.output_file, resume, include_text=self.options['include_text'])
+            except Exception as e:
+                # Any failure stays with its book, as in books mode
+                book = _OpenBook(job, None, None)
+                book.error = f"{type(e).__name__}: {e}"
+                yield 'end', book, None
+                continue
+            book = _OpenBook(job, writer, journal)
+            paragraphs = recommender.iter_book_paragraphs(job.pdf_path, completed, book.paragraph_count)
+            while True:
+                try:
+                    chunk = list(islice(paragraphs, self.chunk_size))
+                except Exception as e:
+                    # An unreadable PDF fails its book; 'end' still closes the book's writer and journal
+                    book.error = book.error or f"{type(e).__name__}: {e}"
+                    break
+                if not chunk:
+                    break
+                yield 'chunk', book, chunk
+            yield 'end', book, None
+
+    def _process_by_chunk(self, pool, jobs, resume):
+        # The parent only reads PDFs and writes reports; it never runs the NLP pipeline
+        recommender = build_recommender(self.options)
+        tasks = self._chunk_tasks(recommender, jobs, resume)
+        pending = deque()
+
+        def submit(count):
+            for kind, book, chunk in islice(tasks, count):
+                future = pool.submit(_recommend_chunk_task, chunk) if kind == 'chunk' else None
+                pending.append((kind, book, future))
+
+        results = []
+        # Two chunks per worker keeps the pool busy while bounding how far reading runs ahead
+        submit(2 * self.workers)
+        while pending:
+            kind, book, future = pending.popleft()
+            if kind == 'chunk':
+                try:
+                    for result in future.result():
+                        recommender.write_result(book.writer, book.journal, result, book.name)
+                except Exception as e:
+                    book.error = book.error or f"{type(e).__name__}: {e}"
+            else:
+                if book.writer is not None:
+                    book.journal.close(output_file=book.writer if book.writer.resumable else None)
+                    book.writer.close()
+                result = BookResult(book.job.pdf_path, book.job.output_file, book.paragraph_count[0],
+                                    time.perf_counter() - book.started, book.error)
+                self._report(result)
+                results.append(result)
+            submit(1)
+        return results
+
+
+if __name__ == "__main__":
+    # SPOTIFY_CLIENT_ID=... SPOTIFY_CLIENT_SECRET=... python batchProcessing.py <pdf dir or manifest> [output dir] [workers]
+    #     [--resume] [--format=text|jsonl|parquet]
+    from SceneSongs import FILM_COMPOSERS
+
+    flags = [arg for arg in sys.argv[1:] if arg.startswith("--")]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    source = args[0] if args else "books"
+    output_dir = args[1] if len(args) > 1 else None
+    workers = int(args[2]) if len(args) > 2 else None
+    format = next((flag.split("=", 1)[1] for flag in flags if flag.startswith("--format=")), "text")
+
+    processor = BatchProcessor(os.environ.get("SPOTIFY_CLIENT_ID"), os.environ.get("SPOTIFY_CLIENT_SECRET"),
+                               FILM_COMPOSERS, workers=workers)
+    processor.process_books(find_books(source, output_dir, format), resume="--resume" in flags)
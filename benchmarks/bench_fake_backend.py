@@ -0,0 +1,81 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+"""Offline throughput and latency of the scene, story and book recommenders against a fake backend.
+
+No Spotify credentials or network access are needed. The fake catalog is seeded, so repeated runs
+issue the same requests and return the same recommendations. Run from the repository root:
+
+    python benchmarks/bench_fake_backend.py [latency_ms] [--http]
+
+latency_ms is the simulated per-call API latency (default 20). --http serves the fake catalog over a
+local HTTP server and goes through spotipy instead of calling the fake backend in-process.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MusicDirector import EXAMPLE_STORY, ImmersiveStorytellingEngine  # noqa: E402
+from MusicDirectorPDF import BookMusicRecommender  # noqa: E402
+from SceneSongs import EXAMPLE_SCENE, FILM_COMPOSERS, SceneMusicRecommender  # noqa: E402
+from instrumentation import percentile  # noqa: E402
+from musicBackend import FakeMusicBackend, FakeSpotifyServer  # noqa: E402
+from paragraphStore import ParagraphStore  # noqa: E402
+from pdfExtraction import ExtractionCache, PdfTextExtractor  # noqa: E402
+from queryExecutor import QueryExecutor  # noqa: E402
+from queryRanker import QueryRanker  # noqa: E402
+from spotifyCache import AudioFeatureCache, SearchCache  # noqa: E402
+
+
+def timed(fn, items):
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        call_start = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - call_start)
+    return time.perf_counter() - start, sorted(latencies)
+
+
+def report(name, elapsed, latencies, backend):
+    calls = sum(backend.stats()['calls'].values())
+    print(f"{name:<16} {len(latencies) / elapsed:7.2f} req/s   p50 {percentile(latencies, 0.5) * 1000:8.1f} ms   "
+          f"p99 {percentile(latencies, 0.99) * 1000:8.1f} ms   {calls:5d} API calls")
+
+
+def main(latency_ms=20, use_http=False, repeats=3):
+    backend = FakeMusicBackend.synthetic(FILM_COMPOSERS, latency=latency_ms / 1000, seed=0)
+    server = FakeSpotifyServer(backend).start() if use_http else None
+    sp = server.client() if server else backend
+
+    def options():
+        # Fresh memory-only caches and a generous rate limit, so only the backend latency is measured
+        return dict(feature_cache=AudioFeatureCache(path=None), executor=QueryExecutor(requests_per_second=1000), sp=sp)
+
+    try:
+        paragraphs = [p.strip() for p in (EXAMPLE_SCENE + "\n\n" + EXAMPLE_STORY).split("\n\n") if p.strip()]
+
+        backend.calls.clear()
+        scene = SceneMusicRecommender(None, None, FILM_COMPOSERS, query_ranker=QueryRanker(path=None), **options())
+        report("scene", *timed(scene.recommend_for_scene, [EXAMPLE_SCENE] * repeats), backend)
+
+        backend.calls.clear()
+        story = ImmersiveStorytellingEngine(None, None, FILM_COMPOSERS, **options())
+        report("story", *timed(story.process_story, [EXAMPLE_STORY] * repeats), backend)
+
+        backend.calls.clear()
+        book = BookMusicRecommender(None, None, FILM_COMPOSERS, search_cache=SearchCache(path=None),
+                                    paragraph_store=ParagraphStore(path=None),
+                                    pdf_extractor=PdfTextExtractor(cache=ExtractionCache(path=None)), **options())
+        analyses = list(book.analyze_texts(paragraphs * repeats))
+        report("book paragraph", *timed(book.recommend_for_analysis, analyses), backend)
+    finally:
+        if server:
+            server.stop()
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if arg != "--http"]
+    main(int(args[0]) if args else 20, use_http="--http" in sys.argv)
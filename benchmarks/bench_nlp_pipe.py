@@ -0,0 +1,48 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+"""Measure spaCy throughput (paragraphs/sec) for per-paragraph nlp() calls versus batched nlp.pipe.
+
+Run from the repository root:
+
+    python benchmarks/bench_nlp_pipe.py [paragraph_count]
+"""
+
+import multiprocessing
+import os
+import sys
+import time
+
+import spacy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from SceneSongs import EXAMPLE_SCENE  # noqa: E402
+
+# Same components BookMusicRecommender skips
+DISABLED_PIPES = ['lemmatizer']
+
+
+def main(paragraph_count=400, batch_size=32):
+    nlp = spacy.load("en_core_web_sm")
+    base = [p.strip() for p in EXAMPLE_SCENE.split("\n\n") if p.strip()]
+    paragraphs = [base[i % len(base)] for i in range(paragraph_count)]
+
+    start = time.perf_counter()
+    for paragraph in paragraphs:
+        nlp(paragraph)
+    elapsed = time.perf_counter() - start
+    print(f"nlp() per paragraph:            {paragraph_count / elapsed:8.1f} paragraphs/sec")
+
+    process_counts = sorted({1, 2, 4, multiprocessing.cpu_count()})
+    for n_process in process_counts:
+        if n_process > multiprocessing.cpu_count():
+            continue
+        start = time.perf_counter()
+        for _ in nlp.pipe(paragraphs, batch_size=batch_size, n_process=n_process, disable=DISABLED_PIPES):
+            pass
+        elapsed = time.perf_counter() - start
+        print(f"nlp.pipe n_process={n_process:<2}:          {paragraph_count / elapsed:8.1f} paragraphs/sec")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 400)
@@ -0,0 +1,73 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+"""Compare artist-scoped query planning with plain search + client-side filtering.
+
+Runs offline against a synthetic FakeMusicBackend by default; --live uses the real Spotify API:
+
+    python benchmarks/bench_query_planner.py
+    SPOTIFY_CLIENT_ID=... SPOTIFY_CLIENT_SECRET=... python benchmarks/bench_query_planner.py --live
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MusicDirector import EXAMPLE_STORY, ImmersiveStorytellingEngine  # noqa: E402
+from MusicDirectorPDF import BookMusicRecommender  # noqa: E402
+from SceneSongs import EXAMPLE_SCENE, FILM_COMPOSERS, SceneMusicRecommender  # noqa: E402
+from musicBackend import FakeMusicBackend  # noqa: E402
+from paragraphStore import ParagraphStore  # noqa: E402
+from pdfExtraction import ExtractionCache, PdfTextExtractor  # noqa: E402
+from queryExecutor import QueryExecutor  # noqa: E402
+from queryRanker import QueryRanker  # noqa: E402
+from spotifyCache import AudioFeatureCache, SearchCache  # noqa: E402
+
+
+def build(pipeline, sp, artist_scoped, credentials):
+    # Memory-only caches, so every run issues its own searches
+    options = dict(feature_cache=AudioFeatureCache(path=None), executor=QueryExecutor(requests_per_second=1000),
+                   sp=sp, artist_scoped=artist_scoped)
+    if pipeline == "scene":
+        return SceneMusicRecommender(*credentials, FILM_COMPOSERS, query_ranker=QueryRanker(path=None), **options)
+    if pipeline == "story":
+        return ImmersiveStorytellingEngine(*credentials, FILM_COMPOSERS, **options)
+    return BookMusicRecommender(*credentials, FILM_COMPOSERS, search_cache=SearchCache(path=None),
+                                paragraph_store=ParagraphStore(path=None),
+                                pdf_extractor=PdfTextExtractor(cache=ExtractionCache(path=None)), **options)
+
+
+def run(pipeline, recommender):
+    """Run one pipeline on the example text; returns the number of recommendations."""
+    if pipeline == "scene":
+        return len(recommender.recommend_for_scene(EXAMPLE_SCENE))
+    if pipeline == "story":
+        return 1 if recommender.process_story(EXAMPLE_STORY) else 0
+    paragraphs = [p.strip() for p in (EXAMPLE_SCENE + "\n\n" + EXAMPLE_STORY).split("\n\n") if p.strip()]
+    return sum(len(recommender.recommend_for_analysis(analysis)) for analysis in recommender.analyze_texts(paragraphs))
+
+
+def main(live=False):
+    credentials = (os.environ.get("SPOTIFY_CLIENT_ID"), os.environ.get("SPOTIFY_CLIENT_SECRET")) if live else (None, None)
+    for pipeline in ("scene", "story", "book"):
+        for artist_scoped in (False, True):
+            backend = None if live else FakeMusicBackend.synthetic(FILM_COMPOSERS, seed=0)
+            recommender = build(pipeline, backend, artist_scoped, credentials)
+            stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+            try:
+                found = run(pipeline, recommender)
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+            planner = recommender.query_planner.stats()
+            searches = sum(planner[mode]['requests'] for mode in planner)
+            matching = sum(planner[mode]['matching_tracks'] for mode in planner)
+            calls = backend.stats()['calls'] if backend is not None else {}
+            mode = 'scoped' if artist_scoped else 'unscoped'
+            print(f"{pipeline:>5} {mode:>8}: {searches:4d} searches ({planner['fallback']['requests']} fallback), "
+                  f"{sum(calls.values()) if calls else searches:4d} API calls, {matching:4d} matching tracks, "
+                  f"{matching / searches if searches else 0.0:.2f} tracks/search, {found} recommendations")
+
+
+if __name__ == "__main__":
+    main(live="--live" in sys.argv[1:])
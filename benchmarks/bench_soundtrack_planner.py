@@ -0,0 +1,97 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+"""Time SoundtrackPlanner on a synthetic book, and compare its search volume with process_book.
+
+The planning pass runs on random mood targets and track features; the comparison runs both
+pipelines on a generated PDF against the seeded FakeMusicBackend. Run from the repository root:
+
+    python benchmarks/bench_soundtrack_planner.py [--paragraphs 2000] [--pages 20]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from soundtrackPlanner import SoundtrackPlanner  # noqa: E402
+
+
+def time_planning(paragraphs, pool_size, repeat=3):
+    """Best-of-repeat seconds to plan paragraphs against pool_size candidates per chapter."""
+    rng = np.random.default_rng(0)
+    planner = SoundtrackPlanner(pool_size=pool_size)
+    targets = rng.random((paragraphs, 4))
+    features = rng.random((pool_size, 4))
+    track_ids = [f"track{column}" for column in range(pool_size)]
+    timings = []
+    for _ in range(repeat):
+        planner.reset()
+        start = time.perf_counter()
+        for first in range(0, paragraphs, planner.chapter_paragraphs):
+            chapter = targets[first:first + planner.chapter_paragraphs]
+            planner.plan_chapter(planner.unary_costs(chapter, features), features, track_ids)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def compare_searches(pages):
+    """Searches issued by process_book and plan_soundtrack for the same generated book."""
+    from MusicDirectorPDF import BookMusicRecommender
+    from musicBackend import FakeMusicBackend
+    from paragraphStore import ParagraphStore
+    from pdfExtraction import ExtractionCache, PdfTextExtractor
+    from queryExecutor import QueryExecutor
+    from queryRanker import QueryRanker
+    from run_benchmarks import generate_book_pdf
+    from SceneSongs import FILM_COMPOSERS
+    from spotifyCache import AudioFeatureCache, SearchCache
+
+    with tempfile.TemporaryDirectory() as directory:
+        pdf_path = os.path.join(directory, "book.pdf")
+        generate_book_pdf(pdf_path, page_count=pages)
+        searches = {}
+        for name in ("process_book", "plan_soundtrack"):
+            backend = FakeMusicBackend.synthetic(FILM_COMPOSERS)
+            recommender = BookMusicRecommender(
+                None, None, FILM_COMPOSERS, sp=backend, feature_cache=AudioFeatureCache(path=None),
+                search_cache=SearchCache(path=None), paragraph_store=ParagraphStore(path=None),
+                pdf_extractor=PdfTextExtractor(cache=ExtractionCache(path=None)),
+                executor=QueryExecutor(requests_per_second=10000)
+            )
+            stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+            try:
+                start = time.perf_counter()
+                if name == "process_book":
+                    recommender.process_book(pdf_path, os.path.join(directory, "report.txt"))
+                else:
+                    recommender.plan_soundtrack(pdf_path, query_ranker=QueryRanker(path=None))
+                elapsed = time.perf_counter() - start
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+            searches[name] = (backend.stats()['calls'].get('search', 0), elapsed)
+    return searches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, default=2000)
+    parser.add_argument("--pool-size", type=int, default=48)
+    parser.add_argument("--pages", type=int, default=20, help="0 skips the process_book comparison")
+    args = parser.parse_args()
+
+    seconds = time_planning(args.paragraphs, args.pool_size)
+    print(f"planning: {args.paragraphs} paragraphs x {args.pool_size} candidates in {seconds * 1000:.1f} ms")
+    if args.pages:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        for name, (searches, elapsed) in compare_searches(args.pages).items():
+            print(f"{name:>16}: {searches:6d} searches, {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+"""Compare SceneMusicRecommender.analyze_scene against the original per-token WordNet scan.
+
+Run from the repository root:
+
+    python benchmarks/bench_synonym_index.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from SceneSongs import EXAMPLE_SCENE, SceneMusicRecommender  # noqa: E402
+from queryRanker import QueryRanker  # noqa: E402
+from spotifyCache import AudioFeatureCache, SearchCache  # noqa: E402
+
+
+def legacy_elements(recommender, doc):
+    """The original triple loop: every token x every mapping key x a WordNet traversal."""
+    elements = {k: [] for k in recommender.mood_mappings.keys()}
+    for token in doc:
+        for category, mappings in recommender.mood_mappings.items():
+            for key in mappings:
+                if key in token.text or any(syn in token.text for syn in recommender.get_synonyms(key)):
+                    elements[category].append(key)
+    return elements
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main(repeat=5):
+    # Search is never called, so placeholder credentials and memory-only caches are enough
+    recommender = SceneMusicRecommender("benchmark", "benchmark", [], feature_cache=AudioFeatureCache(path=None),
+                                        query_ranker=QueryRanker(path=None), search_cache=SearchCache(path=None))
+    doc = recommender.nlp(EXAMPLE_SCENE.lower())
+
+    def indexed_elements():
+        # Clear the per-token memo so each run pays for the index lookups
+        if recommender._token_matches is not None:
+            recommender._token_matches.cache_clear()
+        return recommender.analyze_scene(EXAMPLE_SCENE)["elements"]
+
+    legacy_time, legacy = best_of(lambda: legacy_elements(recommender, doc), repeat)
+    indexed_time, indexed = best_of(indexed_elements, repeat)
+
+    assert indexed == legacy, "indexed matching diverged from the original scan"
+    print(f"Tokens:       {len(doc)}")
+    print(f"Original:     {legacy_time * 1000:.1f} ms")
+    print(f"Index:        {indexed_time * 1000:.1f} ms (includes spaCy parse)")
+    print(f"Speedup:      {legacy_time / indexed_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+"""End-to-end benchmarks for the book, scene and story pipelines, with per-stage timing.
+
+Each pipeline runs in its own subprocess against the seeded offline FakeMusicBackend. The corpora
+are fixed: EXAMPLE_SCENE, EXAMPLE_STORY and a generated PDF (300 pages by default) built from
+their sentences. For each pipeline, the report records the following:
+
+* wall time
+* exclusive time per stage (pdf_extraction, nlp_parse, synonym_lookup, query_generation, search,
+  feature_lookup, scoring, output_write)
+* API calls
+* cache stats
+* peak RSS
+
+Results are written as JSON so runs can be compared. Run from the repository root:
+
+    python benchmarks/run_benchmarks.py [--pages 300] [--repeats 20] [--latency-ms 5] [--output FILE]
+    python benchmarks/run_benchmarks.py --compare baseline.json current.json
+
+Stage times are exclusive: while a stage calls into a nested stage, only the nested one is charged.
+Searches and feature lookups run on executor threads, so those stages can add up to more than the
+wall time.
+"""
+
+import argparse
+import contextlib
+import inspect
+import json
+import os
+import platform
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+PIPELINES = ("book", "scene", "story")
+LINES_PER_PAGE = 46
+
+
+class StageTimer:
+    """Accumulate exclusive wall time per stage, with a separate stage stack for each thread."""
+
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _charge(self, stage, seconds):
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def enter(self, stage):
+        stack = self._stack()
+        now = time.perf_counter()
+        if stack:
+            # Pause the enclosing stage while the nested one runs
+            self._charge(stack[-1][0], now - stack[-1][1])
+        stack.append([stage, now])
+        with self._lock:
+            self.calls[stage] = self.calls.get(stage, 0) + 1
+
+    def exit(self):
+        stack = self._stack()
+        now = time.perf_counter()
+        stage, started = stack.pop()
+        self._charge(stage, now - started)
+        if stack:
+            stack[-1][1] = now
+
+    def wrap(self, obj, name, stage):
+        """Replace obj.name with a version that charges its time (or each next(), for generators) to stage."""
+        original = getattr(obj, name)
+
+        if inspect.isgeneratorfunction(original):
+            def timed(*args, **kwargs):
+                iterator = original(*args, **kwargs)
+                while True:
+                    self.enter(stage)
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                    finally:
+                        self.exit()
+                    yield item
+        else:
+            def timed(*args, **kwargs):
+                self.enter(stage)
+                try:
+                    return original(*args, **kwargs)
+                finally:
+                    self.exit()
+
+        setattr(obj, name, timed)
+
+    def report(self):
+        with self._lock:
+            return {stage: {"seconds": self.seconds[stage], "calls": self.calls.get(stage, 0)}
+                    for stage in sorted(self.seconds, key=self.seconds.get, reverse=True)}
+
+
+def corpus_sentences():
+    from MusicDirector import EXAMPLE_STORY
+    from SceneSongs import EXAMPLE_SCENE
+
+    text = f"{EXAMPLE_SCENE} {EXAMPLE_STORY}".replace("—", " - ").replace("“", '"').replace("”", '"')
+    text = text.encode("ascii", "ignore").decode("ascii")
+    return [sentence.strip() for sentence in re.split(r"(?<=[.!?])\s+", text) if sentence.strip()]
+
+
+def write_text_pdf(path, pages):
+    """Write a minimal PDF with one Helvetica text line per entry; a " " line separates paragraphs."""
+    objects = [None, None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for lines in pages:
+        operations = [b"BT /F1 11 Tf 14 TL 72 740 Td"]
+        for line in lines:
+            escaped = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            operations.append(b"(" + escaped.encode("latin-1", "replace") + b") Tj T*")
+        operations.append(b"ET")
+        stream = b"\n".join(operations)
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        page_ids.append(len(objects))
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % i for i in page_ids), len(page_ids))
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(output)
+
+
+def generate_book_pdf(path, page_count=300, seed=0):
+    """Generate a reproducible book of paragraphs built from the sample sentences."""
+    rng = random.Random(seed)
+    sentences = corpus_sentences()
+    pages = []
+    lines = []
+    while len(pages) < page_count:
+        paragraph = " ".join(rng.choice(sentences) for _ in range(rng.randint(2, 6)))
+        for line in textwrap.wrap(paragraph, 90) + [" "]:
+            lines.append(line)
+            if len(lines) == LINES_PER_PAGE:
+                pages.append(lines)
+                lines = []
+    write_text_pdf(path, pages[:page_count])
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_pipeline(pipeline, pdf_path, repeats, latency_ms):
+    """Run one pipeline in this process and return its measurements."""
+    import modelRegistry
+    from MusicDirector import EXAMPLE_STORY, ImmersiveStorytellingEngine
+    from MusicDirectorPDF import BookMusicRecommender
+    from SceneSongs import EXAMPLE_SCENE, FILM_COMPOSERS, SceneMusicRecommender
+    from musicBackend import FakeMusicBackend
+    from paragraphStore import ParagraphStore
+    from pdfExtraction import ExtractionCache, PdfTextExtractor
+    from queryExecutor import QueryExecutor
+    from queryRanker import QueryRanker
+    from spotifyCache import AudioFeatureCache, SearchCache
+
+    # Model loading is reported separately so it does not swamp the stage breakdown
+    modelRegistry.get_spacy()
+    modelRegistry.get_wordnet()
+
+    backend = FakeMusicBackend.synthetic(FILM_COMPOSERS, latency=latency_ms / 1000, seed=0)
+    options = dict(feature_cache=AudioFeatureCache(path=None), executor=QueryExecutor(requests_per_second=10000), sp=backend)
+    timer = StageTimer()
+
+    if pipeline == "book":
+        recommender = BookMusicRecommender(None, None, FILM_COMPOSERS, search_cache=SearchCache(path=None),
+                                           paragraph_store=ParagraphStore(path=None),
+                                           pdf_extractor=PdfTextExtractor(cache=ExtractionCache(path=None)), **options)
+        timer.wrap(recommender, "iter_paragraphs_from_pdf", "pdf_extraction")
+        timer.wrap(recommender, "analyze_texts", "nlp_parse")
+        timer.wrap(recommender, "write_result", "output_write")
+    elif pipeline == "scene":
+        # No persisted query history, so every run ranks queries the same way
+        recommender = SceneMusicRecommender(None, None, FILM_COMPOSERS, query_ranker=QueryRanker(path=None), **options)
+        timer.wrap(recommender, "analyze_scene", "nlp_parse")
+        timer.wrap(recommender, "match_mappings", "synonym_lookup")
+    else:
+        recommender = ImmersiveStorytellingEngine(None, None, FILM_COMPOSERS, **options)
+        timer.wrap(recommender, "analyze_text", "nlp_parse")
+    if pipeline != "scene":
+        timer.wrap(recommender, "get_synonyms", "synonym_lookup")
+    # The scene pipeline ranks its candidate queries instead of calling create_music_queries
+    timer.wrap(recommender, "rank_queries" if pipeline == "scene" else "create_music_queries", "query_generation")
+    timer.wrap(recommender.query_planner, "find_tracks", "search")
+    timer.wrap(recommender.feature_cache, "get_features", "feature_lookup")
+    if pipeline == "book":
+        timer.wrap(recommender, "find_matching_songs", "scoring")
+    elif pipeline == "scene":
+        # Scene candidates are scored together in a CandidatePool once the queries are done
+        timer.wrap(recommender, "pool_recommendations", "scoring")
+
+    with tempfile.TemporaryDirectory() as workdir, open(os.devnull, "w") as devnull:
+        # The pipelines print progress; keep it off stdout, which carries the JSON result
+        with contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            if pipeline == "book":
+                recommender.process_book(pdf_path, os.path.join(workdir, "report.txt"))
+                items = timer.calls.get("output_write", 0)
+            elif pipeline == "scene":
+                for _ in range(repeats):
+                    recommender.recommend_for_scene(EXAMPLE_SCENE)
+                items = repeats
+            else:
+                for _ in range(repeats):
+                    recommender.process_story(EXAMPLE_STORY)
+                items = repeats
+            wall = time.perf_counter() - start
+    recommender.executor.shutdown()
+
+    result = {
+        "pipeline": pipeline,
+        "items": items,
+        "wall_seconds": wall,
+        "items_per_second": items / wall if wall else 0.0,
+        "stages": timer.report(),
+        "api_calls": backend.stats()["calls"],
+        "feature_cache": recommender.feature_cache.stats(),
+        "model_load_seconds": {name: seconds for name, seconds in modelRegistry.timings().items()
+                               if not name.startswith("import:")},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if pipeline == "book":
+        result["search_cache"] = recommender.search_cache.stats()
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_summary(results):
+    for result in results["pipelines"].values():
+        print(f"\n{result['pipeline']}: {result['items']} items in {result['wall_seconds']:.2f} s "
+              f"({result['items_per_second']:.2f}/s), {sum(result['api_calls'].values())} API calls, "
+              f"peak RSS {result['peak_rss_mb']:.0f} MB")
+        for stage, timing in result["stages"].items():
+            print(f"  {stage:<18} {timing['seconds']:9.3f} s  {timing['calls']:7d} calls")
+
+
+def compare(baseline_path, current_path):
+    """Print wall-time and per-stage changes between two result files."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(current_path, encoding="utf-8") as f:
+        current = json.load(f)
+
+    def change(old, new):
+        return f"{(new - old) / old * 100:+7.1f}%" if old else "    n/a"
+
+    for pipeline, result in current["pipelines"].items():
+        before = baseline["pipelines"].get(pipeline)
+        if before is None:
+            continue
+        print(f"\n{pipeline}: wall {before['wall_seconds']:.2f} s -> {result['wall_seconds']:.2f} s "
+              f"{change(before['wall_seconds'], result['wall_seconds'])}, "
+              f"API calls {sum(before['api_calls'].values())} -> {sum(result['api_calls'].values())}, "
+              f"peak RSS {before['peak_rss_mb']:.0f} -> {result['peak_rss_mb']:.0f} MB")
+        for stage, timing in result["stages"].items():
+            old = before["stages"].get(stage, {}).get("seconds", 0.0)
+            print(f"  {stage:<18} {old:9.3f} s -> {timing['seconds']:9.3f} s {change(old, timing['seconds'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pipelines", nargs="+", choices=PIPELINES, default=list(PIPELINES))
+    parser.add_argument("--pages", type=int, default=300, help="pages in the generated book PDF")
+    parser.add_argument("--repeats", type=int, default=20, help="scene/story runs per benchmark")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="simulated latency per API call")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="compare two result files")
+    parser.add_argument("--child", choices=PIPELINES, help=argparse.SUPPRESS)
+    parser.add_argument("--pdf", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.child:
+        print(json.dumps(run_pipeline(args.child, args.pdf, args.repeats, args.latency_ms)))
+        return
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {"pages": args.pages, "repeats": args.repeats, "latency_ms": args.latency_ms},
+        "pipelines": {},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        pdf_path = os.path.join(workdir, "book.pdf")
+        generate_book_pdf(pdf_path, args.pages)
+        for pipeline in args.pipelines:
+            # A fresh process per pipeline keeps peak RSS and warm caches from leaking between them
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", pipeline, "--pdf", pdf_path,
+                 "--repeats", str(args.repeats), "--latency-ms", str(args.latency_ms)],
+                capture_output=True, text=True
+            )
+            if completed.returncode != 0:
+                print(f"{pipeline} benchmark failed:\n{completed.stderr}")
+                continue
+            results["pipelines"][pipeline] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    output = args.output or os.path.join(REPO_ROOT, "benchmarks", "results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print_summary(results)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
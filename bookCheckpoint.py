@@ -0,0 +1,84 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+import json
+import os
+
+
+class CheckpointJournal:
+    """Append-only JSON-lines journal of the paragraphs a book run has finished.
+
+    Each entry records a paragraph index, its recommendations and how far the output file
+    had been written at that point. Entries are buffered and fsynced once per batch.
+    """
+
+    def __init__(self, path, flush_every=10):
+        self.path = path
+        self.flush_every = max(1, flush_every)
+        self._pending = []
+        self._file = None
+        self._valid_length = None
+
+    def load(self):
+        """Return (entries by paragraph index, output offset of the last durable entry)."""
+        entries = {}
+        output_offset = 0
+        self._valid_length = 0
+        if not os.path.exists(self.path):
+            return entries, output_offset
+
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("unterminated entry")
+                    entry = json.loads(line)
+                except ValueError:
+                    # A crash mid-write can leave a torn last line; everything before it is intact
+                    break
+                entries[entry['index']] = entry
+                output_offset = entry['output_offset']
+                self._valid_length += len(line)
+        return entries, output_offset
+
+    def open(self, resume=False):
+        """Open the journal for appending, or start a fresh one."""
+        if resume and os.path.exists(self.path):
+            if self._valid_length is None:
+                self.load()
+            # Cut off a torn last line so new entries start on a clean line
+            with open(self.path, 'r+b') as f:
+                f.truncate(self._valid_length)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        else:
+            self._file = open(self.path, 'w', encoding='utf-8')
+
+    def record(self, index, recommendations, output_offset, output_file=None):
+        """Buffer a finished paragraph; flushes (with fsync) every flush_every entries.
+
+        output_file, when given, is fsynced first so the journal never points past durable output.
+        """
+        self._pending.append({
+            'index': index,
+            'recommendations': [rec._asdict() for rec in recommendations],
+            'output_offset': output_offset
+        })
+        if len(self._pending) >= self.flush_every:
+            self.flush(output_file)
+
+    def flush(self, output_file=None):
+        """Write buffered entries and fsync them."""
+        if not self._pending or self._file is None:
+            return
+        if output_file is not None:
+            output_file.flush()
+            os.fsync(output_file.fileno())
+        self._file.write("".join(json.dumps(entry) + "\n" for entry in self._pending))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = []
+
+    def close(self, output_file=None):
+        self.flush(output_file)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
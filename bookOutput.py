@@ -0,0 +1,244 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+import abc
+import json
+import os
+
+from modelRegistry import lazy_import
+
+# Output format by file extension; anything else is the human-readable text report
+FORMATS_BY_EXTENSION = {".jsonl": "jsonl", ".ndjson": "jsonl", ".parquet": "parquet", ".txt": "text"}
+DEFAULT_BUFFER_ROWS = 256
+DEFAULT_ROW_GROUP_ROWS = 4096
+
+RECOMMENDATION_FIELDS = ['track_id', 'title', 'artist', 'spotify_url', 'mood_score']
+
+
+def paragraph_record(result, book=None):
+    """Turn a ParagraphResult into a plain, JSON-serializable record.
+
+    offset and length locate the paragraph in the book's paragraphs joined by blank lines
+    ("\\n\\n".join(recommender.extract_paragraphs_from_pdf(pdf_path))).
+    """
+    return {
+        'book': book,
+        'index': result.index,
+        'page': result.page,
+        'offset': result.offset,
+        'length': len(result.text),
+        'queries': list(result.queries),
+        'recommendations': [{field: getattr(rec, field) for field in RECOMMENDATION_FIELDS}
+                            for rec in result.recommendations],
+        'text': result.text,
+    }
+
+
+def render_text_entry(record):
+    """The classic report entry: a banner, the paragraph and its numbered recommendations."""
+    # Records loaded from a JSON Lines file written without include_text only locate the paragraph
+    text = record.get('text') or f"(page {record['page']}, characters {record['offset']}-{record['offset'] + record['length']})"
+    lines = [f"\n{'=' * 80}\nParagraph {record['index']}:\n{'=' * 80}\n", f"{text}\n\nRecommended Songs:\n{'-' * 50}\n"]
+    if record['recommendations']:
+        for j, rec in enumerate(record['recommendations'], 1):
+            lines.append(f"{j}. \"{rec['title']}\" by {rec['artist']}\n")
+            lines.append(f"   Spotify URL: {rec['spotify_url']}\n")
+            lines.append(f"   Mood Score: {rec['mood_score']:.2f}\n\n")
+    else:
+        lines.append("No matching songs found for this paragraph.\n\n")
+    return "".join(lines)
+
+
+class _BufferedStreamWriter(abc.ABC):
+    """Render records to bytes, buffer them and append them to a file in bulk.
+
+    tell() is the file length once everything written so far is flushed, so a checkpoint can
+    record it and a resumed run can truncate the file back to it. When process_book checkpoints
+    the writer, the journal flushes and fsyncs it every checkpoint_every rows, so writes are batched
+    per checkpoint and buffer_rows only bounds the buffer of writers used without a journal.
+    """
+
+    resumable = True
+
+    def __init__(self, path, resume_offset=None, buffer_rows=DEFAULT_BUFFER_ROWS):
+        if resume_offset is not None and os.path.exists(path):
+            self._file = open(path, 'r+b')
+            # Drop anything written after the last checkpoint; those paragraphs are redone
+            self._file.truncate(resume_offset)
+            self._file.seek(resume_offset)
+            self._offset = resume_offset
+        else:
+            self._file = open(path, 'wb')
+            self._offset = 0
+        self.path = path
+        self.buffer_rows = max(1, buffer_rows)
+        self._buffer = []
+
+    @abc.abstractmethod
+    def render(self, record):
+        """Return a record's text as it appears in the file."""
+
+    def write(self, record):
+        data = self.render(record).encode('utf-8')
+        self._buffer.append(data)
+        self._offset += len(data)
+        if len(self._buffer) >= self.buffer_rows:
+            self.flush()
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        if self._buffer:
+            self._file.write(b"".join(self._buffer))
+            self._buffer = []
+        self._file.flush()
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+
+class TextReportWriter(_BufferedStreamWriter):
+    """The human-readable report, rendered from the same records as the structured formats."""
+
+    def render(self, record):
+        return render_text_entry(record)
+
+
+class JsonLinesWriter(_BufferedStreamWriter):
+    """One JSON object per paragraph; the paragraph text is left out unless include_text=True."""
+
+    def __init__(self, path, resume_offset=None, buffer_rows=DEFAULT_BUFFER_ROWS, include_text=False):
+        super().__init__(path, resume_offset, buffer_rows)
+        self.include_text = include_text
+
+    def render(self, record):
+        if not self.include_text:
+            record = {key: value for key, value in record.items() if key != 'text'}
+        return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def parquet_schema(include_text=False):
+    pa = lazy_import("pyarrow")
+    recommendation = pa.struct([
+        ('track_id', pa.string()), ('title', pa.string()), ('artist', pa.string()),
+        ('spotify_url', pa.string()), ('mood_score', pa.float64()),
+    ])
+    fields = [
+        ('book', pa.string()), ('index', pa.int32()), ('page', pa.int32()), ('offset', pa.int64()),
+        ('length', pa.int32()), ('queries', pa.list_(pa.string())), ('recommendations', pa.list_(recommendation)),
+    ]
+    if include_text:
+        fields.append(('text', pa.string()))
+    return pa.schema(fields)
+
+
+class ParquetWriter:
+    """Columnar output (requires pyarrow); buffered rows are written as one row group at a time.
+
+    A Parquet file is only readable once closed, so it cannot be resumed after a crash; use
+    JSON Lines for long resumable runs and convert_records() afterwards.
+    """
+
+    resumable = False
+
+    def __init__(self, path, row_group_rows=DEFAULT_ROW_GROUP_ROWS, include_text=False):
+        try:
+            self._pa = lazy_import("pyarrow")
+            parquet = lazy_import("pyarrow.parquet")
+        except ImportError:
+            raise ImportError("Parquet output requires pyarrow (pip install pyarrow)")
+        self.path = path
+        self.include_text = include_text
+        self.row_group_rows = max(1, row_group_rows)
+        self.schema = parquet_schema(include_text)
+        self._writer = parquet.ParquetWriter(path, self.schema)
+        self._rows = []
+        self._written = 0
+
+    def write(self, record):
+        self._rows.append(record)
+        if len(self._rows) >= self.row_group_rows:
+            self._write_row_group()
+
+    def _write_row_group(self):
+        if self._rows:
+            self._writer.write_table(self._pa.Table.from_pylist(self._rows, schema=self.schema))
+            self._written += len(self._rows)
+            self._rows = []
+
+    def tell(self):
+        """Rows written so far (a Parquet file has no meaningful resume offset)."""
+        return self._written + len(self._rows)
+
+    def flush(self):
+        # Row groups stay full-sized; buffered rows are written when the group fills or on close
+        pass
+
+    def close(self):
+        if self._writer is not None:
+            self._write_row_group()
+            self._writer.close()
+            self._writer = None
+
+
+def output_format(path, format=None):
+    """Return 'text', 'jsonl' or 'parquet' for an explicit format or the path's extension."""
+    if format is not None:
+        if format not in ("text", "jsonl", "parquet"):
+            raise ValueError(f"Unknown output format: {format}")
+        return format
+    return FORMATS_BY_EXTENSION.get(os.path.splitext(path)[1].lower(), "text")
+
+
+def open_writer(path, format=None, resume_offset=None, include_text=False):
+    """Open a record writer for path; resume_offset continues a resumable file from a checkpoint."""
+    format = output_format(path, format)
+    if format == "parquet":
+        return ParquetWriter(path, include_text=include_text)
+    if format == "jsonl":
+        return JsonLinesWriter(path, resume_offset, include_text=include_text)
+    return TextReportWriter(path, resume_offset)
+
+
+def read_records(path, format=None):
+    """Load every record of a JSON Lines or Parquet output as a list of dicts."""
+    format = output_format(path, format)
+    if format == "parquet":
+        return lazy_import("pyarrow.parquet").read_table(path).to_pylist()
+    if format != "jsonl":
+        raise ValueError(f"Cannot read records back from a {format} report")
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def read_library(paths):
+    """Load the results of many books at once.
+
+    Parquet outputs come back as a single pyarrow Table (read in parallel by pyarrow.dataset);
+    JSON Lines outputs as one list of dicts.
+    """
+    paths = list(paths)
+    if paths and all(output_format(path) == "parquet" for path in paths):
+        return lazy_import("pyarrow.dataset").dataset(paths, format="parquet").to_table()
+    records = []
+    for path in paths:
+        records.extend(read_records(path))
+    return records
+
+
+def convert_records(source, target, format=None, include_text=False):
+    """Rewrite a JSON Lines or Parquet output in another format, e.g. JSONL to Parquet or a text report."""
+    records = read_records(source)
+    writer = open_writer(target, format, include_text=include_text)
+    try:
+        for record in records:
+            writer.write(record)
+    finally:
+        writer.close()
+    return len(records)
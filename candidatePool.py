@@ -0,0 +1,118 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+from collections import namedtuple
+
+import numpy as np
+
+from trackCatalog import FEATURE_NAMES
+
+# mood_score weights per audio feature, by profile name; 'scene' is SceneMusicRecommender's default
+WEIGHT_PROFILES = {
+    'scene': {'valence': 0.3, 'energy': 0.3, 'instrumentalness': 0.2, 'acousticness': 0.2},
+    'ambient': {'valence': 0.1, 'energy': 0.1, 'instrumentalness': 0.4, 'acousticness': 0.4},
+    'driving': {'valence': 0.3, 'energy': 0.5, 'instrumentalness': 0.2, 'acousticness': 0.0},
+    'uplifting': {'valence': 0.6, 'energy': 0.3, 'instrumentalness': 0.1, 'acousticness': 0.0},
+}
+
+PoolEntry = namedtuple('PoolEntry', ['track_id', 'title', 'artist', 'spotify_url', 'reason', 'score'])
+
+
+def weight_vector(profile):
+    """Weights in FEATURE_NAMES order for a profile name or a {feature: weight} dict."""
+    weights = WEIGHT_PROFILES[profile] if isinstance(profile, str) else profile
+    unknown = set(weights) - set(FEATURE_NAMES)
+    if unknown:
+        raise ValueError(f"Unknown audio features in weights: {sorted(unknown)}")
+    return np.array([weights.get(name, 0.0) for name in FEATURE_NAMES], dtype=np.float64)
+
+
+def weighted_score(features, profile):
+    """mood_score of a single feature dict, for callers that score one track at a time."""
+    return float(np.array([features[name] for name in FEATURE_NAMES], dtype=np.float64) @ weight_vector(profile))
+
+
+class CandidatePool:
+    """Every track found for a scene (or a whole chapter), one feature-matrix row per track ID.
+
+    Tracks from any number of queries are added as they arrive; a track found again keeps its
+    first row and match reason. Scores are one matrix-vector product and the top k come from
+    argpartition, so scoring stays cheap however many candidates accumulate.
+    """
+
+    def __init__(self, profile='scene', capacity=64):
+        self.weights = weight_vector(profile)
+        self.track_ids = []
+        self.titles = []
+        self.artists = []
+        self.reasons = []
+        self._rows = {}
+        self._features = np.zeros((max(1, capacity), len(FEATURE_NAMES)), dtype=np.float64)
+
+    def __len__(self):
+        return len(self.track_ids)
+
+    def __contains__(self, track_id):
+        return track_id in self._rows
+
+    def add(self, tracks, features_by_id, reason=None):
+        """Add Spotify track dicts with their audio features; returns how many had features.
+
+        Tracks without audio features cannot be scored and are skipped.
+        """
+        scored = 0
+        for track in tracks:
+            features = features_by_id.get(track['id'])
+            if not features:
+                continue
+            scored += 1
+            if track['id'] in self._rows:
+                continue
+            row = len(self.track_ids)
+            if row == len(self._features):
+                self._features = np.concatenate([self._features, np.zeros_like(self._features)])
+            self._features[row] = [features.get(name, 0.0) for name in FEATURE_NAMES]
+            self._rows[track['id']] = row
+            self.track_ids.append(track['id'])
+            self.titles.append(track['name'])
+            self.artists.append(track['artists'][0]['name'])
+            self.reasons.append(reason)
+        return scored
+
+    @property
+    def features(self):
+        """The (tracks x FEATURE_NAMES) feature matrix."""
+        return self._features[:len(self.track_ids)]
+
+    def scores(self, weights=None):
+        """Score every track; weights (a profile name or dict) overrides the pool's profile."""
+        return self.features @ (self.weights if weights is None else weight_vector(weights))
+
+    def top_rows(self, k=None, weights=None):
+        """Row indices of the k best-scoring tracks (all tracks when k is None), best first."""
+        scores = self.scores(weights)
+        if k is not None and k < len(scores):
+            if k <= 0:
+                return np.array([], dtype=np.int64)
+            top = np.sort(np.argpartition(-scores, k - 1)[:k])
+        else:
+            top = np.arange(len(scores))
+        # Stable on ties, so equal scores keep the order the tracks were found in
+        return top[np.argsort(-scores[top], kind='stable')]
+
+    def top_ids(self, k=None, weights=None):
+        return tuple(self.track_ids[row] for row in self.top_rows(k, weights))
+
+    def top(self, k=None, weights=None):
+        """Return PoolEntry tuples for the k best-scoring tracks, best first."""
+        scores = self.scores(weights)
+        return [
+            PoolEntry(
+                track_id=self.track_ids[row],
+                title=self.titles[row],
+                artist=self.artists[row],
+                spotify_url=f"https://open.spotify.com/track/{self.track_ids[row]}",
+                reason=self.reasons[row],
+                score=float(scores[row]),
+            )
+            for row in self.top_rows(k, weights)
+        ]
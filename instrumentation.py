@@ -0,0 +1,261 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+import functools
+import json
+import sys
+import threading
+import time
+from collections import deque
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(fraction * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class NoopInstrumentation:
+    """Default instrumentation: every call returns immediately and nothing is recorded."""
+
+    enabled = False
+
+    def span(self, name, **attributes):
+        return _NULL_SPAN
+
+    def count(self, name, value=1):
+        pass
+
+    def observe(self, name, value):
+        pass
+
+    def register_gauge(self, name, callback):
+        pass
+
+    def snapshot(self):
+        return {}
+
+    def flush(self):
+        pass
+
+
+NOOP = NoopInstrumentation()
+
+
+def traced(name):
+    """Decorate a method so each call runs inside self.instrumentation.span(name)."""
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.instrumentation.span(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class Histogram:
+    """Count, sum, min and max of every observation, plus percentiles over a window of recent ones."""
+
+    def __init__(self, window=4096):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+        self._recent = deque(maxlen=window)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+        self._recent.append(value)
+
+    def summary(self):
+        recent = sorted(self._recent)
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "min": self.minimum,
+            "max": self.maximum,
+            "p50": percentile(recent, 0.50),
+            "p90": percentile(recent, 0.90),
+            "p99": percentile(recent, 0.99),
+        }
+
+
+class Span:
+    """A timed operation; its duration is recorded as the histogram "<name>.seconds"."""
+
+    def __init__(self, instrumentation, name, attributes):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.attributes = attributes
+        self.parent = None
+        self.start = None
+        self.duration = None
+        self.error = None
+
+    def set(self, **attributes):
+        """Attach attributes discovered while the span runs (e.g. result counts)."""
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        stack = self.instrumentation._stack()
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.start = time.time()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.duration = time.perf_counter() - self._started
+        self.instrumentation._stack().pop()
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        self.instrumentation._finish(self)
+        return False
+
+    def to_dict(self):
+        return {
+            "type": "span",
+            "name": self.name,
+            "parent": self.parent,
+            "start": self.start,
+            "duration_ms": self.duration * 1000,
+            "thread": threading.current_thread().name,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class Instrumentation:
+    """Spans, counters and histograms, sent to zero or more exporters.
+
+    Finished spans go to every exporter as they end; counters, histograms and registered gauges are
+    aggregated in memory and exported by flush(). All methods are thread-safe.
+    """
+
+    enabled = True
+
+    def __init__(self, exporters=(), histogram_window=4096):
+        self.exporters = list(exporters)
+        self.histogram_window = histogram_window
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self):
+        if not hasattr(self._local, "spans"):
+            self._local.spans = []
+        return self._local.spans
+
+    def span(self, name, **attributes):
+        return Span(self, name, attributes)
+
+    def _finish(self, span):
+        self.observe(f"{span.name}.seconds", span.duration)
+        if span.error is not None:
+            self.count(f"{span.name}.errors")
+        for exporter in self.exporters:
+            exporter.export_span(span.to_dict())
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram(self.histogram_window)
+            histogram.observe(value)
+
+    def register_gauge(self, name, callback):
+        """Report callback() under name in every snapshot, e.g. a cache's stats()."""
+        with self._lock:
+            self._gauges[name] = callback
+
+    def snapshot(self):
+        """Return current counters, histogram summaries and gauge values."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {name: histogram.summary() for name, histogram in self._histograms.items()}
+            gauges = dict(self._gauges)
+        return {
+            "counters": counters,
+            "histograms": histograms,
+            "gauges": {name: callback() for name, callback in gauges.items()},
+        }
+
+    def flush(self):
+        """Send a metrics snapshot to every exporter."""
+        snapshot = dict(self.snapshot(), type="metrics", time=time.time())
+        for exporter in self.exporters:
+            exporter.export_metrics(snapshot)
+
+
+class InMemoryCollector:
+    """Exporter that keeps every span and metrics snapshot in lists, for tests."""
+
+    def __init__(self):
+        self.spans = []
+        self.metrics = []
+        self._lock = threading.Lock()
+
+    def export_span(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def export_metrics(self, snapshot):
+        with self._lock:
+            self.metrics.append(snapshot)
+
+    def span_names(self):
+        with self._lock:
+            return [span["name"] for span in self.spans]
+
+
+class JsonLogExporter:
+    """Exporter that writes one JSON object per line to a stream or file."""
+
+    def __init__(self, target=None):
+        if isinstance(target, str):
+            self._stream = open(target, "a", encoding="utf-8")
+            self._owns_stream = True
+        else:
+            self._stream = target if target is not None else sys.stderr
+            self._owns_stream = False
+        self._lock = threading.Lock()
+
+    def _write(self, record):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            self._stream.write(line)
+            self._stream.flush()
+
+    def export_span(self, span):
+        self._write(span)
+
+    def export_metrics(self, snapshot):
+        self._write(snapshot)
+
+    def close(self):
+        if self._owns_stream:
+            self._stream.close()
@@ -0,0 +1,98 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+import importlib
+import threading
+import time
+
+# Models and heavy modules are loaded on first use, once per process, and shared by every recommender.
+# _lock only guards the dicts; each model has its own lock, held while it loads, so a slow load
+# never blocks other models or imports.
+_lock = threading.Lock()
+_load_locks = {}
+_models = {}
+_timings = {}
+
+DEFAULT_SPACY_MODEL = "en_core_web_sm"
+
+
+def record_timing(name, seconds):
+    """Record how long an import or model load took."""
+    with _lock:
+        _timings[name] = seconds
+
+
+def lazy_import(module_name):
+    """Import a module on first use and record how long the import took."""
+    key = f"import:{module_name}"
+    module = _models.get(key)
+    if module is None:
+        # importlib is thread-safe on its own; holding a lock here could deadlock with the import lock
+        start = time.perf_counter()
+        module = importlib.import_module(module_name)
+        seconds = time.perf_counter() - start
+        with _lock:
+            if key not in _models:
+                _models[key] = module
+                _timings[key] = seconds
+    return module
+
+
+def _load_once(key, loader):
+    if key in _models:
+        return _models[key]
+    with _lock:
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+    with load_lock:
+        # Another thread may have finished loading while this one waited
+        if key not in _models:
+            start = time.perf_counter()
+            model = loader()
+            seconds = time.perf_counter() - start
+            with _lock:
+                _models[key] = model
+                _timings[key] = seconds
+        return _models[key]
+
+
+def get_spacy(name=DEFAULT_SPACY_MODEL):
+    """Return the shared spaCy pipeline."""
+    return _load_once(f"spacy:{name}", lambda: lazy_import("spacy").load(name))
+
+
+def get_wordnet():
+    """Return the WordNet corpus reader, downloading the corpus only if it is missing."""
+    def load():
+        nltk = lazy_import("nltk")
+        from nltk.corpus import wordnet
+        try:
+            wordnet.ensure_loaded()
+        except LookupError:
+            nltk.download('wordnet', quiet=True)
+            wordnet.ensure_loaded()
+        return wordnet
+    return _load_once("wordnet", load)
+
+
+def get_sentiment_pipeline(task="sentiment-analysis", model=None):
+    """Return the shared Hugging Face sentiment pipeline."""
+    def load():
+        transformers = lazy_import("transformers")
+        return transformers.pipeline(task, model=model) if model else transformers.pipeline(task)
+    return _load_once(f"transformers:{task}:{model or 'default'}", load)
+
+
+def is_loaded(key):
+    with _lock:
+        return key in _models
+
+
+def timings():
+    """Return a copy of the recorded import and first-load latencies, in seconds."""
+    with _lock:
+        return dict(_timings)
+
+
+def report():
+    """Print import and first-call latencies, slowest first."""
+    for name, seconds in sorted(timings().items(), key=lambda item: item[1], reverse=True):
+        print(f"{name:<50} {seconds * 1000:9.1f} ms")
@@ -0,0 +1,346 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+import abc
+import functools
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from modelRegistry import lazy_import
+from queryExecutor import SPOTIPY_STATUS_FORCELIST, build_spotify_client
+
+# Matches an artist:"Name" (or artist:Name) filter inside a search query
+ARTIST_FILTER = re.compile(r'artist:(?:"([^"]*)"|(\S+))', re.IGNORECASE)
+
+
+class BackendError(Exception):
+    """API error raised by the fake backends, shaped like spotipy's SpotifyException."""
+
+    def __init__(self, http_status, msg, headers=None):
+        super().__init__(f"http status: {http_status}, {msg}")
+        self.http_status = http_status
+        self.msg = msg
+        self.headers = headers or {}
+
+
+class MusicBackend(abc.ABC):
+    """Search, audio features and track metadata, with spotipy's method names and response shapes.
+
+    Recommenders accept any backend as sp=; the default is a SpotipyBackend built from the credentials.
+    A backend missing one of these methods cannot be created.
+    """
+
+    @abc.abstractmethod
+    def search(self, q, limit=10, offset=0, type='track'):
+        """Return a spotipy-shaped search response."""
+
+    @abc.abstractmethod
+    def audio_features(self, tracks):
+        """Return one feature dict (or None) per track ID, in order."""
+
+    @abc.abstractmethod
+    def track(self, track_id):
+        """Return a spotipy-shaped track dict."""
+
+
+class SpotipyBackend(MusicBackend):
+    """The real Spotify Web API through spotipy; other spotipy methods pass straight through."""
+
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def from_credentials(cls, spotify_client_id, spotify_client_secret):
+        return cls(build_spotify_client(spotify_client_id, spotify_client_secret))
+
+    def search(self, q, limit=10, offset=0, type='track'):
+        return self.client.search(q=q, limit=limit, offset=offset, type=type)
+
+    def audio_features(self, tracks):
+        return self.client.audio_features(tracks)
+
+    def track(self, track_id):
+        return self.client.track(track_id)
+
+    def __getattr__(self, name):
+        # artist_albums, album_tracks, next, ... (used by the catalog builder). client is looked up
+        # in __dict__, so a half-built instance (e.g. while unpickling) raises instead of recursing
+        client = self.__dict__.get('client')
+        if client is None:
+            raise AttributeError(name)
+        return getattr(client, name)
+
+
+def fake_track_id(*parts):
+    """Deterministic 22-character base-62 ID, like Spotify's."""
+    digest = int(hashlib.sha1("/".join(parts).encode("utf-8")).hexdigest(), 16)
+    alphabet = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+    chars = []
+    for _ in range(22):
+        digest, remainder = divmod(digest, 62)
+        chars.append(alphabet[remainder])
+    return "".join(chars)
+
+
+class FakeMusicBackend(MusicBackend):
+    """In-process, fixture-backed backend with configurable latency and error injection.
+
+    A search matches tracks whose title, album or tags contain any query word, honouring an
+    artist:"..." filter. Every call sleeps latency (+ up to jitter) seconds. Calls fail with a 429
+    (with Retry-After) at rate_limit_rate and with a 503 at error_rate, drawn from a seeded RNG.
+    """
+
+    def __init__(self, tracks, features, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit_rate=0.0,
+                 retry_after=1, seed=0):
+        self.tracks = {track['id']: track for track in tracks}
+        self.features = features
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.errors = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        # Word -> track IDs, built once so searches stay cheap on large fixtures
+        self._index = {}
+        for track in tracks:
+            words = set(re.findall(r"[a-z0-9']+", f"{track['name']} {track['album']['name']} {' '.join(track.get('tags', ()))}".lower()))
+            for word in words:
+                self._index.setdefault(word, []).append(track['id'])
+        self._order = {track_id: position for position, track_id in enumerate(self.tracks)}
+
+    @classmethod
+    def synthetic(cls, artists, tracks_per_artist=40, seed=0, **options):
+        """Generate a reproducible catalog whose titles use mood words and whose features match them."""
+        mood_targets = lazy_import("trackCatalog").MOOD_TARGETS
+        nouns = ["Horizon", "Rain", "Memory", "Light", "Echoes", "Night", "River", "Storm", "Silence", "Dawn",
+                 "City", "Ocean", "Forest", "Dream", "Journey", "Home", "Winter", "Fire", "Shadows", "Stars"]
+        moods = sorted(mood_targets)
+        rng = random.Random(seed)
+        tracks = []
+        features = {}
+        for artist in artists:
+            for number in range(tracks_per_artist):
+                mood = rng.choice(moods)
+                name = f"{mood.title()} {rng.choice(nouns)}"
+                track_id = fake_track_id(artist, str(number), name)
+                tracks.append({
+                    'id': track_id,
+                    'name': name,
+                    'artists': [{'name': artist}],
+                    'album': {'name': f"{rng.choice(nouns)} {rng.choice(['Suite', 'Sessions', 'Soundtrack'])}"},
+                    'preview_url': f"https://p.scdn.co/mp3-preview/{track_id}" if rng.random() < 0.8 else None,
+                    'duration_ms': rng.randint(90, 360) * 1000,
+                    'tags': [mood],
+                })
+                valence, energy, instrumentalness, acousticness = (
+                    min(1.0, max(0.0, value + rng.uniform(-0.1, 0.1))) for value in mood_targets[mood]
+                )
+                features[track_id] = {
+                    'id': track_id, 'valence': valence, 'energy': energy,
+                    'instrumentalness': instrumentalness, 'acousticness': acousticness,
+                    'tempo': rng.uniform(60, 160),
+                }
+        return cls(tracks, features, seed=seed, **options)
+
+    @classmethod
+    def from_fixture(cls, path, **options):
+        """Load tracks and audio features saved with save_fixture."""
+        with open(path, 'r', encoding='utf-8') as f:
+            fixture = json.load(f)
+        return cls(fixture['tracks'], fixture['audio_features'], **options)
+
+    def save_fixture(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'tracks': list(self.tracks.values()), 'audio_features': self.features}, f)
+
+    def _call(self, method):
+        with self._lock:
+            self.calls[method] += 1
+            roll = self._random.random()
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+        if roll < self.rate_limit_rate:
+            with self._lock:
+                self.errors[429] += 1
+            raise BackendError(429, "API rate limit exceeded", {'Retry-After': str(self.retry_after)})
+        if roll < self.rate_limit_rate + self.error_rate:
+            with self._lock:
+                self.errors[503] += 1
+            raise BackendError(503, "Service unavailable")
+
+    def _public_track(self, track):
+        return {key: value for key, value in track.items() if key != 'tags'}
+
+    def search(self, q, limit=10, offset=0, type='track'):
+        self._call('search')
+        artist_names = {(quoted or bare).lower() for quoted, bare in ARTIST_FILTER.findall(q)}
+        words = re.findall(r"[a-z0-9']+", ARTIST_FILTER.sub(" ", q).lower())
+
+        if type == 'artist':
+            names = sorted({artist['name'] for track in self.tracks.values() for artist in track['artists']
+                            if not artist_names or artist['name'].lower() in artist_names})
+            items = [{'id': fake_track_id('artist', name), 'name': name} for name in names]
+            return {'artists': self._page(items, limit, offset)}
+
+        scores = Counter()
+        for word in set(words):
+            for track_id in self._index.get(word, ()):
+                scores[track_id] += 1
+        if not words and artist_names:
+            scores.update(self.tracks)
+        matches = [
+            self.tracks[track_id]
+            for track_id in sorted(scores, key=lambda track_id: (-scores[track_id], self._order[track_id]))
+            if not artist_names or any(a['name'].lower() in artist_names for a in self.tracks[track_id]['artists'])
+        ]
+        return {'tracks': self._page([self._public_track(track) for track in matches], limit, offset)}
+
+    @staticmethod
+    def _page(items, limit, offset):
+        return {'items': items[offset:offset + limit], 'total': len(items), 'limit': limit, 'offset': offset,
+                'next': None, 'previous': None}
+
+    def audio_features(self, tracks):
+        self._call('audio_features')
+        if isinstance(tracks, str):
+            tracks = [tracks]
+        return [self.features.get(track_id) for track_id in tracks]
+
+    def track(self, track_id):
+        self._call('track')
+        if track_id not in self.tracks:
+            raise BackendError(404, "non existing id")
+        return self._public_track(self.tracks[track_id])
+
+    def stats(self):
+        with self._lock:
+            return {'calls': dict(self.calls), 'errors': dict(self.errors)}
+
+
+class FakeSpotifyServer:
+    """Serve a FakeMusicBackend over HTTP in the shape of the Spotify Web API.
+
+    client() returns a spotipy client whose prefix points at server.url, to exercise the real HTTP
+    client path (connection pooling, JSON decoding, error headers) offline.
+    """
+
+    def __init__(self, backend, host="127.0.0.1", port=0):
+        self.backend = backend
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1/"
+
+    def _make_handler(self):
+        backend = self.backend
+
+        class FakeSpotifyHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send_json(self, status, body, headers=None):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                path = url.path.rstrip("/")
+                try:
+                    if path == "/v1/search":
+                        body = backend.search(params.get('q', ''), limit=int(params.get('limit', 10)),
+                                              offset=int(params.get('offset', 0)), type=params.get('type', 'track'))
+                    elif path == "/v1/audio-features":
+                        ids = [track_id for track_id in params.get('ids', '').split(",") if track_id]
+                        body = {'audio_features': backend.audio_features(ids)}
+                    elif path.startswith("/v1/tracks/"):
+                        body = backend.track(path.rsplit("/", 1)[1])
+                    else:
+                        raise BackendError(404, "Service not found")
+                except BackendError as e:
+                    self._send_json(e.http_status, {'error': {'status': e.http_status, 'message': e.msg}}, e.headers)
+                    return
+                self._send_json(200, body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return FakeSpotifyHandler
+
+    def client(self):
+        """A spotipy client for this server, configured like build_spotify_client."""
+        client = lazy_import("spotipy").Spotify(auth="fake", retries=0, status_forcelist=SPOTIPY_STATUS_FORCELIST)
+        client.prefix = self.url
+        return client
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-spotify", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class InstrumentedBackend(MusicBackend):
+    """Record a span (and so a latency histogram) for every API call, and count errors by status."""
+
+    def __init__(self, backend, instrumentation):
+        self.backend = backend
+        self.instrumentation = instrumentation
+
+    def _call(self, name, method, *args, **kwargs):
+        with self.instrumentation.span(f"spotify.{name}"):
+            try:
+                return method(*args, **kwargs)
+            except Exception as e:
+                self.instrumentation.count(f"spotify.http_{getattr(e, 'http_status', 'error')}")
+                raise
+
+    def search(self, q, limit=10, offset=0, type='track'):
+        return self._call('search', self.backend.search, q=q, limit=limit, offset=offset, type=type)
+
+    def audio_features(self, tracks):
+        return self._call('audio_features', self.backend.audio_features, tracks)
+
+    def track(self, track_id):
+        return self._call('track', self.backend.track, track_id)
+
+    def __getattr__(self, name):
+        backend = self.__dict__.get('backend')
+        if backend is None:
+            raise AttributeError(name)
+        attribute = getattr(backend, name)
+        if not callable(attribute):
+            return attribute
+        return functools.partial(self._call, name, attribute)
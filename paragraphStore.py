@@ -0,0 +1,80 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+import hashlib
+import json
+import threading
+import unicodedata
+
+from spotifyCache import DEFAULT_CACHE_PATH, DEFAULT_SEARCH_TTL, _DiskStore
+
+# Bump when the stored result layout or the analysis itself changes, so old entries stop matching
+RESULT_VERSION = 1
+
+
+def normalize_paragraph(text):
+    """Canonical form of a paragraph: Unicode NFKC with all whitespace runs collapsed to one space.
+
+    Re-flowed lines, different page breaks and typographic ligatures in a new draft do not count as edits.
+    """
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def config_fingerprint(config):
+    """Short stable hash of everything (besides the text) that decides a paragraph's results."""
+    payload = json.dumps(dict(config, version=RESULT_VERSION), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class ParagraphStore:
+    """Content-addressed results per paragraph, for incremental runs over revised manuscripts.
+
+    Entries are keyed by a hash of the normalized paragraph text and the recommender's config
+    fingerprint, so a paragraph is reused wherever it appears (any book, any position) as long as
+    its text and the config are unchanged. path=None keeps entries in memory only. Entries expire
+    with the search cache they were derived from.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_SEARCH_TTL):
+        self.store = _DiskStore(path, "paragraph_results", ttl) if path else None
+        # Only used without a disk tier; a run looks each paragraph up once, so caching disk rows gains nothing
+        self._memory = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(text, fingerprint):
+        digest = hashlib.sha256(normalize_paragraph(text).encode("utf-8")).hexdigest()
+        return f"{fingerprint}:{digest}"
+
+    def get_many(self, keys):
+        """Return a dict of key -> stored result for the keys that are present."""
+        if self.store is not None:
+            found = self.store.get_many(list(dict.fromkeys(keys)))
+        else:
+            with self._lock:
+                found = {key: self._memory[key] for key in keys if key in self._memory}
+        with self._lock:
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, items):
+        """Store (key, result) pairs; a result is {"queries": [...], "recommendations": [{...}, ...]}."""
+        items = list(items)
+        if not items:
+            return
+        if self.store is not None:
+            self.store.put_many(items)
+        else:
+            with self._lock:
+                self._memory.update(items)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,240 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+import hashlib
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from modelRegistry import lazy_import
+from spotifyCache import DEFAULT_CACHE_PATH, _DiskStore
+
+DEFAULT_PAGES_PER_TASK = 16
+# Pages (and page counts) kept by a memory-only ExtractionCache
+DEFAULT_MEMORY_ENTRIES = 4096
+# Bump when extraction changes, so text extracted by an older version is redone
+EXTRACTION_VERSION = 1
+
+# One page's text; error is None unless the page could not be extracted (text is then "")
+PageText = namedtuple('PageText', ['number', 'text', 'error'])
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-256 of a file's contents, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def extract_page_range(pdf_path, first, last):
+    """Extract pages first..last (1-based, inclusive) of a PDF as PageTexts.
+
+    A page that fails is reported in its PageText; the other pages are still extracted.
+    Runs in the extraction process pool, where each task opens the PDF itself.
+    """
+    with open(pdf_path, 'rb') as file:
+        pages = lazy_import("PyPDF2").PdfReader(file).pages
+        results = []
+        for number in range(first, last + 1):
+            try:
+                results.append(PageText(number, pages[number - 1].extract_text() or "", None))
+            except Exception as e:
+                results.append(PageText(number, "", f"{type(e).__name__}: {e}"))
+        return results
+
+
+class ExtractionCache:
+    """Extracted page text keyed by the PDF's content hash, in the shared SQLite cache file.
+
+    A book that is processed again (with other artists, weights or settings) skips extraction;
+    any edit to the file changes its hash. Failed pages are not stored, so they are retried.
+    path=None keeps the text in memory only, for the max_entries most recently used pages.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MEMORY_ENTRIES):
+        # Text extracted from a given file never goes stale
+        self.store = _DiskStore(path, "pdf_text", ttl=0) if path else None
+        self.max_entries = max(1, max_entries)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def document_key(digest):
+        pypdf_version = getattr(lazy_import("PyPDF2"), "__version__", "")
+        return f"v{EXTRACTION_VERSION}:{pypdf_version}:{digest}"
+
+    def _get_many(self, keys):
+        if self.store is not None:
+            return self.store.get_many(keys)
+        with self._lock:
+            found = {}
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+            return found
+
+    def _put_many(self, items):
+        if self.store is not None:
+            self.store.put_many(items)
+        else:
+            with self._lock:
+                # An evicted page is extracted again; iter_pages only trusts the pages it finds
+                for key, value in items:
+                    self._memory[key] = value
+                    self._memory.move_to_end(key)
+                while len(self._memory) > self.max_entries:
+                    self._memory.popitem(last=False)
+
+    def page_count(self, key):
+        """Number of pages recorded for a document, or None if it has not been extracted before."""
+        entry = self._get_many([key]).get(key)
+        return entry['pages'] if entry else None
+
+    def get_pages(self, key, numbers):
+        """Return {page number: text} for the stored pages among numbers."""
+        stored = self._get_many([f"{key}:{number}" for number in numbers])
+        return {number: stored[f"{key}:{number}"] for number in numbers if f"{key}:{number}" in stored}
+
+    def put_pages(self, key, page_count, pages):
+        """Store a document's page count and its successfully extracted PageTexts."""
+        items = [(f"{key}:{page.number}", page.text) for page in pages if page.error is None]
+        self._put_many([(key, {'pages': page_count})] + items)
+
+
+class PdfTextExtractor:
+    """Extract a PDF's text page by page, spreading page ranges over worker processes.
+
+    iter_pages yields PageTexts in page order while later ranges are still being extracted, with at
+    most two ranges per worker in flight, so memory stays bounded on long books. A page that fails is
+    reported (printed and returned with its error) instead of ending the book. Pages are cached by
+    the PDF's content hash, so a book that was extracted before is read from the cache instead.
+
+    workers=None uses one process per core; workers <= 1, or a PDF of at most pages_per_task pages,
+    is extracted in this process. The pool is started for a document that needs it and shut down
+    when no document is being extracted any more. The default cache is an ExtractionCache on the shared cache file;
+    pass ExtractionCache(path=None) to keep extracted text in memory only.
+    """
+
+    def __init__(self, workers=None, pages_per_task=DEFAULT_PAGES_PER_TASK, cache=None):
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.pages_per_task = max(1, pages_per_task)
+        self.cache = cache if cache is not None else ExtractionCache()
+        self._pool = None
+        self._active = 0
+        self._lock = threading.Lock()
+        self.documents = 0
+        self.cached_pages = 0
+        self.extracted_pages = 0
+        self.failed_pages = 0
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn, not fork: the parent may hold threads, SQLite connections and a loaded model
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def page_count(self, pdf_path):
+        with open(pdf_path, 'rb') as file:
+            return len(lazy_import("PyPDF2").PdfReader(file).pages)
+
+    def _extract(self, pdf_path, ranges):
+        """Yield the PageTexts of each (first, last) range, in order."""
+        if self.workers <= 1 or len(ranges) <= 1:
+            for first, last in ranges:
+                yield from extract_page_range(pdf_path, first, last)
+            return
+        pool = self._get_pool()
+        pending = deque()
+        ranges = iter(ranges)
+        try:
+            for first, last in ranges:
+                pending.append(pool.submit(extract_page_range, pdf_path, first, last))
+                if len(pending) >= 2 * self.workers:
+                    break
+            while pending:
+                pages = pending.popleft().result()
+                for first, last in ranges:
+                    pending.append(pool.submit(extract_page_range, pdf_path, first, last))
+                    break
+                yield from pages
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def iter_pages(self, pdf_path):
+        """Yield a PageText for every page of a PDF, in order.
+
+        Raises if the PDF cannot be opened at all; failures of single pages are reported and skipped.
+        """
+        key = self.cache.document_key(file_digest(pdf_path))
+        page_count = self.cache.page_count(key)
+        cached = self.cache.get_pages(key, range(1, page_count + 1)) if page_count is not None else {}
+        if page_count is None:
+            page_count = self.page_count(pdf_path)
+        with self._lock:
+            self.documents += 1
+            self.cached_pages += len(cached)
+
+        # Consecutive uncached pages are grouped into ranges of up to pages_per_task pages
+        ranges = []
+        for number in range(1, page_count + 1):
+            if number in cached:
+                continue
+            if ranges and ranges[-1][1] == number - 1 and number - ranges[-1][0] < self.pages_per_task:
+                ranges[-1] = (ranges[-1][0], number)
+            else:
+                ranges.append((number, number))
+
+        with self._lock:
+            self._active += 1
+        extracted = self._extract(pdf_path, ranges)
+        fresh = []
+        try:
+            for number in range(1, page_count + 1):
+                if number in cached:
+                    yield PageText(number, cached.pop(number), None)
+                    continue
+                page = next(extracted)
+                if page.error is not None:
+                    print(f"Error extracting page {page.number} of {pdf_path}: {page.error}")
+                with self._lock:
+                    if page.error is None:
+                        self.extracted_pages += 1
+                    else:
+                        self.failed_pages += 1
+                fresh.append(page)
+                if len(fresh) >= self.pages_per_task:
+                    self.cache.put_pages(key, page_count, fresh)
+                    fresh = []
+                yield page
+            self.cache.put_pages(key, page_count, fresh)
+        finally:
+            extracted.close()
+            pool = None
+            with self._lock:
+                self._active -= 1
+                if self._active == 0:
+                    pool, self._pool = self._pool, None
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "documents": self.documents,
+                "cached_pages": self.cached_pages,
+                "extracted_pages": self.extracted_pages,
+                "failed_pages": self.failed_pages,
+            }
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,346 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from modelRegistry import lazy_import
+from spotifyCache import DEFAULT_CACHE_PATH, DEFAULT_NEGATIVE_TTL, DEFAULT_TTL, _DiskStore, track_key
+
+DEFAULT_PREVIEW_DIR = os.path.join(os.path.dirname(DEFAULT_CACHE_PATH), "previews")
+DEFAULT_DOWNLOAD_WORKERS = 8
+DEFAULT_DOWNLOAD_TIMEOUT = 15
+# purge() leaves younger blobs alone, as another process may be about to record them
+DEFAULT_PURGE_MIN_AGE = 60 * 60
+FRAME_SIZE = 2048
+HOP_SIZE = 512
+MIN_BPM = 60.0
+MAX_BPM = 180.0
+TEMPO_PRIOR_BPM = 120.0
+# Spectral centroids above this count as fully bright
+BRIGHTNESS_CEILING_HZ = 5000.0
+# Bump when pcm_features changes, so features measured by an older version are recomputed
+FEATURE_VERSION = 1
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def preview_session(pool_size=DEFAULT_DOWNLOAD_WORKERS):
+    """Shared requests session with a connection pool and retries on 429 and 5xx responses."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            requests = lazy_import("requests")
+            retry = lazy_import("urllib3.util.retry").Retry(
+                total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504), respect_retry_after_header=True
+            )
+            adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+            _session = requests.Session()
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def pcm_features(samples, sample_rate):
+    """Estimate energy, tempo, brightness and a valence proxy from mono PCM samples in [-1, 1].
+
+    Every step works on whole (frames x bins) arrays: RMS loudness for energy, the spectral
+    centroid for brightness, and the autocorrelation of spectral flux (onset strength) for tempo.
+    valence is a crude proxy: bright, fast audio tends to sound positive.
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    if len(samples) < FRAME_SIZE:
+        samples = np.pad(samples, (0, FRAME_SIZE - len(samples)))
+    frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME_SIZE)[::HOP_SIZE]
+
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+    loudness = 20 * np.log10(np.mean(rms) + 1e-10)
+    energy = float(np.clip((loudness + 60) / 60, 0.0, 1.0))
+
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(FRAME_SIZE), axis=1))
+    frequencies = np.fft.rfftfreq(FRAME_SIZE, 1.0 / sample_rate)
+    magnitude = spectrum.sum(axis=1)
+    centroids = (spectrum @ frequencies) / np.maximum(magnitude, 1e-10)
+    # Louder frames dominate, so near-silent gaps do not drag the average around
+    centroid = np.average(centroids, weights=rms + 1e-10)
+    brightness = float(np.clip(centroid / BRIGHTNESS_CEILING_HZ, 0.0, 1.0))
+
+    onsets = np.maximum(np.diff(np.log1p(spectrum), axis=0), 0.0).sum(axis=1)
+    onsets = onsets - onsets.mean() if len(onsets) else onsets
+    frame_rate = sample_rate / HOP_SIZE
+    min_lag = max(1, int(60.0 * frame_rate / MAX_BPM))
+    max_lag = int(60.0 * frame_rate / MIN_BPM)
+    if len(onsets) > max_lag:
+        # Autocorrelation through the FFT: O(n log n) instead of a lag-by-lag loop
+        transform = np.fft.rfft(onsets, n=2 * len(onsets))
+        autocorrelation = np.fft.irfft(transform * np.conj(transform))[:len(onsets)]
+        lags = np.arange(min_lag, max_lag + 1)
+        # A log-normal prior around 120 BPM breaks the tie between a tempo and half of it
+        prior = np.exp(-0.5 * np.square(np.log2(60.0 * frame_rate / lags / TEMPO_PRIOR_BPM)))
+        lag = lags[int(np.argmax(autocorrelation[min_lag:max_lag + 1] * prior))]
+        tempo = 60.0 * frame_rate / lag
+    else:
+        tempo = (MIN_BPM + MAX_BPM) / 2
+    pace = np.clip((tempo - MIN_BPM) / (MAX_BPM - MIN_BPM), 0.0, 1.0)
+
+    return {
+        'energy': energy,
+        'tempo': float(tempo),
+        'brightness': brightness,
+        'valence': float(np.clip(0.6 * brightness + 0.4 * pace, 0.0, 1.0)),
+        'loudness': float(loudness),
+    }
+
+
+def decode_preview(path, sample_rate=None, channels=1):
+    """Decode an audio file (MP3, or WAV) to float32 samples in [-1, 1]; returns (samples, sample_rate).
+
+    Mono samples are one-dimensional, more channels come as a (frames x channels) array.
+    sample_rate resamples the audio; None keeps the file's own rate.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(4)
+    # pydub reads WAV itself; everything else goes through ffmpeg
+    segment = lazy_import("pydub").AudioSegment.from_file(path, format="wav" if header == b"RIFF" else "mp3")
+    segment = segment.set_channels(channels)
+    if sample_rate is not None and segment.frame_rate != sample_rate:
+        segment = segment.set_frame_rate(sample_rate)
+    dtype = {1: np.int8, 2: np.int16, 4: np.int32}[segment.sample_width]
+    samples = np.frombuffer(segment.raw_data, dtype=dtype).astype(np.float32) / float(1 << (8 * segment.sample_width - 1))
+    if channels > 1:
+        samples = samples.reshape(-1, channels)
+    return samples, segment.frame_rate
+
+
+def measure_preview(path):
+    """Decode one cached preview and return its pcm_features, or None if it cannot be decoded.
+
+    Runs in the decode process pool, so only the small feature dict crosses back to the parent.
+    """
+    try:
+        return pcm_features(*decode_preview(path))
+    except Exception as e:
+        print(f"Error decoding preview {path}: {str(e)}")
+        return None
+
+
+class PreviewFeatureCache:
+    """Audio features measured locally from 30-second preview clips instead of the audio-features API.
+
+    A drop-in feature_cache for the recommenders: get_features(sp, tracks) takes track dicts (whose
+    preview_url it downloads) or plain IDs. Previews are downloaded concurrently over one pooled
+    session into a content-addressed directory (one file per SHA-256 of the audio, so a preview shared
+    by several tracks or re-fetched later is stored once), and decoded and measured on a process pool.
+    Features are cached by content hash in the SQLite cache file.
+
+    Tracks without a preview (or whose preview fails) go to fallback, e.g. an AudioFeatureCache, when
+    one is given. Only measured features are remembered, so a failed download is retried on the next call;
+    a preview that fails to decode is not decoded again for negative_ttl seconds.
+    Local features have energy, valence and tempo, but no instrumentalness or acousticness.
+
+    The track-to-preview mapping expires after ttl; call purge() to delete the preview files nothing
+    points to any more, otherwise the directory keeps growing.
+    """
+
+    def __init__(self, directory=DEFAULT_PREVIEW_DIR, path=DEFAULT_CACHE_PATH, fallback=None,
+                 download_workers=DEFAULT_DOWNLOAD_WORKERS, decode_workers=None, timeout=DEFAULT_DOWNLOAD_TIMEOUT,
+                 ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL):
+        self.directory = directory
+        self.fallback = fallback
+        self.download_workers = max(1, download_workers)
+        # 0 decodes in this process; None uses one worker per core
+        self.decode_workers = decode_workers if decode_workers is not None else (os.cpu_count() or 1)
+        self.timeout = timeout
+        self.blobs = _DiskStore(path, "preview_blobs", ttl) if path else None
+        self.measured = _DiskStore(path, "preview_features", ttl=0) if path else None
+        self._memory = {}
+        self._measured_memory = {}
+        # digest -> time its decode failed; the same content would fail again
+        self.negative_ttl = negative_ttl
+        self._decode_failures = {}
+        self._decode_pool = None
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.downloads = 0
+        self.decoded = 0
+        self.failures = 0
+        self.fallbacks = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def blob_path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def download(self, url):
+        """Fetch a preview into the content-addressed store and return its SHA-256, or None on failure."""
+        try:
+            response = preview_session(self.download_workers).get(url, timeout=self.timeout)
+            if response.status_code != 200:
+                print(f"Error fetching preview: {response.status_code}")
+                return None
+            data = response.content
+        except Exception as e:
+            print(f"Error fetching preview: {str(e)}")
+            return None
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename, so a crash never leaves a truncated file under a valid hash
+            handle, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(handle, 'wb') as f:
+                f.write(data)
+            os.replace(temporary, path)
+        with self._lock:
+            self.downloads += 1
+        return digest
+
+    def _measure(self, digests):
+        """Return {digest: features} for blobs, decoding the unmeasured ones on the process pool."""
+        keys = {digest: f"v{FEATURE_VERSION}:{digest}" for digest in digests}
+        found = {digest: self._measured_memory[digest] for digest in digests if digest in self._measured_memory}
+        pending = [digest for digest in digests if digest not in found]
+        if pending and self.measured is not None:
+            stored = self.measured.get_many([keys[digest] for digest in pending])
+            found.update({digest: stored[keys[digest]] for digest in pending if keys[digest] in stored})
+            pending = [digest for digest in pending if digest not in found]
+        oldest_failure = time.time() - self.negative_ttl
+        with self._lock:
+            pending = [digest for digest in pending if self._decode_failures.get(digest, 0) < oldest_failure]
+
+        if pending:
+            paths = [self.blob_path(digest) for digest in pending]
+            if self.decode_workers and len(pending) > 1:
+                results = list(self._pool().map(measure_preview, paths))
+            else:
+                results = [measure_preview(path) for path in paths]
+            measured = {digest: features for digest, features in zip(pending, results) if features is not None}
+            with self._lock:
+                self.decoded += len(measured)
+                now = time.time()
+                for digest in pending:
+                    if digest in measured:
+                        self._decode_failures.pop(digest, None)
+                    else:
+                        self._decode_failures[digest] = now
+            found.update(measured)
+            if self.measured is not None:
+                self.measured.put_many((keys[digest], features) for digest, features in measured.items())
+        self._measured_memory.update(found)
+        return found
+
+    def _pool(self):
+        with self._lock:
+            if self._decode_pool is None:
+                # spawn, not fork: the parent holds download threads and SQLite connections
+                self._decode_pool = ProcessPoolExecutor(max_workers=self.decode_workers,
+                                                        mp_context=multiprocessing.get_context("spawn"))
+            return self._decode_pool
+
+    def digests(self, tracks):
+        """Return {track ID: content hash} for tracks whose preview is stored, downloading what is missing.
+
+        Only track dicts with a preview_url can be downloaded; plain IDs are found only if stored earlier.
+        """
+        digests = {}
+        if tracks and self.blobs is not None:
+            stored = self.blobs.get_many([track_key(track) for track in tracks])
+            digests = {track_id: entry['sha256'] for track_id, entry in stored.items()
+                       if os.path.exists(self.blob_path(entry['sha256']))}
+        to_download = [track for track in tracks if track_key(track) not in digests
+                       and isinstance(track, dict) and track.get('preview_url')]
+        if to_download:
+            with ThreadPoolExecutor(max_workers=self.download_workers, thread_name_prefix="preview-download") as pool:
+                fetched = dict(zip((track_key(track) for track in to_download),
+                                   pool.map(self.download, [track['preview_url'] for track in to_download])))
+            fetched = {track_id: digest for track_id, digest in fetched.items() if digest}
+            digests.update(fetched)
+            if self.blobs is not None:
+                self.blobs.put_many((track_id, {'sha256': digest}) for track_id, digest in fetched.items())
+        return digests
+
+    def preview_path(self, track):
+        """Local path of a track's preview clip, downloading it if needed; None when there is none."""
+        digest = self.digests([track]).get(track_key(track))
+        return self.blob_path(digest) if digest else None
+
+    def get_features(self, sp, tracks):
+        """Return a dict of track ID -> features (None when nothing could be measured or fetched)."""
+        tracks = list({track_key(track): track for track in tracks if track and track_key(track)}.values())
+        resolved = {}
+        with self._lock:
+            for track in tracks:
+                if track_key(track) in self._memory:
+                    resolved[track_key(track)] = self._memory[track_key(track)]
+        pending = [track for track in tracks if track_key(track) not in resolved]
+
+        # Track ID -> content hash of a preview downloaded earlier
+        digests = self.digests(pending)
+
+        features_by_digest = self._measure(list(dict.fromkeys(digests.values())))
+        local = {track_id: features_by_digest[digest] for track_id, digest in digests.items()
+                 if digest in features_by_digest}
+        resolved.update(local)
+
+        missing = [track_key(track) for track in pending if track_key(track) not in local]
+        if missing and self.fallback is not None:
+            resolved.update(self.fallback.get_features(sp, missing))
+        with self._lock:
+            self.memory_hits += len(tracks) - len(pending)
+            self.failures += len(missing)
+            self.fallbacks += len(missing) if self.fallback is not None else 0
+            for track in tracks:
+                resolved.setdefault(track_key(track), None)
+                # Failures (no preview, a timed-out download) are not remembered, so they are retried
+                if resolved[track_key(track)] is not None:
+                    self._memory[track_key(track)] = resolved[track_key(track)]
+        return resolved
+
+    def purge(self, min_age=DEFAULT_PURGE_MIN_AGE):
+        """Delete expired track mappings and the preview files no fresh mapping points to.
+
+        Files younger than min_age seconds are kept. Returns the number of files deleted.
+        """
+        referenced = set()
+        if self.blobs is not None:
+            self.blobs.purge_expired()
+            referenced = {entry['sha256'] for entry in self.blobs.values()}
+        cutoff = time.time() - min_age
+        removed = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if name not in referenced and os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    # Deleted by another process in the meantime
+                    continue
+        return removed
+
+    def get_feature(self, sp, track):
+        """Return the features for a single track dict or ID."""
+        return self.get_features(sp, [track]).get(track_key(track))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "downloads": self.downloads,
+                "decoded": self.decoded,
+                "unmeasured": self.failures,
+                "fallbacks": self.fallbacks,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._decode_pool is not None:
+                self._decode_pool.shutdown(wait=True, cancel_futures=True)
+                self._decode_pool = None
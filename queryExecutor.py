@@ -0,0 +1,255 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from modelRegistry import lazy_import
+
+# Spotify does not publish a fixed quota; this stays well inside the rolling 30-second window
+DEFAULT_REQUESTS_PER_SECOND = 10.0
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_MAX_RETRIES = 5
+# spotipy falls back to its own retry codes (which include 429) when this is empty, so it must list something
+SPOTIPY_STATUS_FORCELIST = (500, 502, 503, 504)
+
+
+def build_spotify_client(spotify_client_id, spotify_client_secret):
+    """Create a spotipy client that surfaces 429s instead of sleeping inside urllib3.
+
+    The executor owns retries so that a Retry-After from one thread pauses every thread.
+    """
+    # spotipy is imported on first use; it pulls in redis/requests and dominates import time
+    spotipy = lazy_import("spotipy")
+    client_credentials_manager = lazy_import("spotipy.oauth2").SpotifyClientCredentials(
+        client_id=spotify_client_id,
+        client_secret=spotify_client_secret
+    )
+    return spotipy.Spotify(
+        client_credentials_manager=client_credentials_manager,
+        retries=0,
+        status_forcelist=SPOTIPY_STATUS_FORCELIST
+    )
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every worker that talks to the API."""
+
+    def __init__(self, rate=DEFAULT_REQUESTS_PER_SECOND, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Stop handing out tokens for the given number of seconds (e.g. after a 429)."""
+        with self._lock:
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = 0
+            self._updated = now
+
+
+class SharedTokenBucket:
+    """Token bucket kept in a SQLite file, so every process that opens the same path shares one limit.
+
+    Same interface as TokenBucket. Each acquire() is a short IMMEDIATE transaction; wall-clock time
+    is used because monotonic clocks are not comparable across processes.
+    """
+
+    def __init__(self, path, rate=DEFAULT_REQUESTS_PER_SECOND, capacity=None, name="spotify", timeout=30.0):
+        self.path = path
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.name = name
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Autocommit mode, so the transactions below are exactly the ones we begin
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=timeout, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limiter "
+            "(name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, paused_until REAL NOT NULL)"
+        )
+
+    def _update(self, change):
+        """Run change(tokens, updated, paused_until, now) -> (new state, result) in one transaction."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self._conn.execute(
+                    "SELECT tokens, updated, paused_until FROM rate_limiter WHERE name = ?", (self.name,)
+                ).fetchone()
+                tokens, updated, paused_until = row if row else (self.capacity, now, 0.0)
+                state, result = change(tokens, updated, paused_until, now)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rate_limiter (name, tokens, updated, paused_until) VALUES (?, ?, ?, ?)",
+                    (self.name, *state)
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def _take(self, tokens, updated, paused_until, now):
+        if now < paused_until:
+            return (tokens, updated, paused_until), paused_until - now
+        tokens = min(self.capacity, tokens + max(0.0, now - updated) * self.rate)
+        if tokens >= 1:
+            return (tokens - 1, now, paused_until), 0.0
+        return (tokens, now, paused_until), (1 - tokens) / self.rate
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        while True:
+            wait = self._update(self._take)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Stop handing out tokens in every process for the given number of seconds."""
+        self._update(lambda tokens, updated, paused_until, now: ((0.0, now, max(paused_until, now + seconds)), None))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def retry_after_seconds(error, default):
+    """Read the Retry-After header from a SpotifyException, falling back to a default."""
+    headers = getattr(error, 'headers', None) or {}
+    value = headers.get('Retry-After') or headers.get('retry-after')
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+class RateLimitedClient:
+    """Proxy around a Spotify client that throttles every API call through a TokenBucket."""
+
+    def __init__(self, client, rate_limiter, max_retries=DEFAULT_MAX_RETRIES, backoff=1.0):
+        self._client = client
+        self._rate_limiter = rate_limiter
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self.rate_limited = 0
+
+    def call(self, method, *args, **kwargs):
+        """Call a client method, backing off on 429 and transient server errors."""
+        for attempt in range(self._max_retries + 1):
+            self._rate_limiter.acquire()
+            try:
+                return method(*args, **kwargs)
+            except Exception as e:
+                # SpotifyException (and compatible backends) carry the HTTP status
+                status = getattr(e, 'http_status', None)
+                if status is None or attempt == self._max_retries or not (status == 429 or status >= 500):
+                    raise
+                delay = self._backoff * (2 ** attempt)
+                if status == 429:
+                    self.rate_limited += 1
+                    # Pause the shared bucket so every thread backs off, not just this one
+                    self._rate_limiter.pause(retry_after_seconds(e, delay))
+                else:
+                    time.sleep(delay)
+
+    def __getattr__(self, name):
+        client = self.__dict__.get('_client')
+        if client is None:
+            raise AttributeError(name)
+        attribute = getattr(client, name)
+        if not callable(attribute):
+            return attribute
+
+        def throttled(*args, **kwargs):
+            return self.call(attribute, *args, **kwargs)
+        return throttled
+
+
+class QueryExecutor:
+    """Run Spotify queries concurrently while returning results in submission order."""
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, requests_per_second=DEFAULT_REQUESTS_PER_SECOND,
+                 burst=None, max_retries=DEFAULT_MAX_RETRIES, rate_limiter=None):
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max_retries
+        self.rate_limiter = rate_limiter if rate_limiter is not None else TokenBucket(requests_per_second, burst)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def wrap(self, client):
+        """Return a client whose calls share this executor's rate limiter."""
+        return RateLimitedClient(client, self.rate_limiter, self.max_retries)
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="spotify-query")
+            return self._pool
+
+    def imap(self, fn, items):
+        """Yield fn(item) for each item in order, keeping at most max_workers calls in flight.
+
+        Closing the generator early (e.g. after a `break`) cancels queries that have not started,
+        so early-exit loops issue at most max_workers - 1 extra requests: the next item is only
+        submitted once the consumer asks for the result after the one it has.
+        """
+        if self.max_workers == 1:
+            for item in items:
+                yield fn(item)
+            return
+
+        pool = self._get_pool()
+        iterator = iter(items)
+        pending = deque(pool.submit(fn, item) for item in itertools.islice(iterator, self.max_workers))
+        try:
+            while pending:
+                yield pending.popleft().result()
+                # Refill only after the consumer came back for more; a consumer that stops here submits nothing
+                for item in itertools.islice(iterator, 1):
+                    pending.append(pool.submit(fn, item))
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def map(self, fn, items):
+        """Return [fn(item) for item in items], computed concurrently."""
+        return list(self.imap(fn, items))
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
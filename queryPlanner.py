@@ -0,0 +1,107 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+import threading
+import zlib
+
+# Artist-scoped searches per query before falling back to one unscoped search
+DEFAULT_MAX_FANOUT = 8
+
+
+class ArtistQueryPlanner:
+    """Rewrite free-text searches into artist-scoped ones so result pages aren't wasted.
+
+    A plain search returns 50 generic tracks, and the client-side artist filter usually keeps zero
+    or one of them. The planner searches `artist:"<name>" <query>` for up to max_fanout chosen artists
+    and stops once enough tracks have been found. Each query starts at a different artist (picked by
+    a hash of the query, so reruns issue the same searches), which spreads results over the whole
+    list. When the fan-out is used up, one unscoped search tops up the results.
+    max_fanout=None tries every artist.
+    """
+
+    def __init__(self, chosen_artists, search_cache=None, scoped_limit=20, unscoped_limit=50,
+                 max_fanout=DEFAULT_MAX_FANOUT):
+        self.chosen_artists = chosen_artists
+        self.search_cache = search_cache
+        self.scoped_limit = scoped_limit
+        self.unscoped_limit = unscoped_limit
+        self.max_fanout = max_fanout
+        self._lock = threading.Lock()
+        self._stats = {
+            'scoped': {'requests': 0, 'matching_tracks': 0},
+            'unscoped': {'requests': 0, 'matching_tracks': 0},
+            'fallback': {'requests': 0, 'matching_tracks': 0},
+        }
+
+    def scoped_queries(self, query):
+        """Return the artist-filtered forms of a query, up to max_fanout, starting at the query's own artist."""
+        artists = list(self.chosen_artists)
+        if not artists:
+            return []
+        start = zlib.crc32(query.encode("utf-8")) % len(artists)
+        artists = artists[start:] + artists[:start]
+        if self.max_fanout:
+            artists = artists[:self.max_fanout]
+        return [f'artist:"{artist}" {query}' for artist in artists]
+
+    def _search(self, sp, query, limit):
+        if self.search_cache is not None:
+            return self.search_cache.search(sp, query, search_type='track', limit=limit)
+        return sp.search(q=query, type='track', limit=limit)
+
+    def _record(self, mode, requests, matching_tracks):
+        with self._lock:
+            self._stats[mode]['requests'] += requests
+            self._stats[mode]['matching_tracks'] += matching_tracks
+
+    def find_tracks(self, sp, query, needed, accept, artist_scoped=True, budget=None):
+        """Return tracks for a query that pass accept(track).
+
+        In scoped mode, searching stops as soon as `needed` tracks are found; if the fan-out runs out
+        first, one unscoped search adds what it can. In unscoped mode, one generic search is issued
+        and every accepted track on the page is returned, as before.
+        With a CallBudget, every search spends one call and searching stops when the budget runs out.
+        """
+        if not artist_scoped:
+            if budget is not None and not budget.try_spend():
+                return []
+            results = self._search(sp, query, self.unscoped_limit)
+            tracks = [track for track in results['tracks']['items'] if accept(track)]
+            self._record('unscoped', 1, len(tracks))
+            return tracks
+
+        found = []
+        seen_ids = set()
+
+        def add(results):
+            added = 0
+            for track in results['tracks']['items']:
+                # Spotify's artist filter is fuzzy, so the client-side check still applies
+                if track['id'] not in seen_ids and accept(track):
+                    seen_ids.add(track['id'])
+                    found.append(track)
+                    added += 1
+            return added
+
+        requests = 0
+        for scoped_query in self.scoped_queries(query):
+            if budget is not None and not budget.try_spend():
+                self._record('scoped', requests, len(found))
+                return found
+            requests += 1
+            add(self._search(sp, scoped_query, self.scoped_limit))
+            if len(found) >= needed:
+                break
+        self._record('scoped', requests, len(found))
+
+        if len(found) < needed and (budget is None or budget.try_spend()):
+            self._record('fallback', 1, add(self._search(sp, query, self.unscoped_limit)))
+        return found
+
+    def stats(self):
+        """Return requests issued, matching tracks and hit rate per request for each mode."""
+        with self._lock:
+            report = {}
+            for mode, counts in self._stats.items():
+                requests = counts['requests']
+                report[mode] = dict(counts, hit_rate=counts['matching_tracks'] / requests if requests else 0.0)
+            return report
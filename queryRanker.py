@@ -0,0 +1,233 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+import math
+import threading
+from collections import Counter, namedtuple
+
+from modelRegistry import lazy_import
+from spotifyCache import DEFAULT_CACHE_PATH, _DiskStore
+
+# A candidate search and where it came from: 'mapping', 'sentiment' or 'mood'
+CandidateQuery = namedtuple('CandidateQuery', ['query', 'reason', 'source'])
+RankedQuery = namedtuple('RankedQuery', ['query', 'reason', 'source', 'score'])
+
+# Curated mood-mapping queries are written for music search; single mood words are a guess
+SOURCE_WEIGHTS = {'mapping': 3.0, 'sentiment': 2.0, 'mood': 1.0}
+STOP_WORD_WEIGHT = 0.1
+DOCUMENTS_KEY = "documents"
+
+
+class BudgetExhausted(Exception):
+    """Raised by a BudgetedClient call that the budget cannot afford."""
+
+
+class CallBudget:
+    """Thread-safe cap on the number of API calls (searches and audio-feature lookups) a scene may spend.
+
+    Each query reserves its share with reserve() when it starts, so concurrent queries cannot
+    starve the higher-ranked ones that started first; release() returns what it did not use.
+    """
+
+    def __init__(self, limit, requested=None, parent=None):
+        self.limit = limit
+        self.requested = requested if requested is not None else limit
+        self.parent = parent
+        self.spent = 0
+        self.ran_out = False
+        self._reserved = 0
+        self._lock = threading.Lock()
+
+    def try_spend(self, calls=1):
+        """Spend calls; returns False (and spends nothing) once the budget would be exceeded."""
+        with self._lock:
+            if self.limit is not None and self.spent + calls > self.limit:
+                self.ran_out = True
+                return False
+            self.spent += calls
+        if self.parent is not None:
+            self.parent._charge_reserved(calls)
+        return True
+
+    def _charge_reserved(self, calls):
+        with self._lock:
+            self._reserved -= calls
+            self.spent += calls
+
+    def reserve(self, calls):
+        """Set aside up to calls for one query and return them as a child budget."""
+        with self._lock:
+            if self.limit is None:
+                granted = calls
+            else:
+                granted = max(0, min(calls, self.limit - self.spent - self._reserved))
+            self._reserved += granted
+        return CallBudget(granted, requested=calls, parent=self)
+
+    def release(self):
+        """Return a child budget's unspent calls to its parent."""
+        if self.parent is not None and self.limit is not None:
+            with self.parent._lock:
+                self.parent._reserved -= self.limit - self.spent
+
+    @property
+    def starved(self):
+        """True when a child ran out because the parent could not grant its full request."""
+        return self.ran_out and self.limit is not None and self.requested is not None and self.limit < self.requested
+
+    @property
+    def exhausted(self):
+        """True when no calls are left to spend or reserve; calls reserved by running queries count as used."""
+        with self._lock:
+            return self.limit is not None and self.spent + self._reserved >= self.limit
+
+
+class BudgetedClient:
+    """Charge a client's audio_features calls to a CallBudget; other calls pass straight through.
+
+    A lookup the budget cannot afford raises BudgetExhausted instead of reaching the API.
+    """
+
+    def __init__(self, client, budget):
+        self.client = client
+        self.budget = budget
+
+    def audio_features(self, tracks):
+        if not self.budget.try_spend():
+            raise BudgetExhausted("API call budget spent before the audio-feature lookup")
+        return self.client.audio_features(tracks)
+
+    def __getattr__(self, name):
+        # Looked up in __dict__, so a half-built instance raises AttributeError instead of recursing
+        client = self.__dict__.get('client')
+        if client is None:
+            raise AttributeError(name)
+        return getattr(client, name)
+
+
+class QueryRanker:
+    """Rank candidate queries by expected usefulness and bound how many a scene may run.
+
+    A query's score is its source weight (curated mapping > sentiment > single mood word), times the
+    IDF of a mood word across every scene ranked so far, times its smoothed past hit rate (the share
+    of earlier runs in which it produced at least one recommendation). Hit counts and document
+    frequencies persist in the shared SQLite cache file, so rankings improve across runs.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_queries=12, max_api_calls=100, max_calls_per_query=20, top_n=10,
+                 patience=3, prior_hit_rate=0.5, prior_weight=2.0):
+        self.store = _DiskStore(path, "query_history", ttl=0) if path else None
+        self.max_queries = max_queries
+        self.max_api_calls = max_api_calls
+        # Keeps one query's artist fan-out from spending the whole scene budget
+        self.max_calls_per_query = max_calls_per_query
+        self.top_n = top_n
+        self.patience = patience
+        self.prior_hit_rate = prior_hit_rate
+        self.prior_weight = prior_weight
+        # key -> [runs, hits] for "q:<query>"; key -> [count] for "df:<word>" and DOCUMENTS_KEY
+        self._history = {}
+        self._dirty = set()
+        self._stop_words = None
+        self._lock = threading.Lock()
+        self.scenes = 0
+        self.candidates = 0
+        self.selected = 0
+
+    def new_budget(self):
+        return CallBudget(self.max_api_calls)
+
+    def _load(self, keys):
+        missing = [key for key in keys if key not in self._history]
+        stored = self.store.get_many(missing) if self.store is not None and missing else {}
+        for key in missing:
+            self._history[key] = stored.get(key, [0, 0])
+
+    def _is_stop_word(self, word):
+        if self._stop_words is None:
+            self._stop_words = lazy_import("spacy.lang.en.stop_words").STOP_WORDS
+        return word in self._stop_words
+
+    def expected_hit_rate(self, query):
+        runs, hits = self._history.get(f"q:{query.lower()}", [0, 0])
+        return (hits + self.prior_hit_rate * self.prior_weight) / (runs + self.prior_weight)
+
+    def idf(self, word):
+        documents = self._history.get(DOCUMENTS_KEY, [0, 0])[0]
+        document_frequency = self._history.get(f"df:{word.lower()}", [0, 0])[0]
+        return math.log((1 + documents) / (1 + document_frequency)) + 1
+
+    def rank(self, candidates):
+        """Return the best max_queries unique candidates, highest score first.
+
+        Also counts this scene's mood words towards future IDF values.
+        """
+        unique = {}
+        repeats = Counter()
+        for candidate in candidates:
+            key = candidate.query.lower()
+            repeats[key] += 1
+            if key not in unique:
+                unique[key] = candidate
+        mood_words = {key for key, candidate in unique.items() if candidate.source == 'mood'}
+
+        with self._lock:
+            self._load([f"q:{key}" for key in unique] + [f"df:{word}" for word in mood_words] + [DOCUMENTS_KEY])
+            ranked = []
+            for position, (key, candidate) in enumerate(unique.items()):
+                score = SOURCE_WEIGHTS.get(candidate.source, 1.0)
+                if candidate.source == 'mood':
+                    # Repeated words matter more in this scene; words common across scenes matter less
+                    score *= self.idf(key) * (1 + math.log(repeats[key]))
+                    if self._is_stop_word(key):
+                        score *= STOP_WORD_WEIGHT
+                score *= self.expected_hit_rate(key) / self.prior_hit_rate
+                ranked.append((score, -position, candidate))
+
+            for word in mood_words:
+                self._history[f"df:{word}"][0] += 1
+                self._dirty.add(f"df:{word}")
+            self._history[DOCUMENTS_KEY][0] += 1
+            self._dirty.add(DOCUMENTS_KEY)
+
+            ranked.sort(key=lambda item: item[:2], reverse=True)
+            selected = [RankedQuery(*candidate, score) for score, _, candidate in ranked[:self.max_queries]]
+            self.scenes += 1
+            self.candidates += len(unique)
+            self.selected += len(selected)
+        return selected
+
+    def record(self, query, hit):
+        """Remember whether a query produced at least one recommendation."""
+        key = f"q:{query.lower()}"
+        with self._lock:
+            self._load([key])
+            self._history[key][0] += 1
+            self._history[key][1] += int(bool(hit))
+            self._dirty.add(key)
+
+    def flush(self):
+        """Persist history changed since the last flush."""
+        with self._lock:
+            items = [(key, self._history[key]) for key in self._dirty]
+            self._dirty = set()
+        if self.store is not None:
+            self.store.put_many(items)
+
+    def is_confident(self, top, previous_top, stable_rounds):
+        """Return (top, stable rounds) after a query, given the current top_n track IDs best first.
+
+        Confident once stable_rounds >= patience.
+        """
+        top = tuple(top)
+        if len(top) >= self.top_n and top == previous_top:
+            return top, stable_rounds + 1
+        return top, 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "scenes": self.scenes,
+                "candidate_queries": self.candidates,
+                "selected_queries": self.selected,
+                "mean_selected_per_scene": self.selected / self.scenes if self.scenes else 0.0,
+            }
@@ -0,0 +1,367 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import modelRegistry
+from instrumentation import NOOP, percentile
+from MusicDirector import ImmersiveStorytellingEngine
+from MusicDirectorPDF import BookMusicRecommender
+from SceneSongs import FILM_COMPOSERS, SceneMusicRecommender
+from musicBackend import SpotipyBackend
+from queryExecutor import QueryExecutor
+from spotifyCache import AudioFeatureCache, SearchCache
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+class LatencyTracker:
+    """Per-endpoint request latencies over a sliding window of recent requests."""
+
+    def __init__(self, window=2048):
+        self.window = window
+        self._samples = {}
+        self._counts = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, error=False):
+        with self._lock:
+            self._samples.setdefault(endpoint, deque(maxlen=self.window)).append(seconds)
+            self._counts[endpoint] = self._counts.get(endpoint, 0) + 1
+            if error:
+                self._errors[endpoint] = self._errors.get(endpoint, 0) + 1
+
+    def summary(self):
+        """Return count, errors and p50/p99/mean latency in milliseconds for each endpoint."""
+        with self._lock:
+            samples = {endpoint: sorted(values) for endpoint, values in self._samples.items()}
+            counts = dict(self._counts)
+            errors = dict(self._errors)
+        return {
+            endpoint: {
+                "count": counts[endpoint],
+                "errors": errors.get(endpoint, 0),
+                "p50_ms": percentile(values, 0.50) * 1000,
+                "p99_ms": percentile(values, 0.99) * 1000,
+                "mean_ms": sum(values) / len(values) * 1000,
+            }
+            for endpoint, values in samples.items()
+        }
+
+
+class MicroBatcher:
+    """Collect items submitted by concurrent requests and process them in one batch call.
+
+    A single worker thread takes the first waiting item, then keeps collecting for up to max_wait
+    seconds or until max_batch_size items are queued, and calls process(items), which must return
+    one result per item in order. This feeds the NLP pipeline nlp.pipe batches instead of one document
+    per request. Items still queued when the batcher closes fail with a RuntimeError.
+    """
+
+    def __init__(self, process, max_batch_size=32, max_wait=0.01, name="batcher"):
+        self.process = process
+        self.name = name
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def submit(self, item):
+        """Queue an item and return a Future for its result."""
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return [entry for entry in batch if entry is not None]
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+            items = [item for item, _ in batch]
+            try:
+                results = list(self.process(items))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            if len(results) != len(batch):
+                error = RuntimeError(f"{self.name} returned {len(results)} results for {len(batch)} items")
+                for _, future in batch:
+                    future.set_exception(error)
+                continue
+            self.batches += 1
+            self.items += len(items)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+        }
+
+    def close(self):
+        self._stopped.set()
+        # Wake the worker if it is waiting on an empty queue
+        self._queue.put(None)
+        self._worker.join()
+        # Nothing will process what is still queued, so fail it rather than leave callers waiting
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is not None:
+                entry[1].set_exception(RuntimeError(f"{self.name} closed before processing the item"))
+
+
+class RecommendationService:
+    """Scene, story and book recommenders sharing warm models, caches and one Spotify client.
+
+    Requests from concurrent callers are micro-batched, and every batch (including the paragraphs of
+    /book requests) is parsed on one NLP thread, since the shared spaCy pipeline is not safe to call
+    from several threads at once. The Spotify searches that follow run on the shared QueryExecutor and
+    go through one search cache. Pass sp (any MusicBackend) to serve from a
+    fake backend instead of Spotify.
+
+    /book only reads PDFs under books_dir and only writes reports under output_dir (default books_dir);
+    without books_dir it is disabled.
+    """
+
+    def __init__(self, spotify_client_id, spotify_client_secret, chosen_artists=None, sp=None, executor=None,
+                 feature_cache=None, search_cache=None, max_batch_size=32, max_batch_wait=0.01,
+                 artist_scoped=None, instrumentation=None, query_ranker=None, paragraph_store=None,
+                 books_dir=None, output_dir=None, pdf_extractor=None):
+        self.books_dir = os.path.realpath(books_dir) if books_dir else None
+        self.output_dir = os.path.realpath(output_dir) if output_dir else self.books_dir
+        chosen_artists = chosen_artists if chosen_artists is not None else FILM_COMPOSERS
+        self.executor = executor if executor is not None else QueryExecutor()
+        self.feature_cache = feature_cache if feature_cache is not None else AudioFeatureCache()
+        self.search_cache = search_cache if search_cache is not None else SearchCache()
+        self.instrumentation = instrumentation if instrumentation is not None else NOOP
+        # One client (and one access token) for every recommender; each wraps it in the shared rate limiter
+        client = sp if sp is not None else SpotipyBackend.from_credentials(spotify_client_id, spotify_client_secret)
+        shared = dict(feature_cache=self.feature_cache, executor=self.executor, sp=client,
+                      instrumentation=self.instrumentation)
+        # None keeps each recommender's default: scoped for scenes (budgeted per scene), plain for stories and books
+        scoped = {} if artist_scoped is None else dict(artist_scoped=artist_scoped)
+
+        self.scene = SceneMusicRecommender(spotify_client_id, spotify_client_secret, chosen_artists,
+                                           query_ranker=query_ranker, search_cache=self.search_cache, **scoped, **shared)
+        self.story = ImmersiveStorytellingEngine(spotify_client_id, spotify_client_secret, chosen_artists,
+                                                 search_cache=self.search_cache, **scoped, **shared)
+        self.book = BookMusicRecommender(
+            spotify_client_id, spotify_client_secret, chosen_artists, search_cache=self.search_cache,
+            paragraph_store=paragraph_store, pdf_extractor=pdf_extractor, batch_size=max_batch_size, **scoped, **shared
+        )
+
+        self.latency = LatencyTracker()
+        self._nlp = ThreadPoolExecutor(max_workers=1, thread_name_prefix="nlp")
+        # process_book parses its paragraphs through the same NLP thread, one batch at a time
+        self.book.analyze_texts = self._serialized_book_analysis(self.book.analyze_texts, max_batch_size)
+        self.batchers = {
+            "scene": MicroBatcher(lambda texts: self.on_nlp_thread(self.scene.analyze_scenes, texts, max_batch_size),
+                                  max_batch_size, max_batch_wait, name="scene-nlp"),
+            "story": MicroBatcher(lambda texts: self.on_nlp_thread(self.story.analyze_texts, texts, max_batch_size),
+                                  max_batch_size, max_batch_wait, name="story-nlp"),
+            "paragraph": MicroBatcher(lambda texts: list(self.book.analyze_texts(texts)),
+                                      max_batch_size, max_batch_wait, name="paragraph-nlp"),
+        }
+
+    def on_nlp_thread(self, analyze, *args):
+        """Run analyze(*args) to completion on the NLP thread and return its results as a list."""
+        return self._nlp.submit(lambda: list(analyze(*args))).result()
+
+    def _serialized_book_analysis(self, analyze, batch_size):
+        def analyze_texts(texts, as_tuples=False):
+            texts = iter(texts)
+            while True:
+                batch = list(islice(texts, batch_size))
+                if not batch:
+                    return
+                yield from self.on_nlp_thread(analyze, batch, as_tuples)
+        return analyze_texts
+
+    def warm_up(self):
+        """Load spaCy and WordNet and compile the scene vocabulary before the first request."""
+        modelRegistry.get_spacy()
+        modelRegistry.get_wordnet()
+        self.scene.match_mappings("")
+
+    def recommend_scene(self, text):
+        analysis = self.batchers["scene"].submit(text).result()
+        return {"recommendations": [rec._asdict() for rec in self.scene.recommend_for_analysis(analysis)]}
+
+    def recommend_story(self, text):
+        analysis = self.batchers["story"].submit(text).result()
+        return {"music": self.story.music_for_analysis(analysis)}
+
+    def recommend_paragraph(self, text, limit=3):
+        analysis = self.batchers["paragraph"].submit(text).result()
+        return {"recommendations": [rec._asdict() for rec in self.book.recommend_for_analysis(analysis, limit)]}
+
+    def process_book(self, pdf_path, output_file, resume=False):
+        """Process a PDF under books_dir into a report under output_dir; both paths are relative to them."""
+        if self.books_dir is None:
+            raise PermissionError("/book is disabled; start the service with a books directory")
+        pdf_path = resolve_under(self.books_dir, pdf_path)
+        output_file = resolve_under(self.output_dir, output_file)
+        self.book.process_book(pdf_path, output_file, resume=resume)
+        return {"output_file": os.path.relpath(output_file, self.output_dir)}
+
+    def handle(self, endpoint, payload):
+        """Dispatch a JSON request body to an endpoint; raises KeyError for unknown endpoints."""
+        if endpoint == "/scene":
+            return self.recommend_scene(require_text(payload))
+        if endpoint == "/story":
+            return self.recommend_story(require_text(payload))
+        if endpoint == "/book/paragraph":
+            return self.recommend_paragraph(require_text(payload), int(payload.get("limit", 3)))
+        if endpoint == "/book":
+            if not payload.get("pdf_path"):
+                raise ValueError("'pdf_path' is required")
+            return self.process_book(
+                payload["pdf_path"], payload.get("output_file", "book_recommendations.txt"), bool(payload.get("resume"))
+            )
+        raise KeyError(endpoint)
+
+    def metrics(self):
+        return {
+            "latency": self.latency.summary(),
+            "batching": {name: batcher.stats() for name, batcher in self.batchers.items()},
+            "feature_cache": self.feature_cache.stats(),
+            "search_cache": self.search_cache.stats(),
+            "model_load_seconds": modelRegistry.timings(),
+            "instrumentation": self.instrumentation.snapshot(),
+        }
+
+    def close(self):
+        for batcher in self.batchers.values():
+            batcher.close()
+        self._nlp.shutdown()
+        self.executor.shutdown()
+
+
+def resolve_under(root, path):
+    """Resolve path relative to root, raising PermissionError if it (or a symlink in it) leads outside root."""
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise PermissionError(f"Path is outside {root}: {path}")
+    return resolved
+
+
+def require_text(payload):
+    text = payload.get("text")
+    if not isinstance(text, str) or not text.strip():
+        raise ValueError("'text' must be a non-empty string")
+    return text
+
+
+def make_handler(service):
+    """Build a request handler class bound to a RecommendationService."""
+
+    class RecommendationHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, {"status": "ok"})
+            elif self.path == "/metrics":
+                self._send_json(200, service.metrics())
+            else:
+                self._send_json(404, {"error": f"Unknown endpoint: {self.path}"})
+
+        def do_POST(self):
+            start = time.perf_counter()
+            status = 200
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                data = self.rfile.read(length)
+                # A JSON content type cannot be sent cross-origin without a CORS preflight, which is never
+                # answered, so web pages the user visits cannot drive the service
+                if self.headers.get_content_type() != "application/json":
+                    self._send_json(415, {"error": "Content-Type must be application/json"})
+                    return
+                payload = json.loads(data or b"{}")
+                if not isinstance(payload, dict):
+                    raise ValueError("Request body must be a JSON object")
+                body = service.handle(self.path, payload)
+            except KeyError:
+                status, body = 404, {"error": f"Unknown endpoint: {self.path}"}
+            except PermissionError as e:
+                status, body = 403, {"error": str(e)}
+            except ValueError as e:
+                status, body = 400, {"error": str(e)}
+            except Exception as e:
+                print(f"Error handling {self.path}: {str(e)}")
+                status, body = 500, {"error": str(e)}
+            if status != 404:
+                service.latency.record(self.path, time.perf_counter() - start, error=status != 200)
+            self._send_json(status, body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return RecommendationHandler
+
+
+def serve(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Create a threaded HTTP server for the service; call serve_forever() on the result."""
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    # SPOTIFY_CLIENT_ID=... SPOTIFY_CLIENT_SECRET=... python recommendationService.py [port] [books_dir] [output_dir]
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    books_dir = sys.argv[2] if len(sys.argv) > 2 else None
+    output_dir = sys.argv[3] if len(sys.argv) > 3 else None
+    service = RecommendationService(os.environ.get("SPOTIFY_CLIENT_ID"), os.environ.get("SPOTIFY_CLIENT_SECRET"),
+                                    books_dir=books_dir, output_dir=output_dir)
+    service.warm_up()
+    server = serve(service, port=port)
+    print(f"Serving on http://{DEFAULT_HOST}:{port} (POST /scene, /story, /book/paragraph, /book; GET /metrics)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
@@ -0,0 +1,209 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+from collections import namedtuple
+
+import numpy as np
+
+from trackCatalog import FEATURE_NAMES
+
+DEFAULT_CHAPTER_PARAGRAPHS = 40
+DEFAULT_POOL_SIZE = 48
+DEFAULT_CHAPTER_QUERIES = 16
+
+# A run of consecutive paragraphs that share one planned track
+SoundtrackCue = namedtuple('SoundtrackCue', ['track_id', 'title', 'artist', 'spotify_url', 'preview_url',
+                                             'first_paragraph', 'last_paragraph', 'words'])
+
+
+def fit_costs(targets, features, weights=None):
+    """(paragraphs x tracks) weighted squared distance between mood targets and track features."""
+    targets = np.asarray(targets, dtype=np.float64)
+    features = np.asarray(features, dtype=np.float64)
+    weights = np.ones(features.shape[1]) if weights is None else np.asarray(weights, dtype=np.float64)
+    # |t - f|^2 = |t|^2 - 2 t.f + |f|^2, as two matrix products instead of a (P x K x F) array
+    return np.maximum(
+        (targets ** 2) @ weights[:, None] - 2 * (targets * weights) @ features.T + (features ** 2) @ weights, 0.0
+    )
+
+
+def transition_costs(features, switch_penalty, smoothness):
+    """(tracks x tracks) cost of moving from one track to the next; staying on a track is free."""
+    features = np.asarray(features, dtype=np.float64)
+    squared = (features ** 2).sum(axis=1)
+    distances = np.maximum(squared[:, None] - 2 * features @ features.T + squared[None, :], 0.0)
+    transitions = switch_penalty + smoothness * distances
+    np.fill_diagonal(transitions, 0.0)
+    return transitions
+
+
+def viterbi(unary, transitions, entry=None):
+    """Cheapest path through (steps x states) unary costs; returns (states, total cost).
+
+    entry is an optional per-state cost for the first step. Each step is one vectorized
+    (states x states) update, so the pass is linear in the number of steps.
+    """
+    steps, states = unary.shape
+    if steps == 0:
+        return np.array([], dtype=np.int64), 0.0
+    cost = unary[0] + (entry if entry is not None else 0.0)
+    backpointers = np.empty((steps, states), dtype=np.int32)
+    columns = np.arange(states)
+    for step in range(1, steps):
+        totals = cost[:, None] + transitions
+        backpointers[step] = np.argmin(totals, axis=0)
+        cost = totals[backpointers[step], columns] + unary[step]
+    path = np.empty(steps, dtype=np.int64)
+    path[-1] = int(np.argmin(cost))
+    for step in range(steps - 1, 0, -1):
+        path[step - 1] = backpointers[step, path[step]]
+    return path, float(cost[path[-1]])
+
+
+def run_starts(path):
+    """Indices where a new run of the same state begins."""
+    path = np.asarray(path)
+    if not len(path):
+        return np.array([], dtype=np.int64)
+    return np.flatnonzero(np.concatenate([[True], path[1:] != path[:-1]]))
+
+
+class SoundtrackPlanner:
+    """Assign one track to every paragraph of a book so the soundtrack fits the mood and flows.
+
+    The cost of a plan adds up three terms:
+
+    * mood fit: the distance between each paragraph's mood target and its track's audio features
+    * transitions: switch_penalty for every track change plus smoothness times the feature distance
+      between the outgoing and incoming track, so changes go to similar-sounding tracks
+    * repetition: repeat_penalty for every time a track is entered again after it was left,
+      multiplied by the number of times it has already been played in the book
+
+    A recommender reads the book in chapters of chapter_paragraphs paragraphs, runs each chapter's
+    chapter_queries most common queries once and keeps at most pool_size candidate tracks.
+    Chapters are planned one after another with a Viterbi pass each. Repetition is not a
+    per-step cost, so each chapter is re-planned for `rounds` rounds with the repeats of the previous
+    round priced into the transitions, keeping the plan with the lowest true cost. Play counts and the
+    last track carry over into the next chapter.
+    """
+
+    def __init__(self, switch_penalty=0.05, smoothness=0.5, repeat_penalty=0.1, query_bonus=0.02,
+                 rounds=3, weights=None, chapter_paragraphs=DEFAULT_CHAPTER_PARAGRAPHS,
+                 pool_size=DEFAULT_POOL_SIZE, chapter_queries=DEFAULT_CHAPTER_QUERIES):
+        """chapter_paragraphs, pool_size and chapter_queries bound how much a recommender searches per chapter."""
+        self.chapter_paragraphs = max(1, chapter_paragraphs)
+        self.pool_size = max(1, pool_size)
+        self.chapter_queries = chapter_queries
+        self.switch_penalty = switch_penalty
+        self.smoothness = smoothness
+        self.repeat_penalty = repeat_penalty
+        # Subtracted from the fit of a track found by one of the paragraph's own queries
+        self.query_bonus = query_bonus
+        self.rounds = max(1, rounds)
+        self.weights = None if weights is None else np.array([weights.get(name, 0.0) for name in FEATURE_NAMES])
+        self.reset()
+
+    def reset(self):
+        """Forget play counts and the last track, before planning a new book."""
+        self.plays = {}
+        self.last_track = None
+        self.last_features = None
+
+    def unary_costs(self, targets, features, paragraph_queries=(), reasons=()):
+        """Mood fit for every (paragraph, track) pair, less the query bonus."""
+        unary = fit_costs(targets, features, self.weights)
+        if self.query_bonus and reasons:
+            columns = {}
+            for column, reason in enumerate(reasons):
+                columns.setdefault(reason, []).append(column)
+            for row, queries in enumerate(paragraph_queries):
+                for query in queries:
+                    if query in columns:
+                        unary[row, columns[query]] -= self.query_bonus
+        return unary
+
+    def plan_cost(self, path, unary, transitions, entry, prior_plays, continuing=None):
+        """The true cost of a chapter plan, with repeats counted in play order.
+
+        entry already prices the first run (including its repeats of earlier chapters). continuing is the
+        track index that carries on from the previous chapter, whose first run is no new play.
+        """
+        if not len(path):
+            return 0.0
+        cost = unary[np.arange(len(path)), path].sum() + entry[path[0]] + transitions[path[:-1], path[1:]].sum()
+        plays = dict(prior_plays)
+        for start in run_starts(path):
+            state = int(path[start])
+            if start > 0:
+                cost += self.repeat_penalty * plays.get(state, 0)
+            elif state == continuing:
+                continue
+            plays[state] = plays.get(state, 0) + 1
+        return float(cost)
+
+    def plan_chapter(self, unary, features, track_ids):
+        """Return the track index for each paragraph of a chapter and record its plays.
+
+        unary is the (paragraphs x tracks) cost from unary_costs and features the tracks' feature matrix.
+        """
+        features = np.asarray(features, dtype=np.float64)
+        transitions = transition_costs(features, self.switch_penalty, self.smoothness)
+        prior_plays = {column: self.plays.get(track_id, 0) for column, track_id in enumerate(track_ids)}
+        prior = np.array([prior_plays[column] for column in range(len(track_ids))], dtype=np.float64)
+
+        # Entering the chapter on a track continues from the previous chapter's last one
+        entry = self.repeat_penalty * prior
+        continuing = track_ids.index(self.last_track) if self.last_track in track_ids else None
+        if self.last_features is not None:
+            entry = entry + transition_costs(np.vstack([self.last_features, features]),
+                                             self.switch_penalty, self.smoothness)[0, 1:]
+        if continuing is not None:
+            # Carrying on with the same track is free and is not a repeat
+            entry[continuing] = 0.0
+
+        best_path, best_cost = None, None
+        repeats = np.zeros(len(track_ids))
+        for _ in range(self.rounds):
+            # Off-diagonal entries into a track cost one repeat penalty per earlier play
+            entering = transitions + self.repeat_penalty * (prior + repeats)[None, :]
+            np.fill_diagonal(entering, 0.0)
+            path, _ = viterbi(unary, entering, entry)
+            cost = self.plan_cost(path, unary, transitions, entry, prior_plays, continuing)
+            if best_cost is None or cost < best_cost:
+                best_path, best_cost = path, cost
+            starts = np.bincount(path[run_starts(path)], minlength=len(track_ids))
+            next_repeats = np.maximum(starts - 1, 0).astype(np.float64)
+            if np.array_equal(next_repeats, repeats):
+                break
+            repeats = next_repeats
+
+        for start in run_starts(best_path):
+            # A chapter that opens on the previous chapter's last track continues its run
+            if start == 0 and best_path[0] == continuing:
+                continue
+            track_id = track_ids[int(best_path[start])]
+            self.plays[track_id] = self.plays.get(track_id, 0) + 1
+        if len(best_path):
+            self.last_features = features[best_path[-1]]
+            self.last_track = track_ids[int(best_path[-1])]
+        return best_path
+
+
+def cues_from_plan(paragraph_indices, word_counts, tracks):
+    """Collapse per-paragraph track picks into SoundtrackCues.
+
+    tracks holds one dict per paragraph (track_id, title, artist, spotify_url, preview_url), in order,
+    or None for a paragraph left without music; a gap ends the current cue.
+    """
+    cues = []
+    previous = None
+    for index, words, track in zip(paragraph_indices, word_counts, tracks):
+        if track is None:
+            previous = None
+            continue
+        if previous is not None and previous['track_id'] == track['track_id']:
+            cues[-1] = cues[-1]._replace(last_paragraph=index, words=cues[-1].words + words)
+        else:
+            cues.append(SoundtrackCue(track['track_id'], track['title'], track['artist'], track['spotify_url'],
+                                      track.get('preview_url'), index, index, words))
+        previous = track
+    return cues
@@ -0,0 +1,228 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+import os
+import shutil
+import subprocess
+import wave
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from previewFeatures import PreviewFeatureCache, decode_preview
+
+DEFAULT_SAMPLE_RATE = 44100
+DEFAULT_CHANNELS = 2
+# Typical adult silent-reading speed
+DEFAULT_WORDS_PER_MINUTE = 240
+DEFAULT_MIN_CUE_SECONDS = 10.0
+DEFAULT_CROSSFADE_SECONDS = 3.0
+# Overlap blended in where a preview is looped to fill a cue longer than the clip
+DEFAULT_LOOP_CROSSFADE_SECONDS = 0.5
+DEFAULT_BLOCK_SECONDS = 1.0
+DEFAULT_PREFETCH = 2
+
+# One stretch of the soundtrack: a track's preview played for seconds (looped if it is shorter)
+RenderCue = namedtuple('RenderCue', ['track_id', 'title', 'preview_url', 'seconds'])
+RenderResult = namedtuple('RenderResult', ['output_path', 'seconds', 'cues', 'silent_cues'])
+
+
+def reading_seconds(words, words_per_minute=DEFAULT_WORDS_PER_MINUTE, min_seconds=DEFAULT_MIN_CUE_SECONDS):
+    """Estimated time to read a number of words."""
+    return max(min_seconds, 60.0 * words / words_per_minute)
+
+
+def render_cues(cues, words_per_minute=DEFAULT_WORDS_PER_MINUTE, min_seconds=DEFAULT_MIN_CUE_SECONDS):
+    """Turn SoundtrackCues (anything with track_id, title, preview_url and words) into RenderCues."""
+    return [
+        RenderCue(cue.track_id, cue.title, cue.preview_url, reading_seconds(cue.words, words_per_minute, min_seconds))
+        for cue in cues
+    ]
+
+
+def loopable(samples, overlap):
+    """Blend a clip's last overlap frames into its first ones, so repeating it has no audible seam."""
+    overlap = min(overlap, len(samples) // 4)
+    if overlap < 1:
+        return samples
+    ramp = np.linspace(0.0, 1.0, overlap, dtype=np.float32)[:, None]
+    looped = samples[:len(samples) - overlap].copy()
+    looped[:overlap] = samples[:overlap] * ramp + samples[len(samples) - overlap:] * (1.0 - ramp)
+    return looped
+
+
+class WavEncoder:
+    """16-bit PCM WAV written block by block with the standard library; needs no ffmpeg."""
+
+    def __init__(self, path, sample_rate, channels):
+        self._file = wave.open(path, 'wb')
+        self._file.setnchannels(channels)
+        self._file.setsampwidth(2)
+        self._file.setframerate(sample_rate)
+
+    def write(self, block):
+        self._file.writeframes((np.clip(block, -1.0, 1.0) * 32767).astype('<i2').tobytes())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class FfmpegEncoder:
+    """Pipe raw float32 PCM into an ffmpeg process that encodes it by the output file's extension.
+
+    ffmpeg runs alongside the renderer, so encoding overlaps with mixing and decoding.
+    """
+
+    def __init__(self, path, sample_rate, channels, bitrate=None):
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            raise RuntimeError(f"Rendering to {os.path.splitext(path)[1] or path} needs ffmpeg; render to .wav instead")
+        command = [ffmpeg, "-hide_banner", "-loglevel", "error", "-y",
+                   "-f", "f32le", "-ar", str(sample_rate), "-ac", str(channels), "-i", "pipe:0"]
+        if bitrate:
+            command += ["-b:a", bitrate]
+        self._process = subprocess.Popen(command + [path], stdin=subprocess.PIPE)
+
+    def write(self, block):
+        self._process.stdin.write(np.ascontiguousarray(np.clip(block, -1.0, 1.0), dtype='<f4').tobytes())
+
+    def close(self):
+        if self._process is not None:
+            self._process.stdin.close()
+            returncode = self._process.wait()
+            self._process = None
+            if returncode:
+                raise RuntimeError(f"ffmpeg exited with status {returncode}")
+
+
+def open_encoder(path, sample_rate=DEFAULT_SAMPLE_RATE, channels=DEFAULT_CHANNELS, bitrate="192k"):
+    """A WavEncoder for .wav paths, otherwise an FfmpegEncoder (mp3, ogg, m4a, flac, ...)."""
+    if os.path.splitext(path)[1].lower() == ".wav":
+        return WavEncoder(path, sample_rate, channels)
+    return FfmpegEncoder(path, sample_rate, channels, None if path.lower().endswith(".flac") else bitrate)
+
+
+class SoundtrackRenderer:
+    """Mix a sequence of cues into one continuous, crossfaded audio file.
+
+    Each cue plays its track's preview clip, looped if the cue is longer than the clip, and hands
+    over to the next cue with an equal-power crossfade. The output is mixed and encoded one block of
+    block_seconds at a time, and only the clips of the cues playing now and the next `prefetch` cues
+    are held in memory (decoded ahead on background threads), so memory stays flat however long the
+    soundtrack is. Previews come from a PreviewFeatureCache's content-addressed store, so clips
+    already downloaded for local audio features are not fetched again.
+    """
+
+    def __init__(self, preview_cache=None, sample_rate=DEFAULT_SAMPLE_RATE, channels=DEFAULT_CHANNELS,
+                 crossfade=DEFAULT_CROSSFADE_SECONDS, loop_crossfade=DEFAULT_LOOP_CROSSFADE_SECONDS,
+                 block_seconds=DEFAULT_BLOCK_SECONDS, prefetch=DEFAULT_PREFETCH,
+                 words_per_minute=DEFAULT_WORDS_PER_MINUTE, min_cue_seconds=DEFAULT_MIN_CUE_SECONDS, bitrate="192k"):
+        self.preview_cache = preview_cache if preview_cache is not None else PreviewFeatureCache(decode_workers=0)
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.crossfade = max(0.0, crossfade)
+        self.loop_crossfade = loop_crossfade
+        self.block_frames = max(1, int(block_seconds * sample_rate))
+        self.prefetch = max(1, prefetch)
+        self.words_per_minute = words_per_minute
+        self.min_cue_seconds = min_cue_seconds
+        self.bitrate = bitrate
+
+    def load(self, cue, frames):
+        """Decode a cue's preview for `frames` frames of playback; None when it has no usable audio."""
+        if not cue.preview_url:
+            return None
+        path = self.preview_cache.preview_path({'id': cue.track_id, 'preview_url': cue.preview_url})
+        if path is None:
+            return None
+        try:
+            samples, _ = decode_preview(path, self.sample_rate, self.channels)
+        except Exception as e:
+            print(f"Error decoding preview {path}: {str(e)}")
+            return None
+        samples = samples.reshape(len(samples), self.channels)
+        if not len(samples):
+            return None
+        if frames > len(samples):
+            samples = loopable(samples, int(self.loop_crossfade * self.sample_rate))
+        return samples
+
+    @staticmethod
+    def cue_frames(samples, first, last, span, fade):
+        """Frames first..last of a cue playing samples (wrapping around when looped), with its fades applied."""
+        frames = np.empty((last - first, samples.shape[1]), dtype=np.float32)
+        done = 0
+        # Contiguous copies, one per pass through the clip, instead of gathering frame by frame
+        while done < len(frames):
+            offset = (first + done) % len(samples)
+            count = min(len(frames) - done, len(samples) - offset)
+            frames[done:done + count] = samples[offset:offset + count]
+            done += count
+        if fade:
+            # Equal-power fades: sin in over the cue's first fade frames and out over its last ones
+            if first < fade:
+                end = min(last, fade)
+                frames[:end - first] *= np.sin(0.5 * np.pi * np.arange(first, end) / fade)[:, None]
+            if last > span - fade:
+                begin = max(first, span - fade)
+                frames[begin - first:] *= np.sin(0.5 * np.pi * (span - np.arange(begin, last)) / fade)[:, None]
+        return frames
+
+    def render(self, cues, output_path):
+        """Render SoundtrackCues (e.g. from plan_soundtrack) or RenderCues to output_path.
+
+        SoundtrackCues are timed by reading speed. Cues without a playable preview stay silent.
+        Returns a RenderResult.
+        """
+        cues = [cue if isinstance(cue, RenderCue) else
+                render_cues([cue], self.words_per_minute, self.min_cue_seconds)[0] for cue in cues]
+        fade = int(self.crossfade * self.sample_rate)
+        # Cue i starts where the previous ones' reading time ends and keeps playing through the crossfade
+        lengths = [max(1, int(cue.seconds * self.sample_rate)) for cue in cues]
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64) if cues else []
+        spans = [length + fade for length in lengths]
+        total = int(starts[-1] + spans[-1]) if cues else 0
+
+        encoder = open_encoder(output_path, self.sample_rate, self.channels, self.bitrate)
+        loading = deque()
+        playing = []
+        silent = 0
+        next_cue = 0
+        try:
+            with ThreadPoolExecutor(max_workers=self.prefetch, thread_name_prefix="soundtrack-decode") as pool:
+                def prefetch():
+                    # Keep the next few cues decoding while the current blocks are mixed and encoded
+                    while len(loading) < self.prefetch and next_cue + len(loading) < len(cues):
+                        index = next_cue + len(loading)
+                        loading.append((index, pool.submit(self.load, cues[index], spans[index])))
+
+                for block_start in range(0, total, self.block_frames):
+                    block_end = min(total, block_start + self.block_frames)
+                    prefetch()
+                    while next_cue < len(cues) and starts[next_cue] < block_end:
+                        index, future = loading.popleft()
+                        samples = future.result()
+                        if samples is None:
+                            silent += 1
+                        else:
+                            playing.append((int(starts[index]), spans[index], samples))
+                        next_cue += 1
+                        prefetch()
+
+                    block = np.zeros((block_end - block_start, self.channels), dtype=np.float32)
+                    for start, span, samples in playing:
+                        first, last = max(block_start, start), min(block_end, start + span)
+                        if first < last:
+                            block[first - block_start:last - block_start] += self.cue_frames(
+                                samples, first - start, last - start, span, fade)
+                    encoder.write(block)
+                    # Clips are released as soon as their cue has faded out
+                    playing = [entry for entry in playing if entry[0] + entry[1] > block_end]
+        finally:
+            encoder.close()
+
+        seconds = total / self.sample_rate
+        print(f"Rendered {len(cues)} cues ({seconds / 60:.1f} minutes, {silent} without audio) to {output_path}")
+        return RenderResult(output_path, seconds, len(cues), silent)
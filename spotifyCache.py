@@ -0,0 +1,254 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Spotify accepts at most 100 track IDs per audio-features request
+AUDIO_FEATURES_BATCH_SIZE = 100
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "music_director", "spotify_cache.sqlite")
+DEFAULT_TTL = 30 * 24 * 60 * 60  # 30 days
+DEFAULT_SEARCH_TTL = 7 * 24 * 60 * 60  # Search rankings drift faster than audio features
+DEFAULT_NEGATIVE_TTL = 60 * 60  # Tracks without features are retried after an hour
+DEFAULT_FEATURE_MEMORY_ENTRIES = 16384
+SQLITE_TIMEOUT = 30.0
+
+
+def track_key(track):
+    """The ID of a Spotify track dict, or the argument itself when it already is an ID."""
+    return track['id'] if isinstance(track, dict) else track
+
+
+class _DiskStore:
+    """Small SQLite key/value table with a per-entry TTL, shared by the caches below."""
+
+    def __init__(self, path, table, ttl=DEFAULT_TTL):
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Several processes may share one cache file: WAL lets readers run alongside a writer,
+        # and the timeout makes a blocked writer wait for the lock instead of failing
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=SQLITE_TIMEOUT)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys):
+        """Return a dict of key -> decoded value for the keys that are present and fresh."""
+        found = {}
+        if not keys:
+            return found
+        oldest = time.time() - self.ttl if self.ttl else 0
+        with self._lock:
+            # Stay below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM {self.table} WHERE key IN ({placeholders}) AND stored_at >= ?",
+                    (*chunk, oldest)
+                ).fetchall()
+                for key, value in rows:
+                    found[key] = json.loads(value)
+        return found
+
+    def put_many(self, items):
+        """Store (key, value) pairs, replacing any existing entries."""
+        now = time.time()
+        rows = [(key, json.dumps(value), now) for key, value in items]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, stored_at) VALUES (?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def values(self):
+        """Return every fresh value in the table."""
+        oldest = time.time() - self.ttl if self.ttl else 0
+        with self._lock:
+            rows = self._conn.execute(f"SELECT value FROM {self.table} WHERE stored_at >= ?", (oldest,)).fetchall()
+        return [json.loads(value) for value, in rows]
+
+    def purge_expired(self):
+        """Delete entries older than the TTL."""
+        if not self.ttl:
+            return
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE stored_at < ?", (time.time() - self.ttl,))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class AudioFeatureCache:
+    """Resolve Spotify audio features in batches, backed by an on-disk cache keyed by track ID.
+
+    The in-memory tier is an LRU of max_entries tracks. A track Spotify has no features for is only
+    remembered in memory, for negative_ttl seconds, so a transient empty response is retried later
+    instead of being stored for the full ttl.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, batch_size=AUDIO_FEATURES_BATCH_SIZE,
+                 max_entries=DEFAULT_FEATURE_MEMORY_ENTRIES, negative_ttl=DEFAULT_NEGATIVE_TTL):
+        self.store = _DiskStore(path, "audio_features", ttl) if path else None
+        self.batch_size = min(batch_size, AUDIO_FEATURES_BATCH_SIZE)
+        self.max_entries = max(1, max_entries)
+        self.negative_ttl = negative_ttl
+        # track ID -> (features or None, time stored)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.api_calls = 0
+
+    def _remember(self, items):
+        now = time.time()
+        with self._lock:
+            for track_id, features in items:
+                self._memory[track_id] = (features, now)
+                self._memory.move_to_end(track_id)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def get_features(self, sp, tracks):
+        """Return a dict of track ID -> audio features (None when Spotify has none).
+
+        tracks may be track IDs or Spotify track dicts, so other feature sources that need more
+        than the ID (e.g. previewFeatures.PreviewFeatureCache) can be swapped in.
+        """
+        unique_ids = list(dict.fromkeys(track_key(track) for track in tracks if track and track_key(track)))
+        resolved = {}
+
+        oldest_negative = time.time() - self.negative_ttl
+        with self._lock:
+            for track_id in unique_ids:
+                entry = self._memory.get(track_id)
+                if entry is not None and (entry[0] is not None or entry[1] >= oldest_negative):
+                    resolved[track_id] = entry[0]
+                    self._memory.move_to_end(track_id)
+
+        pending = [track_id for track_id in unique_ids if track_id not in resolved]
+        if pending and self.store is not None:
+            # Entries stored as None by older versions are fetched again
+            stored = {track_id: features for track_id, features in self.store.get_many(pending).items() if features}
+            resolved.update(stored)
+            self._remember(stored.items())
+            pending = [track_id for track_id in pending if track_id not in stored]
+
+        fetched = {}
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            results = sp.audio_features(batch) or []
+            with self._lock:
+                self.api_calls += 1
+            for track_id, features in zip(batch, results):
+                fetched[track_id] = features
+
+        if fetched:
+            resolved.update(fetched)
+            self._remember(fetched.items())
+            if self.store is not None:
+                self.store.put_many((track_id, features) for track_id, features in fetched.items() if features)
+
+        with self._lock:
+            self.hits += len(unique_ids) - len(pending)
+            self.misses += len(pending)
+
+        return resolved
+
+    def get_feature(self, sp, track):
+        """Return the audio features for a single track dict or ID."""
+        return self.get_features(sp, [track]).get(track_key(track))
+
+    def stats(self):
+        """Return hit/miss counters and how many per-track API calls the cache saved."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "api_calls": self.api_calls,
+                "api_calls_saved": lookups - self.api_calls,
+            }
+
+
+class SearchCache:
+    """Memoize Spotify searches with an in-memory LRU and an optional on-disk tier."""
+
+    def __init__(self, max_entries=4096, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_SEARCH_TTL):
+        self.max_entries = max_entries
+        self.store = _DiskStore(path, "search_results", ttl) if path else None
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(query, search_type, limit):
+        """Normalize a query so trivially different spellings share one entry."""
+        return f"{search_type}|{limit}|{' '.join(query.lower().split())}"
+
+    def _remember(self, key, results):
+        with self._lock:
+            self._memory[key] = results
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def search(self, sp, query, search_type='track', limit=50):
+        """Return search results for a query, calling Spotify only on a cache miss."""
+        key = self.make_key(query, search_type, limit)
+
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+        if self.store is not None:
+            stored = self.store.get_many([key])
+            if key in stored:
+                self._remember(key, stored[key])
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                return stored[key]
+
+        results = sp.search(q=query, type=search_type, limit=limit)
+        with self._lock:
+            self.misses += 1
+        self._remember(key, results)
+        if self.store is not None:
+            self.store.put_many([(key, results)])
+        return results
+
+    def stats(self):
+        """Return hit/miss counters for the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._memory),
+            }
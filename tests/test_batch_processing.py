@@ -0,0 +1,27 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+import functools
+
+import pytest
+
+from batchProcessing import BatchProcessor, BookJob
+from musicBackend import FakeMusicBackend
+from SceneSongs import FILM_COMPOSERS
+
+
+@pytest.mark.parametrize("mode", ["books", "chunks"])
+def test_corrupt_pdf_fails_only_its_own_book(tmp_path, mode):
+    jobs = []
+    for name in ("first", "second"):
+        pdf_path = tmp_path / f"{name}.pdf"
+        pdf_path.write_bytes(b"not a pdf")
+        jobs.append(BookJob(str(pdf_path), str(tmp_path / f"{name}.txt")))
+
+    processor = BatchProcessor(None, None, FILM_COMPOSERS, workers=1, mode=mode,
+                               cache_path=str(tmp_path / "cache.sqlite"),
+                               backend_factory=functools.partial(FakeMusicBackend.synthetic, FILM_COMPOSERS))
+    results = processor.process_books(jobs)
+
+    assert [result.pdf_path for result in results] == [job.pdf_path for job in jobs]
+    assert all(result.error and "PdfReadError" in result.error for result in results)
+    assert all(result.paragraphs == 0 for result in results)
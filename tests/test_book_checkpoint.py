@@ -0,0 +1,68 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+import pytest
+
+from bookCheckpoint import CheckpointJournal
+from bookOutput import JsonLinesWriter
+from MusicDirectorPDF import BookMusicRecommender
+from musicBackend import FakeMusicBackend
+from paragraphStore import ParagraphStore
+from pdfExtraction import ExtractionCache, PdfTextExtractor
+from SceneSongs import FILM_COMPOSERS, SongRecommendation
+from spotifyCache import AudioFeatureCache, SearchCache
+
+SONG = SongRecommendation("Theme", "Composer", "https://open.spotify.com/track/1", 0.5, "calm", "1")
+
+
+def test_resume_keeps_recorded_paragraphs_and_output(tmp_path):
+    output = str(tmp_path / "book.jsonl")
+    journal = CheckpointJournal(str(tmp_path / "book.checkpoint"), flush_every=2)
+    journal.open()
+    writer = JsonLinesWriter(output)
+    for index in (1, 2):
+        writer.write({'index': index})
+        journal.record(index, [SONG], writer.tell(), writer)
+    offset = writer.tell()
+    # A paragraph that was written but never checkpointed
+    writer.write({'index': 3})
+    writer.close()
+    journal.close()
+
+    journal = CheckpointJournal(str(tmp_path / "book.checkpoint"))
+    entries, output_offset = journal.load()
+    assert sorted(entries) == [1, 2]
+    assert entries[2]['recommendations'][0]['title'] == "Theme"
+    assert output_offset == offset
+
+    JsonLinesWriter(output, resume_offset=output_offset).close()
+    with open(output) as f:
+        assert f.read() == '{"index": 1}\n{"index": 2}\n'
+
+
+def test_torn_journal_tail_is_truncated_on_resume(tmp_path):
+    path = str(tmp_path / "book.checkpoint")
+    journal = CheckpointJournal(path, flush_every=1)
+    journal.open()
+    journal.record(1, [SONG], 10)
+    journal.close()
+    with open(path, 'a') as f:
+        f.write('{"index": 2, "recommen')
+
+    journal = CheckpointJournal(path, flush_every=1)
+    entries, output_offset = journal.load()
+    assert sorted(entries) == [1] and output_offset == 10
+    journal.open(resume=True)
+    journal.record(2, [], 20)
+    journal.close()
+
+    entries, output_offset = CheckpointJournal(path).load()
+    assert sorted(entries) == [1, 2] and output_offset == 20
+
+
+def test_parquet_output_rejects_resume(tmp_path):
+    recommender = BookMusicRecommender(None, None, FILM_COMPOSERS, sp=FakeMusicBackend.synthetic(FILM_COMPOSERS, seed=0),
+                                       feature_cache=AudioFeatureCache(path=None), search_cache=SearchCache(path=None),
+                                       paragraph_store=ParagraphStore(path=None),
+                                       pdf_extractor=PdfTextExtractor(cache=ExtractionCache(path=None)))
+    with pytest.raises(ValueError, match="cannot be resumed"):
+        recommender.open_report(str(tmp_path / "book.parquet"), resume=True)
@@ -0,0 +1,49 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+import random
+
+from candidatePool import CandidatePool, weighted_score
+
+
+def track(track_id):
+    return {'id': track_id, 'name': f"Song {track_id}", 'artists': [{'name': "Composer"}]}
+
+
+def features(rng):
+    return {'valence': rng.random(), 'energy': rng.random(), 'instrumentalness': rng.random(),
+            'acousticness': rng.random()}
+
+
+def test_top_k_matches_a_full_sort():
+    rng = random.Random(0)
+    tracks = [track(str(i)) for i in range(200)]
+    features_by_id = {t['id']: features(rng) for t in tracks}
+    # Starts small, so adding grows the feature matrix several times
+    pool = CandidatePool('scene', capacity=4)
+    assert pool.add(tracks, features_by_id, reason="storm") == 200
+
+    expected = sorted(tracks, key=lambda t: -weighted_score(features_by_id[t['id']], 'scene'))
+    for k in (1, 5, 50, 200, 500):
+        assert list(pool.top_ids(k)) == [t['id'] for t in expected[:k]]
+    assert pool.top_ids(0) == ()
+    assert [entry.track_id for entry in pool.top(3, weights='ambient')] == \
+        [t['id'] for t in sorted(tracks, key=lambda t: -weighted_score(features_by_id[t['id']], 'ambient'))[:3]]
+
+
+def test_tracks_are_deduplicated_by_id():
+    rng = random.Random(1)
+    features_by_id = {track_id: features(rng) for track_id in "abc"}
+    pool = CandidatePool('scene')
+    pool.add([track("a"), track("b")], features_by_id, reason="rain")
+    # A track found again keeps its first row and reason; one without features is skipped
+    assert pool.add([track("b"), track("c"), track("d")], features_by_id, reason="night") == 2
+    assert len(pool) == 3 and "d" not in pool
+    reasons = {entry.track_id: entry.reason for entry in pool.top()}
+    assert reasons == {"a": "rain", "b": "rain", "c": "night"}
+
+
+def test_ties_keep_discovery_order():
+    same = {'valence': 0.5, 'energy': 0.5, 'instrumentalness': 0.5, 'acousticness': 0.5}
+    pool = CandidatePool('scene')
+    pool.add([track(track_id) for track_id in "zyxw"], {track_id: same for track_id in "zyxw"})
+    assert pool.top_ids() == ("z", "y", "x", "w")
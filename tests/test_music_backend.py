@@ -0,0 +1,21 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+import copy
+
+import pytest
+
+from musicBackend import FakeMusicBackend, InstrumentedBackend, SpotipyBackend
+from queryExecutor import RateLimitedClient
+
+
+@pytest.mark.parametrize("cls", [SpotipyBackend, InstrumentedBackend, RateLimitedClient])
+def test_half_built_wrappers_raise_attribute_error(cls):
+    wrapper = cls.__new__(cls)
+    with pytest.raises(AttributeError):
+        wrapper.artist_albums
+    assert isinstance(copy.copy(wrapper), cls)
+
+
+def test_wrapper_forwards_to_its_client():
+    backend = FakeMusicBackend.synthetic(["Hans Zimmer"], seed=0)
+    assert SpotipyBackend(backend).stats == backend.stats
@@ -0,0 +1,54 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+from MusicDirectorPDF import BookMusicRecommender
+from musicBackend import FakeMusicBackend
+from paragraphStore import ParagraphStore
+from pdfExtraction import ExtractionCache, PdfTextExtractor
+from SceneSongs import FILM_COMPOSERS
+from spotifyCache import AudioFeatureCache, SearchCache
+
+PARAGRAPHS = ["The storm rolled over the\nharbour at night.", "She laughed and ran down to the water."]
+
+
+def recommender(store, artist_scoped=False):
+    book = BookMusicRecommender(None, None, FILM_COMPOSERS, sp=FakeMusicBackend.synthetic(FILM_COMPOSERS, seed=0),
+                                feature_cache=AudioFeatureCache(path=None), search_cache=SearchCache(path=None),
+                                paragraph_store=store, artist_scoped=artist_scoped,
+                                pdf_extractor=PdfTextExtractor(cache=ExtractionCache(path=None)))
+    book.analyzed = []
+
+    def analyze_texts(items, as_tuples=False):
+        # Stands in for the spaCy pipeline: every word of the paragraph is a mood word
+        for text, context in items:
+            book.analyzed.append(text)
+            yield {"text": text, "mood_words": text.split()[:3], "entities": [], "topics": [], "sentiment": 0}, context
+
+    book.analyze_texts = analyze_texts
+    return book
+
+
+def run(book, paragraphs):
+    located = [(paragraph, (i, 1, 0)) for i, paragraph in enumerate(paragraphs, 1)]
+    return list(book.recommend_paragraphs(located))
+
+
+def test_unchanged_paragraphs_are_reused(tmp_path):
+    store = ParagraphStore(path=str(tmp_path / "cache.sqlite"))
+    first = run(recommender(store), PARAGRAPHS)
+
+    # Re-flowed whitespace is not an edit; the second paragraph was revised
+    revised = recommender(store)
+    second = run(revised, [" The storm rolled over the harbour\n at night. ", PARAGRAPHS[1] + " Again."])
+    assert revised.analyzed == [PARAGRAPHS[1] + " Again."]
+    assert second[0].recommendations == first[0].recommendations
+    assert second[0].queries == first[0].queries
+    assert store.stats()["hits"] == 1
+
+
+def test_changed_config_invalidates_stored_results():
+    store = ParagraphStore(path=None)
+    run(recommender(store), PARAGRAPHS)
+    scoped = recommender(store, artist_scoped=True)
+    assert scoped.config_fingerprint() != recommender(store).config_fingerprint()
+    run(scoped, PARAGRAPHS)
+    assert scoped.analyzed == PARAGRAPHS
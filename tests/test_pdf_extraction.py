@@ -0,0 +1,44 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+from MusicDirectorPDF import BookMusicRecommender
+from musicBackend import FakeMusicBackend
+from paragraphStore import ParagraphStore
+from pdfExtraction import ExtractionCache, PageText
+from SceneSongs import FILM_COMPOSERS
+from spotifyCache import AudioFeatureCache, SearchCache
+
+
+class PageSource:
+    def __init__(self, pages):
+        self.pages = pages
+
+    def iter_pages(self, pdf_path):
+        return iter(self.pages)
+
+    def stats(self):
+        return {}
+
+
+def paragraphs(pages):
+    recommender = BookMusicRecommender(None, None, FILM_COMPOSERS, sp=FakeMusicBackend.synthetic(FILM_COMPOSERS, seed=0),
+                                       feature_cache=AudioFeatureCache(path=None), search_cache=SearchCache(path=None),
+                                       paragraph_store=ParagraphStore(path=None), pdf_extractor=PageSource(pages))
+    return list(recommender.iter_paragraphs_from_pdf("book.pdf"))
+
+
+def test_paragraph_continues_across_a_page_break():
+    pages = [PageText(1, "Opening.\n\nThe rain kept", None), PageText(2, "falling all night.", None)]
+    assert paragraphs(pages) == [(1, "Opening."), (1, "The rain kept falling all night.")]
+
+
+def test_paragraph_is_not_joined_across_a_failed_page():
+    pages = [PageText(1, "The rain kept", None), PageText(2, "", "PdfReadError: broken"),
+             PageText(3, "falling all night.", None)]
+    assert paragraphs(pages) == [(1, "The rain kept"), (3, "falling all night.")]
+
+
+def test_memory_cache_keeps_the_most_recent_pages():
+    cache = ExtractionCache(path=None, max_entries=3)
+    cache.put_pages("book", 4, [PageText(number, f"page {number}", None) for number in range(1, 5)])
+    assert cache.page_count("book") is None
+    assert cache.get_pages("book", range(1, 5)) == {2: "page 2", 3: "page 3", 4: "page 4"}
@@ -0,0 +1,17 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+import previewFeatures
+from previewFeatures import PreviewFeatureCache
+
+
+def test_decode_failures_are_remembered_per_digest(tmp_path, monkeypatch):
+    decoded = []
+    monkeypatch.setattr(previewFeatures, "measure_preview", lambda path: decoded.append(path))
+    cache = PreviewFeatureCache(directory=str(tmp_path), path=None, decode_workers=0)
+    assert cache._measure(["broken"]) == {}
+    assert cache._measure(["broken"]) == {}
+    assert len(decoded) == 1
+
+    cache.negative_ttl = -1
+    cache._measure(["broken"])
+    assert len(decoded) == 2
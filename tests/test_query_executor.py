@@ -0,0 +1,89 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+import threading
+import time
+
+import pytest
+from spotipy.exceptions import SpotifyException
+
+from queryExecutor import QueryExecutor, TokenBucket
+
+
+def test_imap_keeps_submission_order():
+    executor = QueryExecutor(max_workers=4, requests_per_second=1000)
+
+    def slow(item):
+        # Later items finish first
+        time.sleep((8 - item) * 0.005)
+        return item
+
+    assert list(executor.imap(slow, range(8))) == list(range(8))
+
+
+def test_closing_imap_early_submits_no_more_work():
+    executor = QueryExecutor(max_workers=3, requests_per_second=1000)
+    started = []
+    lock = threading.Lock()
+
+    def record(item):
+        with lock:
+            started.append(item)
+        return item
+
+    results = executor.imap(record, range(20))
+    assert next(results) == 0
+    results.close()
+    time.sleep(0.05)
+    assert len(started) <= 3
+
+
+class ObservedBucket(TokenBucket):
+    def __init__(self, rate):
+        super().__init__(rate)
+        self.paused = threading.Event()
+
+    def pause(self, seconds):
+        super().pause(seconds)
+        self.paused.set()
+
+
+class FlakyClient:
+    def __init__(self, status, retry_after=None):
+        self.status = status
+        self.retry_after = retry_after
+        self.calls = 0
+
+    def search(self, q):
+        self.calls += 1
+        if self.calls == 1:
+            headers = {'Retry-After': self.retry_after} if self.retry_after is not None else {}
+            raise SpotifyException(self.status, -1, "error", headers=headers)
+        return {'q': q}
+
+
+def test_429_pauses_the_shared_limiter_for_retry_after():
+    limiter = ObservedBucket(rate=1000)
+    executor = QueryExecutor(rate_limiter=limiter)
+    client = executor.wrap(FlakyClient(429, retry_after="0.2"))
+
+    start = time.monotonic()
+    assert client.search("storm") == {'q': "storm"}
+    assert time.monotonic() - start >= 0.2
+    assert client.rate_limited == 1
+
+    # Every other caller of the limiter waits out the pause too
+    limiter.paused.clear()
+    thread = threading.Thread(target=executor.wrap(FlakyClient(429, retry_after="0.3")).search, args=("rain",))
+    thread.start()
+    limiter.paused.wait(5)
+    start = time.monotonic()
+    limiter.acquire()
+    thread.join(5)
+    assert time.monotonic() - start >= 0.2
+
+
+def test_client_errors_are_not_retried():
+    client = FlakyClient(404)
+    with pytest.raises(SpotifyException):
+        QueryExecutor(requests_per_second=1000).wrap(client).search("storm")
+    assert client.calls == 1
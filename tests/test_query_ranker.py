@@ -0,0 +1,37 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+import pytest
+
+from queryRanker import BudgetedClient, BudgetExhausted, CallBudget
+
+
+class FeatureClient:
+    def __init__(self):
+        self.calls = 0
+
+    def audio_features(self, tracks):
+        self.calls += 1
+        return [None] * len(tracks)
+
+
+def test_reserved_calls_count_towards_exhaustion():
+    budget = CallBudget(4)
+    child = budget.reserve(4)
+    assert budget.exhausted
+    assert child.try_spend()
+    child.release()
+    assert not budget.exhausted
+    assert budget.spent == 1
+
+
+def test_feature_lookups_are_charged_to_the_budget():
+    budget = CallBudget(3)
+    child = budget.reserve(2)
+    client = FeatureClient()
+    assert child.try_spend()
+    BudgetedClient(client, child).audio_features(["a"])
+    with pytest.raises(BudgetExhausted):
+        BudgetedClient(client, child).audio_features(["b"])
+    child.release()
+    assert client.calls == 1
+    assert budget.spent == 2
@@ -0,0 +1,110 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from MusicDirector import EXAMPLE_STORY
+from SceneSongs import EXAMPLE_SCENE, FILM_COMPOSERS
+from musicBackend import FakeMusicBackend, FakeSpotifyServer
+from paragraphStore import ParagraphStore
+from pdfExtraction import ExtractionCache, PdfTextExtractor
+from queryExecutor import QueryExecutor
+from queryRanker import QueryRanker
+from recommendationService import MicroBatcher, RecommendationService, serve
+from spotifyCache import AudioFeatureCache, SearchCache
+
+
+@pytest.fixture(scope="module")
+def service_url(tmp_path_factory):
+    books = tmp_path_factory.mktemp("books")
+    spotify = FakeSpotifyServer(FakeMusicBackend.synthetic(FILM_COMPOSERS, seed=0)).start()
+    service = RecommendationService(
+        None, None, FILM_COMPOSERS, sp=spotify.client(), executor=QueryExecutor(requests_per_second=1000),
+        feature_cache=AudioFeatureCache(path=None), search_cache=SearchCache(path=None),
+        query_ranker=QueryRanker(path=None), paragraph_store=ParagraphStore(path=None), books_dir=str(books),
+        pdf_extractor=PdfTextExtractor(cache=ExtractionCache(path=None)),
+    )
+    server = serve(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    yield f"http://{host}:{port}"
+    server.shutdown()
+    server.server_close()
+    service.close()
+    spotify.stop()
+
+
+def request(url, body=None, content_type="application/json"):
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    headers = {"Content-Type": content_type} if data is not None else {}
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data, headers=headers), timeout=60) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_scene_story_and_metrics(service_url):
+    # Parsing needs the real spaCy model
+    pytest.importorskip("en_core_web_sm")
+    status, scene = request(service_url + "/scene", {"text": EXAMPLE_SCENE})
+    assert status == 200
+    assert scene["recommendations"]
+    assert all(rec["spotify_url"].startswith("https://open.spotify.com/track/") for rec in scene["recommendations"])
+
+    status, story = request(service_url + "/story", {"text": EXAMPLE_STORY})
+    assert status == 200
+    assert "music" in story
+
+    status, metrics = request(service_url + "/metrics")
+    assert status == 200
+    assert metrics["latency"]["/scene"]["count"] == 1
+    assert metrics["latency"]["/story"]["count"] == 1
+    assert metrics["batching"]["scene"]["items"] == 1
+
+
+def test_rejects_bad_requests(service_url):
+    assert request(service_url + "/scene", {"text": ""})[0] == 400
+    assert request(service_url + "/scene", {"text": "rain"}, content_type="text/plain")[0] == 415
+    assert request(service_url + "/book", {"pdf_path": "../outside.pdf"})[0] == 403
+    assert request(service_url + "/book", {"pdf_path": "book.pdf", "output_file": "/tmp/out.txt"})[0] == 403
+
+
+def test_micro_batcher_fails_queued_items_on_close():
+    started = threading.Event()
+    release = threading.Event()
+
+    def process(items):
+        started.set()
+        release.wait(5)
+        return items
+
+    batcher = MicroBatcher(process, max_batch_size=1, max_wait=0)
+    first = batcher.submit(1)
+    started.wait(5)
+    queued = batcher.submit(2)
+    closer = threading.Thread(target=batcher.close)
+    closer.start()
+    # The second item is still queued when the worker finishes the first batch and sees the stop
+    batcher._stopped.wait(5)
+    release.set()
+    closer.join(5)
+    assert first.result(timeout=5) == 1
+    with pytest.raises(RuntimeError):
+        queued.result(timeout=5)
+
+
+def test_micro_batcher_fails_every_future_on_short_results():
+    batcher = MicroBatcher(lambda items: items[:-1], max_batch_size=4, max_wait=0.05)
+    try:
+        futures = [batcher.submit(item) for item in range(3)]
+        for future in futures:
+            with pytest.raises(RuntimeError):
+                future.result(timeout=5)
+    finally:
+        batcher.close()
@@ -0,0 +1,64 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+import numpy as np
+
+from soundtrackPlanner import SoundtrackPlanner, cues_from_plan, run_starts, viterbi
+
+
+def test_viterbi_trades_fit_against_switching():
+    unary = np.array([[0.0, 1.0], [0.6, 0.0], [0.0, 1.0]])
+    switch = np.array([[0.0, 1.0], [1.0, 0.0]])
+    # Switching for the middle step saves 0.6 but costs 2.0 in transitions
+    path, cost = viterbi(unary, switch)
+    assert path.tolist() == [0, 0, 0]
+    assert cost == 0.6
+
+    path, cost = viterbi(unary, switch * 0.1)
+    assert path.tolist() == [0, 1, 0]
+    assert np.isclose(cost, 0.2)
+
+
+def test_viterbi_entry_costs_and_empty_input():
+    unary = np.zeros((2, 2))
+    path, cost = viterbi(unary, np.ones((2, 2)) - np.eye(2), entry=np.array([1.0, 0.0]))
+    assert path.tolist() == [1, 1]
+    assert cost == 0.0
+    assert viterbi(np.zeros((0, 3)), np.zeros((3, 3)))[0].tolist() == []
+
+
+def test_plan_cost_charges_prior_plays_once_on_entry():
+    planner = SoundtrackPlanner(switch_penalty=0.0, smoothness=0.0, repeat_penalty=1.0)
+    unary = np.zeros((1, 2))
+    transitions = np.zeros((2, 2))
+    prior_plays = {0: 2, 1: 0}
+    # plan_chapter builds entry with the repeat penalty for earlier plays
+    entry = planner.repeat_penalty * np.array([2.0, 0.0])
+    assert planner.plan_cost(np.array([0]), unary, transitions, entry, prior_plays) == 2.0
+
+
+def test_plan_cost_counts_repeats_within_the_chapter():
+    planner = SoundtrackPlanner(repeat_penalty=1.0)
+    unary = np.zeros((4, 2))
+    transitions = np.zeros((2, 2))
+    entry = np.zeros(2)
+    # Track 0 is played, left and entered again: one repeat of one earlier play
+    assert planner.plan_cost(np.array([0, 1, 1, 0]), unary, transitions, entry, {0: 0, 1: 0}) == 1.0
+    # A chapter continuing the previous chapter's track does not play it anew
+    assert planner.plan_cost(np.array([0, 1, 0, 0]), unary, transitions, entry, {0: 1, 1: 0}, continuing=0) == 1.0
+
+
+def test_plan_chapter_avoids_replaying_tracks():
+    planner = SoundtrackPlanner(switch_penalty=0.0, smoothness=0.0, repeat_penalty=1.0)
+    features = np.zeros((2, 4))
+    unary = np.array([[0.0, 0.5], [0.5, 0.0], [0.0, 0.5]])
+    path = planner.plan_chapter(unary, features, ["a", "b"])
+    # Returning to "a" would save 0.5 but cost a repeat
+    assert path.tolist() != [0, 1, 0]
+    assert len(run_starts(path)) <= 2
+    assert planner.last_track == ["a", "b"][path[-1]]
+
+
+def test_cues_from_plan_merges_runs_and_splits_on_gaps():
+    track = {'track_id': "a", 'title': "A", 'artist': "X", 'spotify_url': "u", 'preview_url': None}
+    cues = cues_from_plan([0, 1, 2, 3], [10, 20, 30, 40], [track, track, None, track])
+    assert [(cue.first_paragraph, cue.last_paragraph, cue.words) for cue in cues] == [(0, 1, 30), (3, 3, 40)]
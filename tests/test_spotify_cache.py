@@ -0,0 +1,77 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+import time
+
+import spotifyCache
+from spotifyCache import AudioFeatureCache
+
+
+class FeatureClient:
+    def __init__(self, missing=()):
+        self.batches = []
+        self.missing = set(missing)
+
+    def audio_features(self, tracks):
+        self.batches.append(list(tracks))
+        return [None if track in self.missing else {'id': track, 'energy': 0.5} for track in tracks]
+
+
+class Clock:
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+def test_lookups_are_batched_at_100_ids():
+    client = FeatureClient()
+    cache = AudioFeatureCache(path=None)
+    ids = [f"track{i}" for i in range(250)]
+    features = cache.get_features(client, ids + ids[:10])
+    assert [len(batch) for batch in client.batches] == [100, 100, 50]
+    assert len(features) == 250
+    cache.get_features(client, ids)
+    assert len(client.batches) == 3
+    assert cache.api_calls == 3
+
+
+def test_disk_entries_expire_after_ttl(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(spotifyCache.time, "time", clock)
+    path = str(tmp_path / "cache.sqlite")
+    client = FeatureClient()
+    AudioFeatureCache(path=path, ttl=60).get_features(client, ["a", "b"])
+
+    AudioFeatureCache(path=path, ttl=60).get_features(client, ["a", "b"])
+    assert len(client.batches) == 1
+
+    clock.now += 61
+    AudioFeatureCache(path=path, ttl=60).get_features(client, ["a", "b"])
+    assert client.batches[1:] == [["a", "b"]]
+
+
+def test_misses_are_not_persisted_and_expire_from_memory(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(spotifyCache.time, "time", clock)
+    path = str(tmp_path / "cache.sqlite")
+    client = FeatureClient(missing={"gone"})
+    cache = AudioFeatureCache(path=path, negative_ttl=10)
+    assert cache.get_features(client, ["gone"]) == {"gone": None}
+    cache.get_features(client, ["gone"])
+    assert len(client.batches) == 1
+
+    clock.now += 11
+    cache.get_features(client, ["gone"])
+    assert len(client.batches) == 2
+    AudioFeatureCache(path=path).get_features(client, ["gone"])
+    assert len(client.batches) == 3
+
+
+def test_memory_tier_is_bounded():
+    client = FeatureClient()
+    cache = AudioFeatureCache(path=None, max_entries=3)
+    cache.get_features(client, ["a", "b", "c", "d"])
+    assert list(cache._memory) == ["b", "c", "d"]
+    cache.get_features(client, ["a"])
+    assert len(client.batches) == 2
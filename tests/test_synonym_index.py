@@ -0,0 +1,47 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+from musicBackend import FakeMusicBackend
+from queryRanker import QueryRanker
+from SceneSongs import FILM_COMPOSERS, SceneMusicRecommender
+from spotifyCache import AudioFeatureCache
+
+SYNONYMS = {
+    'kissing': {'kissing', 'buss', 'osculation'},
+    'crying': {'crying', 'cry', 'weeping'},
+    'laughing': {'laughing', 'laugh', 'riant'},
+    'dancing': {'dancing', 'dance', 'terpsichore'},
+    'sleeping': {'sleeping', 'sleep', 'slumber'},
+    'action': {'action', 'act', 'activity'},
+    'drama': {'drama', 'play', 'dramatic_play'},
+    'horror': {'horror', 'repugnance'},
+}
+
+TOKENS = ["", "a", "act", "actually", "reacting", "cry", "outcry", "weeping", "slumbering", "laughter",
+          "dramatic_play", "display", "terpsichorean", "kissingdance", "horrors", "buss", "sleepwalk", "x" * 40]
+
+
+def legacy_matches(recommender, text):
+    """The original scan: every mapping key and its synonyms checked with a substring test."""
+    return [(category, key) for category, mappings in recommender.mood_mappings.items() for key in mappings
+            if key in text or any(syn in text for syn in recommender.get_synonyms(key))]
+
+
+def recommender():
+    scene = SceneMusicRecommender(None, None, FILM_COMPOSERS, sp=FakeMusicBackend.synthetic(FILM_COMPOSERS, seed=0),
+                                  feature_cache=AudioFeatureCache(path=None), query_ranker=QueryRanker(path=None))
+    scene.get_synonyms = lambda word: SYNONYMS.get(word, set())
+    return scene
+
+
+def test_index_matches_the_substring_scan():
+    scene = recommender()
+    for token in TOKENS:
+        assert list(scene.match_mappings(token)) == legacy_matches(scene, token), token
+
+
+def test_token_memo_is_bounded(monkeypatch):
+    monkeypatch.setattr("SceneSongs.TOKEN_MATCH_CACHE_SIZE", 4)
+    scene = recommender()
+    for token in TOKENS:
+        scene.match_mappings(token)
+    assert scene._token_matches.cache_info().currsize == 4
@@ -1,28 +1,55 @@
 # SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
 
-import spacy
-import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.cluster import KMeans
-from gensim import corpora
-from gensim.models import LdaModel
-from gensim.parsing.preprocessing import STOPWORDS
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 from collections import Counter
 import logging
-from transformers import pipeline
+from modelRegistry import get_sentiment_pipeline, get_spacy, lazy_import, record_timing
+
+# spaCy, gensim, scikit-learn and transformers are loaded on first use through modelRegistry,
+# so importing this module is cheap and the models are shared with the recommenders
+
 
-# Set up logging
-logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+def nlp(text):
+    # Shared spaCy pipeline; loaded on first call
+    return get_spacy()(text)
 
-# Load spaCy model
-nlp = spacy.load("en_core_web_sm")
+
+def _gensim():
+    # gensim's dictionary, LDA model and stopword list, imported on first use
+    return (lazy_import("gensim.corpora"), lazy_import("gensim.models").LdaModel,
+            lazy_import("gensim.parsing.preprocessing").STOPWORDS)
 
 class TextAnalyzer:
-    def __init__(self, max_segment_length=1000, num_themes=5):
+    def __init__(self, max_segment_length=1000, num_themes=5, batch_size=16, n_process=1,
+                 topic_mode="corpus", passes=15, sentiment_batch_size=16, sentiment_window=510):
         self.max_segment_length = max_segment_length
         self.num_themes = num_themes
-        self.vectorizer = TfidfVectorizer(max_df=0.5, min_df=2, stop_words='english')
-        self.sentiment_pipeline = pipeline("sentiment-analysis")
+        # "corpus" trains one LDA model over all segments of a text; "segment" trains one per segment
+        self.topic_mode = topic_mode
+        self.passes = passes
+        self.dictionary = None
+        # Fitted on the first text (or loaded) and reused for every later text until reset_topic_model
+        self.lda_model = None
+        # Used by process_texts to parse many documents with nlp.pipe
+        self.batch_size = batch_size
+        self.n_process = n_process
+        self._vectorizer = None
+        # Segments are scored in token windows (model limit minus [CLS]/[SEP]) batched across the text
+        self.sentiment_batch_size = sentiment_batch_size
+        self.sentiment_window = sentiment_window
+
+    @property
+    def vectorizer(self):
+        if self._vectorizer is None:
+            TfidfVectorizer = lazy_import("sklearn.feature_extraction.text").TfidfVectorizer
+            self._vectorizer = TfidfVectorizer(max_df=0.5, min_df=2, stop_words='english')
+        return self._vectorizer
+
+    @property
+    def sentiment_pipeline(self):
+        return get_sentiment_pipeline("sentiment-analysis")
 
     def process_text(self, text):
         # Process the entire text
@@ -32,13 +59,27 @@ class TextAnalyzer:
         segments = self.segment_text(doc)
         
         # Analyze each segment
-        analyzed_segments = [self.analyze_segment(segment) for segment in segments]
-        
-        return analyzed_segments
+        return self.analyze_segments(segments)
+
+    def analyze_segments(self, segments):
+        # In corpus mode the model is fitted once, on the first text, and later texts only infer against it
+        if self.topic_mode == "corpus" and segments and self.lda_model is None:
+            self.fit_topic_model(segments)
+        # Score every segment's windows together so the sentiment model runs full batches
+        sentiments = self.analyze_sentiments([segment.text for segment in segments])
+        return [self.analyze_segment(segment, sentiment) for segment, sentiment in zip(segments, sentiments)]
+
+    def process_texts(self, texts):
+        # Parse many texts in batches (and optionally several processes) instead of one nlp() call each
+        for doc in get_spacy().pipe(texts, batch_size=self.batch_size, n_process=self.n_process):
+            segments = self.segment_text(doc)
+            yield self.analyze_segments(segments)
 
     def segment_text(self, doc):
+        # Segments are Spans over the already-parsed doc, so nothing is parsed twice
         segments = []
-        current_segment = []
+        segment_start = None
+        segment_end = None
         current_length = 0
         current_characters = set()
         current_location = None
@@ -52,25 +93,27 @@ class TextAnalyzer:
             if (len(new_characters - current_characters) > 1 or 
                 (new_location and new_location != current_location) or 
                 current_length > self.max_segment_length):
-                if current_segment:
-                    segments.append(nlp(" ".join(current_segment)))
-                current_segment = []
+                if segment_start is not None:
+                    segments.append(doc[segment_start:segment_end])
+                segment_start = None
                 current_length = 0
                 current_characters = set()
                 current_location = None
 
-            current_segment.append(sent.text)
+            if segment_start is None:
+                segment_start = sent.start
+            segment_end = sent.end
             current_length += len(sent)
             current_characters.update(new_characters)
             if new_location:
                 current_location = new_location
 
-        if current_segment:
-            segments.append(nlp(" ".join(current_segment)))
+        if segment_start is not None:
+            segments.append(doc[segment_start:segment_end])
 
         return segments
 
-    def analyze_segment(self, doc):
+    def analyze_segment(self, doc, sentiment=None):
         # Basic analysis
         tokens = [token.text for token in doc]
         lemmas = [token.lemma_ for token in doc]
@@ -85,14 +128,20 @@ class TextAnalyzer:
         dep_patterns = Counter(token.dep_ for token in doc)
         
         # Topic Modeling
-        tokens_for_lda = [token.lemma_ for token in doc if token.lemma_.lower() not in STOPWORDS and token.is_alpha]
-        dictionary = corpora.Dictionary([tokens_for_lda])
-        corpus = [dictionary.doc2bow(tokens_for_lda)]
-        lda_model = LdaModel(corpus, num_topics=self.num_themes, id2word=dictionary, passes=15)
-        topics = lda_model.print_topics()
+        topic_distribution = None
+        if self.topic_mode == "corpus" and self.lda_model is not None:
+            topics, topic_distribution = self.infer_topics(doc)
+        else:
+            corpora, LdaModel, _ = _gensim()
+            tokens_for_lda = self.lda_tokens(doc)
+            dictionary = corpora.Dictionary([tokens_for_lda])
+            corpus = [dictionary.doc2bow(tokens_for_lda)]
+            lda_model = LdaModel(corpus, num_topics=self.num_themes, id2word=dictionary, passes=self.passes)
+            topics = lda_model.print_topics()
         
         # Sentiment analysis using Hugging Face Transformers
-        sentiment = self.analyze_sentiment(doc.text)
+        if sentiment is None:
+            sentiment = self.analyze_sentiment(doc.text)
         
         return {
             'text': doc.text,
@@ -102,22 +151,107 @@ class TextAnalyzer:
             'pos_patterns': dict(pos_patterns),
             'dep_patterns': dict(dep_patterns),
             'topics': topics,
+            'topic_distribution': topic_distribution,
             'sentiment': sentiment
         }
 
+    def lda_tokens(self, doc):
+        _, _, STOPWORDS = _gensim()
+        return [token.lemma_ for token in doc if token.lemma_.lower() not in STOPWORDS and token.is_alpha]
+
+    def fit_topic_model(self, segments):
+        # Train a single LDA model over every segment instead of one model per segment
+        corpora, LdaModel, _ = _gensim()
+        texts = [self.lda_tokens(segment) for segment in segments]
+        self.dictionary = corpora.Dictionary(texts)
+        corpus = [self.dictionary.doc2bow(tokens) for tokens in texts]
+        self.lda_model = LdaModel(corpus, num_topics=self.num_themes, id2word=self.dictionary, passes=self.passes)
+        return self.lda_model
+
+    def infer_topics(self, doc):
+        # Cheap inference against the shared model; topics are sorted by weight for this segment
+        bow = self.dictionary.doc2bow(self.lda_tokens(doc))
+        distribution = sorted(self.lda_model.get_document_topics(bow, minimum_probability=0.0),
+                              key=lambda topic: topic[1], reverse=True)
+        topics = [(topic_id, self.lda_model.print_topic(topic_id)) for topic_id, _ in distribution]
+        return topics, [(topic_id, float(weight)) for topic_id, weight in distribution]
+
+    def reset_topic_model(self):
+        # Drop the fitted or loaded model so the next text is fitted afresh
+        self.lda_model = None
+        self.dictionary = None
+
+    def save_topic_model(self, path):
+        if self.lda_model is None:
+            raise ValueError("No topic model to save: analyze a text in corpus mode or load a model first")
+        self.lda_model.save(path)
+        self.dictionary.save(f"{path}.dictionary")
+
+    def load_topic_model(self, path):
+        # A loaded model is reused for later texts instead of being retrained
+        corpora, LdaModel, _ = _gensim()
+        self.lda_model = LdaModel.load(path)
+        self.dictionary = corpora.Dictionary.load(f"{path}.dictionary")
+        self.topic_mode = "corpus"
+
     def analyze_sentiment(self, text):
-        result = self.sentiment_pipeline(text[:512])[0]  # Limit to 512 tokens due to model constraints
-        return {
-            'label': result['label'],
-            'score': result['score']
-        }
+        return self.analyze_sentiments([text])[0]
+
+    def analyze_sentiments(self, texts):
+        if not texts:
+            return []
+
+        # Split each text into token-bounded windows so the whole text is scored, not just a prefix
+        tokenizer = self.sentiment_pipeline.tokenizer
+        windows = []
+        for index, text in enumerate(texts):
+            token_ids = tokenizer(text, add_special_tokens=False, truncation=False, verbose=False)['input_ids']
+            for start in range(0, max(len(token_ids), 1), self.sentiment_window):
+                window_ids = token_ids[start:start + self.sentiment_window]
+                windows.append((index, tokenizer.decode(window_ids), max(len(window_ids), 1)))
+
+        # Sort windows by length so each batch pads to a similar size
+        order = sorted(range(len(windows)), key=lambda w: windows[w][2])
+        results = self.sentiment_pipeline(
+            [windows[w][1] for w in order],
+            batch_size=self.sentiment_batch_size,
+            truncation=True
+        )
+
+        # Combine window scores per text, weighted by window length
+        positive = [0.0] * len(texts)
+        weight = [0] * len(texts)
+        window_counts = [0] * len(texts)
+        for w, result in zip(order, results):
+            index, _, length = windows[w]
+            # The default model is binary (POSITIVE/NEGATIVE); fold both into P(positive)
+            p_positive = result['score'] if result['label'] == 'POSITIVE' else 1 - result['score']
+            positive[index] += p_positive * length
+            weight[index] += length
+            window_counts[index] += 1
+
+        sentiments = []
+        for index in range(len(texts)):
+            p_positive = positive[index] / weight[index]
+            label = 'POSITIVE' if p_positive >= 0.5 else 'NEGATIVE'
+            sentiments.append({
+                'label': label,
+                'score': p_positive if label == 'POSITIVE' else 1 - p_positive,
+                'windows': window_counts[index]
+            })
+        return sentiments
 
 def read_text(file_path):
     with open(file_path, 'r', encoding='utf-8') as file:
         return file.read()
 
+record_timing(f"import:{__name__}", time.perf_counter() - _IMPORT_STARTED)
+
 # Example usage
 if __name__ == "__main__":
+    # Set up logging
+    logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+
     file_path = "./Data/text.txt"
     text = read_text(file_path)
     
@@ -0,0 +1,212 @@
+# SPDX-License-Identifier: PolyForm-Noncommercial-1.0.0
+
+import json
+import os
+import re
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+from spotifyCache import AudioFeatureCache
+
+# Column order of the catalog's feature matrix
+FEATURE_NAMES = ('valence', 'energy', 'instrumentalness', 'acousticness')
+
+# Rough audio-feature targets for common mood words, in FEATURE_NAMES order
+MOOD_TARGETS = {
+    'dark': (0.15, 0.45, 0.7, 0.4),
+    'somber': (0.15, 0.25, 0.7, 0.6),
+    'sad': (0.1, 0.25, 0.6, 0.7),
+    'melancholic': (0.15, 0.3, 0.7, 0.7),
+    'sorrowful': (0.1, 0.25, 0.7, 0.7),
+    'bittersweet': (0.35, 0.35, 0.6, 0.7),
+    'emotional': (0.3, 0.4, 0.6, 0.6),
+    'deep': (0.25, 0.35, 0.7, 0.5),
+    'lonely': (0.15, 0.25, 0.7, 0.7),
+    'mysterious': (0.2, 0.4, 0.8, 0.4),
+    'ethereal': (0.3, 0.3, 0.85, 0.5),
+    'atmospheric': (0.25, 0.35, 0.85, 0.4),
+    'calm': (0.45, 0.2, 0.8, 0.8),
+    'peaceful': (0.5, 0.2, 0.8, 0.8),
+    'serene': (0.5, 0.2, 0.8, 0.8),
+    'gentle': (0.45, 0.2, 0.7, 0.85),
+    'quiet': (0.4, 0.15, 0.8, 0.8),
+    'romantic': (0.55, 0.35, 0.5, 0.7),
+    'tense': (0.2, 0.65, 0.75, 0.2),
+    'suspense': (0.2, 0.6, 0.8, 0.2),
+    'intense': (0.25, 0.85, 0.7, 0.1),
+    'dramatic': (0.3, 0.75, 0.7, 0.2),
+    'powerful': (0.4, 0.85, 0.6, 0.15),
+    'epic': (0.4, 0.9, 0.75, 0.1),
+    'aggressive': (0.25, 0.95, 0.5, 0.05),
+    'action': (0.4, 0.9, 0.6, 0.1),
+    'triumphant': (0.7, 0.85, 0.6, 0.15),
+    'uplifting': (0.75, 0.7, 0.5, 0.3),
+    'hopeful': (0.65, 0.5, 0.6, 0.5),
+    'bright': (0.8, 0.65, 0.4, 0.4),
+    'positive': (0.8, 0.65, 0.4, 0.4),
+    'happy': (0.85, 0.7, 0.3, 0.4),
+    'joyful': (0.85, 0.75, 0.3, 0.4),
+    'playful': (0.8, 0.6, 0.4, 0.5),
+    'energetic': (0.65, 0.9, 0.4, 0.1),
+}
+NEUTRAL_TARGET = (0.5, 0.5, 0.5, 0.5)
+
+CatalogMatch = namedtuple('CatalogMatch', ['track_id', 'title', 'artist', 'spotify_url', 'preview_url', 'features', 'distance'])
+
+
+def tokenize_tags(text):
+    """Lowercase word tokens used as free-text tags."""
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+def target_for_words(words):
+    """Average the MOOD_TARGETS of the given words into one target feature vector."""
+    targets = [MOOD_TARGETS[word.lower()] for word in words if word.lower() in MOOD_TARGETS]
+    if not targets:
+        return np.array(NEUTRAL_TARGET, dtype=np.float32)
+    return np.mean(np.array(targets, dtype=np.float32), axis=0)
+
+
+def _paginate(sp, page):
+    """Yield every item of a paged Spotify response."""
+    while page:
+        yield from page['items']
+        page = sp.next(page) if page.get('next') else None
+
+
+class TrackCatalog:
+    """Local store of tracks by a fixed artist list, searchable by audio-feature similarity."""
+
+    def __init__(self, track_ids, titles, artists, preview_urls, tags, features):
+        self.track_ids = track_ids
+        self.titles = titles
+        self.artists = artists
+        self.preview_urls = preview_urls
+        self.tags = tags
+        self.features = features
+        # Inverted index from tag to the rows that carry it, for text-tag bonuses
+        self._tag_postings = {}
+        for row, row_tags in enumerate(tags):
+            for tag in set(row_tags):
+                self._tag_postings.setdefault(tag, []).append(row)
+        self._tag_postings = {tag: np.array(rows, dtype=np.int64) for tag, rows in self._tag_postings.items()}
+
+    def __len__(self):
+        return len(self.track_ids)
+
+    @classmethod
+    def build(cls, sp, artists, feature_cache=None):
+        """Fetch every track by the given artists, with audio features, from the Spotify API."""
+        feature_cache = feature_cache if feature_cache is not None else AudioFeatureCache()
+        wanted = {artist.lower() for artist in artists}
+        tracks = {}
+
+        for artist_name in artists:
+            results = sp.search(q=f'artist:"{artist_name}"', type='artist', limit=10)
+            candidates = results['artists']['items']
+            artist = next((a for a in candidates if a['name'].lower() == artist_name.lower()), None)
+            if artist is None:
+                print(f"Artist not found: {artist_name}")
+                continue
+
+            albums = sp.artist_albums(artist['id'], include_groups='album,single,compilation', limit=50)
+            for album in _paginate(sp, albums):
+                for track in _paginate(sp, sp.album_tracks(album['id'], limit=50)):
+                    if track['id'] in tracks:
+                        continue
+                    if not any(a['name'].lower() in wanted for a in track['artists']):
+                        continue
+                    tracks[track['id']] = {
+                        'title': track['name'],
+                        'artist': track['artists'][0]['name'],
+                        'preview_url': track.get('preview_url'),
+                        'tags': tokenize_tags(f"{track['name']} {album['name']}"),
+                    }
+            print(f"{artist_name}: {len(tracks)} tracks so far")
+
+        all_features = feature_cache.get_features(sp, list(tracks))
+        rows = [(track_id, info) for track_id, info in tracks.items() if all_features.get(track_id)]
+        features = np.array(
+            [[all_features[track_id][name] for name in FEATURE_NAMES] for track_id, _ in rows],
+            dtype=np.float32
+        ).reshape(-1, len(FEATURE_NAMES))
+
+        return cls(
+            [track_id for track_id, _ in rows],
+            [info['title'] for _, info in rows],
+            [info['artist'] for _, info in rows],
+            [info['preview_url'] for _, info in rows],
+            [info['tags'] for _, info in rows],
+            features
+        )
+
+    def save(self, directory):
+        """Write the catalog as a feature matrix (.npy) plus JSON metadata."""
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "features.npy"), np.ascontiguousarray(self.features, dtype=np.float32))
+        with open(os.path.join(directory, "tracks.json"), 'w', encoding='utf-8') as f:
+            json.dump({
+                'feature_names': FEATURE_NAMES,
+                'track_ids': self.track_ids,
+                'titles': self.titles,
+                'artists': self.artists,
+                'preview_urls': self.preview_urls,
+                'tags': self.tags,
+            }, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Load a saved catalog; the feature matrix is memory-mapped unless mmap=False."""
+        with open(os.path.join(directory, "tracks.json"), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if tuple(meta['feature_names']) != FEATURE_NAMES:
+            raise ValueError(f"Catalog features {meta['feature_names']} do not match {FEATURE_NAMES}")
+        features = np.load(os.path.join(directory, "features.npy"), mmap_mode='r' if mmap else None)
+        return cls(meta['track_ids'], meta['titles'], meta['artists'], meta['preview_urls'], meta['tags'], features)
+
+    def nearest(self, target, tags=(), k=10, weights=None, tag_weight=0.05):
+        """Return the k tracks closest to a target feature vector, with a bonus per matching tag."""
+        if not len(self):
+            return []
+        target = np.asarray(target, dtype=np.float32)
+        weights = np.ones(len(FEATURE_NAMES), dtype=np.float32) if weights is None else np.asarray(weights, dtype=np.float32)
+
+        distances = ((self.features - target) ** 2) @ weights
+        if tags:
+            bonus = np.zeros(len(self), dtype=np.float32)
+            for tag in {tag.lower() for tag in tags}:
+                rows = self._tag_postings.get(tag)
+                if rows is not None:
+                    bonus[rows] += 1
+            distances = distances - tag_weight * bonus
+
+        k = min(k, len(self))
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        return [
+            CatalogMatch(
+                track_id=self.track_ids[row],
+                title=self.titles[row],
+                artist=self.artists[row],
+                spotify_url=f"https://open.spotify.com/track/{self.track_ids[row]}",
+                preview_url=self.preview_urls[row],
+                features=dict(zip(FEATURE_NAMES, (float(x) for x in self.features[row]))),
+                distance=float(distances[row])
+            )
+            for row in top
+        ]
+
+
+if __name__ == "__main__":
+    # One-time build of the film-composer catalog:
+    #   SPOTIFY_CLIENT_ID=... SPOTIFY_CLIENT_SECRET=... python trackCatalog.py catalog/
+    from queryExecutor import QueryExecutor, build_spotify_client
+    from SceneSongs import FILM_COMPOSERS
+
+    output_directory = sys.argv[1] if len(sys.argv) > 1 else "catalog"
+    sp = QueryExecutor().wrap(build_spotify_client(os.environ.get("SPOTIFY_CLIENT_ID"), os.environ.get("SPOTIFY_CLIENT_SECRET")))
+    catalog = TrackCatalog.build(sp, FILM_COMPOSERS)
+    catalog.save(output_directory)
+    print(f"Saved {len(catalog)} tracks to {output_directory}")